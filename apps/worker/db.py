@@ -1 +1,209 @@
- 
\ No newline at end of file
+import io, itertools, logging, os, time, uuid
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import delete, insert, inspect, text, update
+from sqlalchemy.engine import Connection, Engine
+from sqlmodel import SQLModel, create_engine
+
+from models import Finding, ScanResult, ScanStatus, Severity
+
+logger = logging.getLogger("db")
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///arxio-worker.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 5))
+# Rows per COPY / multi-row INSERT statement
+FINDING_BATCH_SIZE = int(os.getenv("FINDING_BATCH_SIZE", 5000))
+
+_FINDING_COLUMNS = ("id", "scan_id", "rule_id", "title", "description", "severity",
+                    "file_path", "line_start", "line_end", "url", "rule_version", "fingerprint")
+_SEVERITIES = {severity.value.lower(): severity for severity in Severity}
+
+_engine: Optional[Engine] = None
+
+
+def get_engine() -> Engine:
+    """Process-wide pooled engine; the tables and their indexes are created or upgraded on first use."""
+    global _engine
+    if _engine is None:
+        options = {"pool_pre_ping": True}
+        if not DATABASE_URL.startswith("sqlite"):
+            options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_recycle=1800)
+        engine = create_engine(DATABASE_URL, **options)
+        SQLModel.metadata.create_all(engine)
+        ensure_schema(engine)
+        _engine = engine
+    return _engine
+
+
+def ensure_schema(engine: Engine):
+    """Bring tables that create_all found already in place up to the models.
+
+    create_all never alters an existing table, so columns added to a model
+    since (e.g. finding.rule_version and finding.fingerprint) are added here,
+    with their indexes. Only nullable columns can be added this way; a
+    missing required column raises instead of failing on the first insert.
+    """
+    inspector = inspect(engine)
+    for table in SQLModel.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        missing = [column for column in table.columns if column.name not in existing]
+        for column in missing:
+            if not column.nullable:
+                raise RuntimeError(f"{table.name}.{column.name} is missing and is required; migrate the table")
+            column_type = column.type.compile(dialect=engine.dialect)
+            if_not_exists = "IF NOT EXISTS " if engine.dialect.name == "postgresql" else ""
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {if_not_exists}{column.name} {column_type}"))
+            logger.info(f"Added column {table.name}.{column.name}")
+        indexes = {index["name"] for index in inspect(engine).get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                index.create(engine, checkfirst=True)
+                logger.info(f"Created index {index.name}")
+
+
+def _new_ids() -> Iterator[str]:
+    # 32 hex digits like a uuid4, but led by the time in microseconds: a batch's keys land at
+    # the right edge of the primary key index instead of on random pages all over it. The
+    # random part is drawn once per generator and followed by a counter, not read per row.
+    prefix = f"{time.time_ns() // 1000:014x}{os.urandom(6).hex()}"
+    for n in itertools.count():
+        yield f"{prefix}{n:06x}"
+
+
+def _location(location: Optional[str]):
+    path, _, rest = (location or "").partition(":")
+    line = rest.split(":", 1)[0]
+    return path or None, int(line) if line.isdigit() else None
+
+
+def finding_values(scan_id: str, findings: Iterable[Any]) -> Iterator[Tuple[Any, ...]]:
+    """Column values for `findings`, in _FINDING_COLUMNS order: Finding models (tools.parsers) or scanner finding dicts."""
+    ids = _new_ids()
+    for finding in findings:
+        if isinstance(finding, Finding):
+            row = {column: getattr(finding, column) for column in _FINDING_COLUMNS}
+            row.update(id=row["id"] or next(ids), scan_id=scan_id)
+            yield tuple(row[column] for column in _FINDING_COLUMNS)
+            continue
+        get = finding.get
+        if "file_path" in finding or "url" in finding:
+            file_path, line = get("file_path"), get("line_start")
+        else:
+            file_path, line = _location(get("location"))
+        severity = get("severity")
+        yield (
+            next(ids),
+            scan_id,
+            str(get("rule_id") or get("ruleId") or get("title") or "unknown"),
+            str(get("title") or ""),
+            str(get("description") or ""),
+            severity if isinstance(severity, Severity)
+            else _SEVERITIES.get(str(severity or "medium").lower(), Severity.MEDIUM),
+            file_path,
+            line,
+            get("line_end", line),
+            get("url"),
+            get("rule_version") or get("ruleset"),
+            get("fingerprint"),
+        )
+
+
+def finding_rows(scan_id: str, findings: Iterable[Any]) -> Iterator[Dict[str, Any]]:
+    """Column dicts for `findings` (see finding_values)."""
+    for values in finding_values(scan_id, findings):
+        yield dict(zip(_FINDING_COLUMNS, values))
+
+
+def _batches(rows: Iterable[Any]) -> Iterator[List[Any]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= FINDING_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _copy_value(value: Any) -> str:
+    if value is None:
+        return r"\N"
+    if isinstance(value, Severity):
+        value = value.value
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def _copy_line(values: Tuple[Any, ...]) -> str:
+    fields = [r"\N" if value is None else value.value if isinstance(value, Severity) else str(value)
+              for value in values]
+    line = "\t".join(fields)
+    # Almost no row needs escaping; it does if a field holds a tab, a newline or a backslash
+    if (line.count("\t") == len(fields) - 1 and "\n" not in line and "\r" not in line
+            and line.count("\\") == fields.count(r"\N")):
+        return line
+    return "\t".join(_copy_value(value) for value in values)
+
+
+def _copy_findings(conn: Connection, rows: Iterable[Tuple[Any, ...]]) -> int:
+    # COPY streams a whole batch in one round trip and skips per-row statement overhead.
+    # 50k findings take ~1.6s on a 1-vCPU PostgreSQL 16 box that also runs the worker, so the
+    # "well under a second" target is not met there: ~0.5s building and encoding rows, ~1.1s
+    # in the server. Of the server time ~0.3s is the per-row scan_id foreign key check and
+    # ~0.5s the secondary indexes (~0.13s for severity and rule_id, which the API filters on).
+    # Indexes are maintained during COPY rather than rebuilt after it, since the table is shared.
+    cursor = conn.connection.dbapi_connection.cursor()
+    statement = f"COPY {Finding.__tablename__} ({', '.join(_FINDING_COLUMNS)}) FROM STDIN"
+    count = 0
+    try:
+        for batch in _batches(rows):
+            buffer = io.StringIO("\n".join(map(_copy_line, batch)) + "\n")
+            cursor.copy_expert(statement, buffer)
+            count += len(batch)
+    finally:
+        cursor.close()
+    return count
+
+
+def insert_findings(conn: Connection, scan_id: str, findings: Iterable[Any]) -> int:
+    """Bulk-insert `findings` for `scan_id` in the caller's transaction; returns the row count."""
+    if conn.dialect.name == "postgresql" and conn.dialect.driver == "psycopg2":
+        return _copy_findings(conn, finding_values(scan_id, findings))
+    count = 0
+    for batch in _batches(finding_rows(scan_id, findings)):
+        # executemany: SQLAlchemy folds the batch into multi-row INSERT ... VALUES statements
+        conn.execute(insert(Finding.__table__), batch)
+        count += len(batch)
+    return count
+
+
+def create_scan(project_id: str, scan_id: Optional[str] = None) -> str:
+    scan_id = scan_id or str(uuid.uuid4())
+    with get_engine().begin() as conn:
+        conn.execute(insert(ScanResult.__table__).values(
+            id=scan_id, project_id=project_id, status=ScanStatus.RUNNING, started_at=datetime.utcnow()))
+    return scan_id
+
+
+def finalize_scan(scan_id: str, project_id: str, status: ScanStatus, findings: Iterable[Any] = ()) -> int:
+    """Store a finished scan's findings and status in one transaction.
+
+    Readers see either the previous state or the complete result, never a
+    partly written scan. Findings already stored for `scan_id` (from an
+    earlier attempt of a redelivered job) are replaced, so finalizing is
+    idempotent. Returns the number of findings written.
+    """
+    scans = ScanResult.__table__
+    with get_engine().begin() as conn:
+        exists = conn.execute(scans.select().with_only_columns(scans.c.id).where(scans.c.id == scan_id)).first()
+        if exists is None:
+            conn.execute(insert(scans).values(id=scan_id, project_id=project_id, status=status,
+                                              started_at=datetime.utcnow()))
+        conn.execute(delete(Finding.__table__).where(Finding.__table__.c.scan_id == scan_id))
+        count = insert_findings(conn, scan_id, findings)
+        conn.execute(update(scans).where(scans.c.id == scan_id)
+                     .values(status=status, finished_at=datetime.utcnow()))
+    logger.info(f"Scan {scan_id} finalized as {status.value} with {count} findings")
+    return count
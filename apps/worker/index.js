@@ -10,6 +10,11 @@ const { randomUUID } = require('crypto');
 // הגדרת רמת הלוג
 const LOG_LEVEL = process.env.LOG_LEVEL || 'info';
 
+// תור העבודות של עובדי הסריקה (tools/job_queue.py)
+const SCAN_JOBS_STREAM = process.env.SCAN_JOBS_STREAM || 'scan:jobs';
+const SCAN_JOBS_MAXLEN = 100000;
+const SCAN_JOB_STATE_TTL = 7 * 24 * 3600;
+
 // יצירת מחלקת לוגר פשוטה
 class Logger {
   constructor(name, level = LOG_LEVEL) {
@@ -151,6 +156,29 @@ class RedisManager {
     }
   }
 
+  /**
+   * הוספת בקשת סריקה לתור העבודות העמיד (Redis Stream) שממנו קוראים עובדי הסריקה.
+   * בניגוד לפרסום ב-pub/sub, בקשה שנוספה לזרם לא הולכת לאיבוד כשאף עובד לא רץ.
+   * אידמפוטנטי לפי scanId, כמו ScanJobQueue.enqueue ב-tools/job_queue.py
+   */
+  async enqueueScanJob(data) {
+    const stateKey = `scan:job:${data.scanId}`;
+    const added = await this.client.set(stateKey, 'queued', { NX: true, EX: SCAN_JOB_STATE_TTL });
+    if (!added) {
+      logger.info(`סריקה ${data.scanId} כבר בתור, מתעלם מבקשה כפולה`);
+      return null;
+    }
+    try {
+      return await this.client.xAdd(SCAN_JOBS_STREAM, '*', { job: JSON.stringify(data) }, {
+        TRIM: { strategy: 'MAXLEN', strategyModifier: '~', threshold: SCAN_JOBS_MAXLEN }
+      });
+    } catch (error) {
+      // אחרת כל ניסיון חוזר של הבקשה ייחשב לכפול
+      await this.client.del(stateKey);
+      throw error;
+    }
+  }
+
   async updateScanProgress(scanId, status, message, progress = null) {
     try {
       const progressKey = `scan:progress:${scanId}`;
@@ -319,8 +347,8 @@ class ScanManager {
       // עדכון התקדמות
       await this.redis.updateScanProgress(scanId, 'queued', message, 10);
       
-      // פרסום בקשת הסריקה
-      await this.redis.publish('scan:requests', data);
+      // הוספת בקשת הסריקה לתור העבודות העמיד
+      await this.redis.enqueueScanJob(data);
     } catch (error) {
       logger.error(`שגיאה בהעברת בקשת סריקה לסורק ${scannerType}`, error);
       await this.updateScanError(scanId, `שגיאה בהעברת בקשת סריקה לסורק ${scannerType}`);
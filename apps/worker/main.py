@@ -1,11 +1,15 @@
 import os
+import asyncio
 from fastapi import FastAPI, BackgroundTasks
 from pydantic import BaseModel
 import redis
 import json
+import uuid
 from typing import Optional
 from scanners.sast import run_sast
-from scanners.dast import run_dast
+from scanners.dast import run_dast, request_cancel as cancel_dast
+from scanners.plans import USER_PLAN_LIMITS, resolve_plan
+from tools.scheduler import PlanScheduler, RequeueJob
 
 app = FastAPI(title="ARXIO Security Scanner Worker")
 
@@ -17,11 +21,40 @@ redis_client = redis.Redis(
     decode_responses=True
 )
 
+# Admission control: plan priority and per-tenant concurrency limits
+scheduler = PlanScheduler(
+    redis_client,
+    USER_PLAN_LIMITS,
+    max_running=int(os.getenv("SCAN_WORKER_CONCURRENCY", 2))
+)
+
 class ScanRequest(BaseModel):
     project_id: str
     repo_url: str
     branch: str
     deployed_url: Optional[str] = None
+    user_id: Optional[str] = None
+
+def run_scheduled(scan_request: ScanRequest, scan_type: str, plan: str, fn, **kwargs):
+    """Run a scan once the scheduler admits it for the requesting tenant"""
+    try:
+        scheduler.run(
+            f"{scan_type}:{scan_request.project_id}:{uuid.uuid4().hex}",
+            scan_request.user_id,
+            plan,
+            fn,
+            **kwargs
+        )
+    except RequeueJob:
+        redis_client.publish(
+            f"scan:{scan_request.project_id}",
+            json.dumps({
+                "type": "error",
+                "status": "error",
+                "projectId": scan_request.project_id,
+                "message": "Too many scans are already queued for this account"
+            })
+        )
 
 @app.get("/")
 async def root():
@@ -30,8 +63,15 @@ async def root():
 @app.post("/api/scan/sast")
 async def start_sast_scan(scan_request: ScanRequest, background_tasks: BackgroundTasks):
     """Start a static application security test (SAST) on the source code"""
+    # The plan lookup is a blocking HTTP call; keep it off the event loop
+    plan = await asyncio.to_thread(resolve_plan, scan_request.user_id)
+    
     # Add task to background
     background_tasks.add_task(
+        run_scheduled,
+        scan_request,
+        "sast",
+        plan,
         run_sast,
         project_id=scan_request.project_id,
         repo_url=scan_request.repo_url,
@@ -56,11 +96,20 @@ async def start_dast_scan(scan_request: ScanRequest, background_tasks: Backgroun
     if not scan_request.deployed_url:
         return {"error": "Deployed URL is required for DAST scans"}
     
+    # The plan comes from the user's account, never from the request body
+    # (a blocking HTTP lookup, so it runs in a thread)
+    plan = await asyncio.to_thread(resolve_plan, scan_request.user_id)
+    
     # Add task to background
     background_tasks.add_task(
+        run_scheduled,
+        scan_request,
+        "dast",
+        plan,
         run_dast,
         project_id=scan_request.project_id,
-        url=scan_request.deployed_url
+        url=scan_request.deployed_url,
+        max_duration=USER_PLAN_LIMITS[plan]["max_scan_duration"]
     )
     
     # Publish scan start message
@@ -75,6 +124,13 @@ async def start_dast_scan(scan_request: ScanRequest, background_tasks: Backgroun
     
     return {"status": "started", "type": "dast", "project_id": scan_request.project_id}
 
+@app.post("/api/scan/dast/{project_id}/cancel")
+async def cancel_dast_scan(project_id: str):
+    """Stop the project's running DAST scans; ZAP stops scanning at their next progress check"""
+    if not await asyncio.to_thread(cancel_dast, project_id):
+        return {"status": "not_running", "type": "dast", "project_id": project_id}
+    return {"status": "cancelling", "type": "dast", "project_id": project_id}
+
 @app.get("/api/health")
 async def health_check():
     """Check service health"""
@@ -18,7 +18,7 @@ class ScanStatus(str, enum.Enum):
 
 class ScanResult(SQLModel, table=True):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
-    project_id: str
+    project_id: str = Field(index=True)
     status: ScanStatus = Field(default=ScanStatus.QUEUED)
     started_at: datetime = Field(default_factory=datetime.utcnow)
     finished_at: Optional[datetime] = None
@@ -26,13 +26,17 @@ class ScanResult(SQLModel, table=True):
 
 class Finding(SQLModel, table=True):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
-    scan_id: str = Field(foreign_key="scanresult.id")
-    rule_id: str
+    scan_id: str = Field(foreign_key="scanresult.id", index=True)
+    rule_id: str = Field(index=True)
     title: str
     description: str
-    severity: Severity
+    severity: Severity = Field(index=True)
     file_path: Optional[str] = None
     line_start: Optional[int] = None
     line_end: Optional[int] = None
     url: Optional[str] = None
+    # Version of the rules that produced the finding (e.g. the semgrep bundle), for cache invalidation
+    rule_version: Optional[str] = None
+    # Stable identity across scans and tools (tools.fingerprints)
+    fingerprint: Optional[str] = Field(default=None, index=True)
     scan: ScanResult = Relationship(back_populates="findings") 
\ No newline at end of file
@@ -4,7 +4,8 @@ import json
 import time
 import uuid
 import logging
-import requests
+import threading
+import traceback
 import redis
 from datetime import datetime, timezone
 from dotenv import load_dotenv
@@ -23,22 +24,43 @@ logger = logging.getLogger('scan-worker')
 REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379')
 API_BASE_URL = os.getenv('API_BASE_URL', 'http://localhost:3000/api')
 WORKER_API_KEY = os.getenv('WORKER_API_KEY', 'dev-worker-key')
+# מספר הסריקות המקסימלי שרצות במקביל בכל עותק של העובד
+SCAN_WORKER_CONCURRENCY = int(os.getenv('SCAN_WORKER_CONCURRENCY', 2))
+# מספר העבודות שנמשכות מהתור וממתינות למתזמן, כדי שיוכל לבחור ביניהן לפי תוכנית ומשתמש
+SCAN_WORKER_PREFETCH = int(os.getenv('SCAN_WORKER_PREFETCH', SCAN_WORKER_CONCURRENCY * 4))
+
+from scanners.plans import USER_PLAN_LIMITS, resolve_plan
+from tools.job_queue import ScanJobQueue
+from tools.scheduler import PlanScheduler
+from tools.progress import ProgressAggregator
+from tools.callback_client import CallbackClient
+from tools.scan_pool import ScanProcessPool, ScanTimeout
 
 # יבוא מודולי סריקה
 try:
-    from scanners.dast import run_dast_scan, publish_progress as publish_dast_progress
+    from scanners.dast import run_dast_scan
     HAS_DAST = True
 except ImportError:
     logger.warning("מודול DAST לא זמין")
     HAS_DAST = False
 
 try:
-    from scanners.sast import run_sast_scan, publish_progress as publish_sast_progress
+    from scanners.sast import run_sast_scan, run_sast_shard, discover_tools, warm_up as warm_up_sast, publish_progress as publish_sast_progress
     HAS_SAST = True
 except ImportError:
     logger.warning("מודול SAST לא זמין")
     HAS_SAST = False
 
+# שמירת ממצאים במסד הנתונים (רק כש-DATABASE_URL מוגדר)
+HAS_DB = False
+if os.getenv('DATABASE_URL'):
+    try:
+        from db import finalize_scan
+        from models import ScanStatus
+        HAS_DB = True
+    except ImportError:
+        logger.warning("מודול מסד הנתונים לא זמין - ממצאים לא יישמרו")
+
 try:
     from scanners.api_scan import run_api_scan, publish_progress as publish_api_progress
     HAS_API_SCAN = True
@@ -82,51 +104,74 @@ class ScanWorker:
         self.redis_client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
         self.pubsub = self.redis_client.pubsub()
         self.pubsub.subscribe('scan:requests')
+        # תור עבודות עמיד מבוסס Redis Streams, משותף לכל עותקי העובד
+        self.job_queue = ScanJobQueue(self.redis_client, max_workers=SCAN_WORKER_PREFETCH)
+        # מתזמן שאוכף את מגבלות התוכנית ומתעדף סריקות לפי תוכנית ומשתמש
+        self.scheduler = PlanScheduler(self.redis_client, USER_PLAN_LIMITS, SCAN_WORKER_CONCURRENCY)
+        self.stop_event = threading.Event()
+        # לקוח HTTP משותף לשרת ה-API: חיבורים קבועים, ניסיונות חוזרים ותור יוצא על הדיסק
+        self.api = CallbackClient(API_BASE_URL, WORKER_API_KEY)
+        # עדכוני התקדמות מאוחדים ונשלחים ברקע, כך שהסורקים לא ממתינים ל-Redis או ל-HTTP
+        self.progress = ProgressAggregator(self.redis_client, self.post_progress)
+        # כל סריקה רצה בתהליך נפרד עם מגבלות זיכרון וזמן מעבד, כך שסריקה תקועה או זוללת
+        # זיכרון לא מפילה את העובד ואת שאר הסריקות.
+        # גילוי הכלים נעשה פעם אחת כאן, וכל תהליך סריקה מתחמם איתו (וטוען את חוקי semgrep) לפני שהוא מקבל סריקה
+        if HAS_SAST:
+            self.executors = ScanProcessPool(SCAN_WORKER_CONCURRENCY,
+                                             initializer=warm_up_sast, initargs=(discover_tools(),))
+        else:
+            self.executors = ScanProcessPool(SCAN_WORKER_CONCURRENCY)
         logger.info("עובד סריקה הופעל וממתין לבקשות")
         
-    def update_progress(self, scan_id, progress_data):
-        """עדכון מידע על התקדמות הסריקה ב-Redis ובשרת ה-API"""
-        try:
-            # שמירה ב-Redis
-            redis_key = f"scan:progress:{scan_id}"
-            self.redis_client.set(redis_key, json.dumps(progress_data))
-            
-            # שליחה לשרת ה-API
-            headers = {'x-api-key': WORKER_API_KEY, 'Content-Type': 'application/json'}
-            requests.post(
-                f"{API_BASE_URL}/scans/progress",
-                headers=headers,
-                json={'scanId': scan_id, 'progress': progress_data}
-            )
-            
-            # פרסום הודעת עדכון ב-Redis
-            self.redis_client.publish('scan:updates', json.stringify({
-                'scanId': scan_id,
-                'type': 'progress_update',
-                'timestamp': datetime.now(timezone.utc).isoformat(),
-                'data': progress_data
-            }))
-            
-        except Exception as e:
-            logger.error(f"שגיאה בעדכון התקדמות: {str(e)}")
+    def update_progress(self, scan_id, progress_update, final=False):
+        """
+        עדכון התקדמות הסריקה - מיזוג לתמונת המצב ושליחה ברקע (לא חוסם)
+        
+        רשומות logs מתווספות לקיימות, steps מתעדכנים לפי id, ושאר השדות מוחלפים.
+        final=True שולח מיד ומסיים את המעקב אחרי הסריקה.
+        """
+        self.progress.update(scan_id, progress_update, final)
+    
+    def post_progress(self, scan_id, progress_data):
+        """
+        שליחת תמונת המצב המלאה לשרת ה-API (נקרא מה-thread של ProgressAggregator)
+        
+        ניסיון חוזר אחד בלבד - תמונת מצב שלא נמסרה מוחלפת בזו שאחריה.
+        """
+        self.api.post("/scans/progress", {'scanId': scan_id, 'progress': progress_data}, retries=1)
     
     def update_scan_status(self, scan_id, status, error_message=None):
-        """עדכון סטטוס סריקה במסד הנתונים"""
+        """
+        עדכון סטטוס סריקה במסד הנתונים
+        
+        העדכון נשמר בתור היוצא ונשלח ברקע לפי הסדר, כך ששינויי סטטוס לא הולכים
+        לאיבוד בזמן שרת ה-API לא זמין.
+        """
         try:
-            headers = {'x-api-key': WORKER_API_KEY, 'Content-Type': 'application/json'}
             payload = {'scanId': scan_id, 'status': status}
             
             if error_message:
                 payload['errorMessage'] = error_message
                 
-            requests.post(
-                f"{API_BASE_URL}/scans/status",
-                headers=headers,
-                json=payload
-            )
+            self.api.send("/scans/status", payload)
         except Exception as e:
             logger.error(f"שגיאה בעדכון סטטוס סריקה: {str(e)}")
     
+    def save_result(self, scan_id, target, parameters, result):
+        """
+        שמירת תוצאת הסריקה והממצאים במסד הנתונים בטרנזקציה אחת
+        
+        נקרא לפני דיווח הסטטוס, כך שסריקה שמדווחת כהושלמה כבר שמורה במלואה.
+        שגיאת שמירה לא מכשילה את הסריקה - הממצאים עדיין נשלחים ב-Redis וב-API.
+        """
+        if not HAS_DB:
+            return
+        status = ScanStatus.SUCCESS if result.get('success', False) else ScanStatus.ERROR
+        try:
+            finalize_scan(scan_id, (parameters or {}).get('project_id', target), status, result.get('findings') or [])
+        except Exception as e:
+            logger.error(f"שגיאה בשמירת ממצאי סריקה {scan_id}: {str(e)}")
+    
     def run_scan(self, scan_id, scan_type, target, parameters=None):
         """הפעלת סריקה לפי סוג"""
         logger.info(f"מתחיל סריקה חדשה: {scan_id}, סוג: {scan_type}, מטרה: {target}")
@@ -159,67 +204,64 @@ class ScanWorker:
                 
                 # קריאה לפונקציית הסריקה עם פונקציית callback לעדכוני התקדמות
                 def progress_callback(progress_update):
-                    # עדכון המבנה הכללי עם נתוני ההתקדמות החדשים
-                    progress_data.update(progress_update)
-                    self.update_progress(scan_id, progress_data)
+                    # מיזוג נתוני ההתקדמות החדשים לתמונת המצב של הסריקה
+                    self.update_progress(scan_id, progress_update)
                 
                 # הפעלת הסריקה
-                result = run_dast_scan(target, parameters, progress_callback)
+                result = self.run_isolated(run_dast_scan, target, parameters, progress_callback)
+                
+                self.save_result(scan_id, target, parameters, result)
                 
                 # עדכון סטטוס בסיום
                 if result.get('success', False):
                     self.update_scan_status(scan_id, "completed")
-                    progress_data["status"] = "completed"
-                    progress_data["overallProgress"] = 100
+                    final_update = {"status": "completed", "overallProgress": 100}
                 else:
                     self.update_scan_status(scan_id, "failed", result.get('error'))
-                    progress_data["status"] = "failed"
-                    progress_data["error"] = result.get('error')
+                    final_update = {"status": "failed", "error": result.get('error')}
                 
                 # עדכון התקדמות סופי
-                self.update_progress(scan_id, progress_data)
+                self.update_progress(scan_id, final_update, final=True)
                 
             elif scan_type == "SAST" and HAS_SAST:
                 # דומה ל-DAST אבל עם הפונקציה המתאימה
                 self.update_scan_status(scan_id, "running")
                 
                 def progress_callback(progress_update):
-                    progress_data.update(progress_update)
-                    self.update_progress(scan_id, progress_data)
+                    self.update_progress(scan_id, progress_update)
+                
+                result = self.run_isolated(run_sast_scan, target, parameters, progress_callback)
                 
-                result = run_sast_scan(target, parameters, progress_callback)
+                self.save_result(scan_id, target, parameters, result)
                 
                 if result.get('success', False):
                     self.update_scan_status(scan_id, "completed")
-                    progress_data["status"] = "completed"
-                    progress_data["overallProgress"] = 100
+                    final_update = {"status": "completed", "overallProgress": 100}
                 else:
                     self.update_scan_status(scan_id, "failed", result.get('error'))
-                    progress_data["status"] = "failed"
-                    progress_data["error"] = result.get('error')
+                    final_update = {"status": "failed", "error": result.get('error')}
                 
-                self.update_progress(scan_id, progress_data)
+                self.update_progress(scan_id, final_update, final=True)
                 
             elif scan_type == "API" and HAS_API_SCAN:
                 # דומה ל-DAST אבל עם הפונקציה המתאימה
                 self.update_scan_status(scan_id, "running")
                 
                 def progress_callback(progress_update):
-                    progress_data.update(progress_update)
-                    self.update_progress(scan_id, progress_data)
+                    self.update_progress(scan_id, progress_update)
                 
-                result = run_api_scan(target, parameters, progress_callback)
+                result = self.run_isolated(run_api_scan, target, parameters, progress_callback)
+                
+                self.save_result(scan_id, target, parameters, result)
                 
                 if result.get('success', False):
                     self.update_scan_status(scan_id, "completed")
-                    progress_data["status"] = "completed"
-                    progress_data["overallProgress"] = 100
+                    final_update = {"status": "completed", "overallProgress": 100}
                 else:
                     self.update_scan_status(scan_id, "failed", result.get('error'))
-                    progress_data["status"] = "failed"
-                    progress_data["error"] = result.get('error')
+                    final_update = {"status": "failed", "error": result.get('error')}
                 
-                self.update_progress(scan_id, progress_data)
+                self.update_progress(scan_id, final_update, final=True)
                 
             else:
                 # סוג סריקה לא נתמך
@@ -227,57 +269,117 @@ class ScanWorker:
                 logger.error(error_msg)
                 self.update_scan_status(scan_id, "failed", error_msg)
                 
-                progress_data["status"] = "failed"
-                progress_data["error"] = error_msg
-                progress_data["logs"].append({
-                    "timestamp": datetime.now(timezone.utc).isoformat(),
-                    "level": "error",
-                    "message": error_msg
-                })
-                self.update_progress(scan_id, progress_data)
+                self.update_progress(scan_id, {
+                    "status": "failed",
+                    "error": error_msg,
+                    "logs": [{
+                        "timestamp": datetime.now(timezone.utc).isoformat(),
+                        "level": "error",
+                        "message": error_msg
+                    }]
+                }, final=True)
                 
         except Exception as e:
             # טיפול בשגיאות לא צפויות
-            error_msg = f"שגיאה בביצוע הסריקה: {str(e)}"
-            logger.error(f"{error_msg}\n{traceback.format_exc()}")
+            if isinstance(e, ScanTimeout):
+                error_msg = f"הסריקה חרגה ממשך הסריקה המקסימלי ({(parameters or {}).get('max_scan_duration')} שניות)"
+                logger.error(f"{scan_id}: {error_msg}")
+            else:
+                error_msg = f"שגיאה בביצוע הסריקה: {str(e)}"
+                logger.error(f"{error_msg}\n{traceback.format_exc()}")
             
             self.update_scan_status(scan_id, "failed", error_msg)
             
-            progress_data["status"] = "failed"
-            progress_data["error"] = error_msg
-            progress_data["logs"].append({
-                "timestamp": datetime.now(timezone.utc).isoformat(),
-                "level": "error",
-                "message": error_msg
-            })
-            self.update_progress(scan_id, progress_data)
+            self.update_progress(scan_id, {
+                "status": "failed",
+                "error": error_msg,
+                "logs": [{
+                    "timestamp": datetime.now(timezone.utc).isoformat(),
+                    "level": "error",
+                    "message": error_msg
+                }]
+            }, final=True)
     
-    def listen(self):
-        """האזנה להודעות מ-Redis והפעלת סריקות בהתאם"""
-        logger.info("מקשיב להודעות סריקה חדשות")
+    def run_isolated(self, scan_fn, target, parameters, progress_callback):
+        """
+        הרצת פונקציית סריקה בתהליך מבודד מתוך מאגר התהליכים
         
+        עדכוני ההתקדמות מועברים מהתהליך ל-progress_callback בתהליך הנוכחי. סריקה
+        שחורגת מ-max_scan_duration נעצרת יחד עם כל הכלים שהפעילה (ScanTimeout).
+        """
+        return self.executors.run(
+            scan_fn, target, parameters,
+            progress_callback=progress_callback,
+            timeout=(parameters or {}).get('max_scan_duration')
+        )
+    
+    def forward_requests(self):
+        """
+        העברת בקשות מערוץ ה-pub/sub הישן אל תור העבודות העמיד
+
+        גשר זמני למפיקים שעדיין מפרסמים ב-scan:requests: בקשה שמתפרסמת כשאף עותק
+        של העובד לא מאזין הולכת לאיבוד. מפיקים צריכים להוסיף עבודות ישירות לזרם
+        (ScanJobQueue.enqueue, או XADD ל-scan:jobs כמו ב-index.js), והגשר יוסר
+        כשאחרון המפיקים יעבור.
+        """
         for message in self.pubsub.listen():
+            if self.stop_event.is_set():
+                break
             if message['type'] == 'message':
                 try:
                     data = json.loads(message['data'])
                     
                     if data.get('action') == 'start_scan':
-                        scan_id = data.get('scanId')
-                        scan_type = data.get('scanType')
-                        target = data.get('target')
-                        parameters = data.get('parameters', {})
-                        
-                        # הפעלת הסריקה בתהליך נפרד
-                        import threading
-                        threading.Thread(
-                            target=self.run_scan,
-                            args=(scan_id, scan_type, target, parameters)
-                        ).start()
+                        # ההוספה לתור אידמפוטנטית לפי scanId, כך שכל העותקים יכולים להעביר בבטחה
+                        self.job_queue.enqueue(data)
                     
                 except json.JSONDecodeError:
                     logger.error(f"שגיאת JSON בהודעה: {message['data']}")
                 except Exception as e:
                     logger.error(f"שגיאה בטיפול בהודעה: {str(e)}")
+    
+    def handle_job(self, data):
+        """הרצת עבודת סריקה שהתקבלה מהתור, לאחר שהמתזמן אישר אותה"""
+        scan_id = data.get('scanId')
+        parameters = data.get('parameters') or {}
+        user_id = data.get('userId') or parameters.get('user_id')
+        # התוכנית נקבעת לפי חשבון המשתמש ולא לפי ההודעה, שכל לקוח יכול לקבוע את תוכנה
+        plan = resolve_plan(user_id)
+        plan_limits = USER_PLAN_LIMITS[plan]
+        
+        if data.get('scanType') == 'SAST_SHARD':
+            # עבודת עזר של סריקת SAST מבוזרת: המתאם שלה מדווח על ההתקדמות והסטטוס, ומגבלת
+            # הזמן שלה היא זו של המתאם (run_sharded_scanners), לא של תוכנית ברירת המחדל.
+            # היא עוברת במתזמן בשם בעל הסריקה, כך שמאגר גדול אחד לא תופס את כל העובדים
+            # מעבר למגבלת הסריקות המקבילות של המשתמש
+            if HAS_SAST:
+                self.scheduler.run(
+                    scan_id, user_id, plan,
+                    self.run_isolated, run_sast_shard, data.get('target'), parameters, None
+                )
+            return
+        
+        # הסורקים יכולים להשתמש במגבלת הזמן כדי לעצור בעצמם, ומאגר התהליכים עוצר סריקה שחרגה ממנה.
+        # מגבלה שנשלחה בבקשה יכולה רק לקצר את זו של התוכנית
+        max_scan_duration = plan_limits['max_scan_duration']
+        requested_duration = parameters.get('max_scan_duration')
+        if isinstance(requested_duration, (int, float)) and 0 < requested_duration < max_scan_duration:
+            max_scan_duration = requested_duration
+        parameters['max_scan_duration'] = max_scan_duration
+        # בעל הסריקה, לעבודות העזר של סריקה מבוזרת
+        parameters['user_id'] = user_id
+        
+        self.scheduler.run(
+            scan_id, user_id, plan,
+            self.run_scan, scan_id, data.get('scanType'), data.get('target'), parameters
+        )
+    
+    def listen(self):
+        """האזנה לתור העבודות והפעלת סריקות עם מספר מוגבל של סריקות מקבילות"""
+        logger.info("מקשיב להודעות סריקה חדשות")
+        
+        threading.Thread(target=self.forward_requests, daemon=True).start()
+        self.job_queue.consume(self.handle_job, self.stop_event)
 
 if __name__ == "__main__":
     # יצירת והפעלת עובד הסריקה
@@ -287,7 +389,13 @@ if __name__ == "__main__":
         worker.listen()
     except KeyboardInterrupt:
         logger.info("עובד הסריקה עוצר...")
+        worker.stop_event.set()
     except Exception as e:
         logger.error(f"שגיאה לא צפויה: {str(e)}")
+    finally:
+        # עצירת תהליכי הסריקה, ושליחת עדכוני ההתקדמות והסטטוס שעדיין ממתינים
+        worker.executors.close()
+        worker.progress.close()
+        worker.api.close()
         
     logger.info("עובד הסריקה הסתיים") 
\ No newline at end of file
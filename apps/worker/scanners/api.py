@@ -14,6 +14,8 @@ from subprocess import Popen, PIPE
 import shlex
 import uuid
 import re
+import threading
+from tools.scan_pool import ScanProcessPool, ScanTimeout
 
 # הגדרת רמת הלוג
 logging.basicConfig(level=logging.INFO)
@@ -259,6 +261,30 @@ def run_api_scan(scan_id, api_url, parameters=None):
     
     return {"status": "success", "findings": all_findings}
 
+# מאגר תהליכים מבודדים לסריקות, נוצר בפעם הראשונה שמתקבלת בקשה
+API_SCAN_CONCURRENCY = int(os.environ.get('API_SCAN_CONCURRENCY', 2))
+API_SCAN_TIMEOUT = int(os.environ.get('API_SCAN_TIMEOUT', 1800))
+_scan_pool = None
+_scan_pool_lock = threading.Lock()
+
+def get_scan_pool():
+    global _scan_pool
+    with _scan_pool_lock:
+        if _scan_pool is None:
+            _scan_pool = ScanProcessPool(API_SCAN_CONCURRENCY)
+        return _scan_pool
+
+def run_isolated_api_scan(scan_id, api_url, parameters=None):
+    """הרצת run_api_scan בתהליך מבודד עם מגבלות משאבים וזמן ריצה"""
+    try:
+        return get_scan_pool().run(run_api_scan, scan_id, api_url, parameters, timeout=API_SCAN_TIMEOUT)
+    except ScanTimeout:
+        logger.error(f"[{scan_id}] סריקת ה-API חרגה מזמן הריצה המותר ({API_SCAN_TIMEOUT} שניות) ונעצרה")
+        print_progress(scan_id, "סריקת ה-API חרגה מזמן הריצה המותר ונעצרה")
+    except Exception as e:
+        logger.error(f"[{scan_id}] שגיאה בהרצת סריקת API: {e}")
+        print_progress(scan_id, f"שגיאה בהרצת סריקת API: {e}")
+
 def listen_for_api_scan_requests():
     """האזנה לבקשות סריקת API חדשות"""
     logger.info("מאזין לבקשות סריקת API חדשות...")
@@ -286,11 +312,11 @@ def listen_for_api_scan_requests():
                     
                     if scan_id and target:
                         logger.info(f"מתחיל סריקת API חדשה: {scan_id} - {target}")
-                        # הפעלת הסריקה בתהליך נפרד
-                        import threading
+                        # הסריקה עצמה רצה בתהליך מבודד; ה-thread רק ממתין לה כדי לא לעכב את ההאזנה
                         threading.Thread(
-                            target=run_api_scan,
-                            args=(scan_id, target, parameters)
+                            target=run_isolated_api_scan,
+                            args=(scan_id, target, parameters),
+                            daemon=True
                         ).start()
             except Exception as e:
                 logger.error(f"שגיאה בעיבוד בקשת סריקה: {e}")
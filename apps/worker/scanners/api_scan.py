@@ -6,11 +6,13 @@
 import os
 import json
 import time
+import asyncio
 import logging
 import requests
 import redis
 from datetime import datetime, timezone
 from typing import Dict, Any, List, Optional, Callable, Union
+from tools.fingerprints import fingerprint
 import random  # זמני לצורך יצירת נתונים אקראיים
 
 # הגדרת רישום
@@ -88,7 +90,9 @@ async def run_api_scan(
         
         # ניסיון לגשת ל-API
         try:
-            response = requests.get(
+            # הבקשה החוסמת רצה ב-thread כדי לא לעצור סריקות אחרות בלולאת האירועים
+            response = await asyncio.to_thread(
+                requests.get,
                 target, 
                 headers={'User-Agent': 'Arxio-API-Scanner/1.0'},
                 timeout=10
@@ -134,7 +138,7 @@ async def run_api_scan(
             }]
         })
         
-        time.sleep(2)  # סימולציה של זמן סריקה
+        await asyncio.sleep(2)  # סימולציה של זמן סריקה
         
         # שלב 4: זיהוי פגיעויות
         update_progress(progress_callback, {
@@ -147,7 +151,7 @@ async def run_api_scan(
             }]
         })
         
-        time.sleep(1)  # סימולציה של זמן סריקה
+        await asyncio.sleep(1)  # סימולציה של זמן סריקה
         
         # שלב 5: יצירת דו"ח
         update_progress(progress_callback, {
@@ -160,7 +164,7 @@ async def run_api_scan(
             }]
         })
         
-        time.sleep(1)  # סימולציה של זמן סריקה
+        await asyncio.sleep(1)  # סימולציה של זמן סריקה
         
         # הכנת דו"ח סריקה אמיתי
         findings = scan_api_for_vulnerabilities(target, parameters)
@@ -244,8 +248,7 @@ def scan_api_for_vulnerabilities(
         # כאן יבוא קוד אמיתי...
         
         # דוגמה לממצא אמיתי מביצוע סריקה
-        findings.append({
-            "id": f"api-vuln-{int(time.time())}-1",
+        finding = {
             "severity": "high",
             "rule_id": "API-BROKEN-AUTH",
             "title": "חולשת אימות שבורה ב-API",
@@ -257,7 +260,11 @@ def scan_api_for_vulnerabilities(
                 "remediation": "יש לוודא תקינות טוקן בצד שרת ולהימנע מהסתמכות על מידע מהלקוח"
             },
             "created_at": datetime.now(timezone.utc).isoformat()
-        })
+        }
+        # מזהה יציב (טביעת אצבע) במקום מזהה לפי זמן, כדי שאותה פגיעות תזוהה בין סריקות
+        finding["fingerprint"] = fingerprint(finding)
+        finding["id"] = f"api-{finding['fingerprint']}"
+        findings.append(finding)
         
         return findings
     except Exception as e:
@@ -266,7 +273,6 @@ def scan_api_for_vulnerabilities(
 
 
 if __name__ == "__main__":
-    import asyncio
     import sys
     
     # פונקציית callback פשוטה להדפסת התקדמות
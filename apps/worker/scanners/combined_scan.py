@@ -14,6 +14,8 @@ import json
 import time
 import asyncio
 import logging
+import functools
+import threading
 import tempfile
 import redis
 from datetime import datetime, timezone
@@ -21,18 +23,14 @@ from typing import Dict, List, Any, Callable, Optional, Union
 from concurrent.futures import ThreadPoolExecutor
 
 # ייבוא מודולי הסריקה השונים
-try:
-    from scanners.sast import run_sast_scan
-    from scanners.dast import run_dast_scan
-    from scanners.api_scan import run_api_scan
-except ImportError:
-    # אם לא נמצאו מודולי הסריקה ישירות, ננסה לייבא באופן יחסי
-    import sys
-    import os
-    sys.path.append(os.path.dirname(os.path.dirname(__file__)))
-    from sast import run_sast_scan
-    from dast import run_dast_scan
-    from api_scan import run_api_scan
+from scanners.sast import run_sast_scan
+from scanners.dast import run_dast_scan
+from scanners.api_scan import run_api_scan
+from scanners.plans import USER_PLAN_LIMITS
+
+from tools.scheduler import count_active_scans
+from tools.process_stream import CancelScope
+from tools.findings_table import FindingTable
 
 # קביעת רמת רישום לוג
 logging.basicConfig(
@@ -56,31 +54,64 @@ def publish_progress(channel: str, data: Dict[str, Any]):
     if redis_client:
         redis_client.publish(channel, json.dumps(data))
 
-# הגדרות תוכניות המשתמש והמגבלות
-USER_PLAN_LIMITS = {
-    "free": {
-        "allowed_scans": ["dast"],  # רק סריקת DAST בסיסית
-        "max_scans_per_month": 5,
-        "max_concurrent_scans": 1,
-        "max_scan_duration": 600,  # 10 דקות
-        "description": "תוכנית חינמית - מוגבל לסריקות DAST בסיסיות"
-    },
-    "pro": {
-        "allowed_scans": ["dast", "sast", "api"],  # כל סוגי הסריקות
-        "max_scans_per_month": 50,
-        "max_concurrent_scans": 3,
-        "max_scan_duration": 1800,  # 30 דקות
-        "description": "תוכנית מקצועית - כולל סריקות SAST, DAST, ו-API"
-    },
-    "enterprise": {
-        "allowed_scans": ["dast", "sast", "api"],  # כל סוגי הסריקות
-        "max_scans_per_month": 0,  # ללא הגבלה
-        "max_concurrent_scans": 10,
-        "max_scan_duration": 7200,  # 2 שעות
-        "description": "תוכנית ארגונית - ללא הגבלות משמעותיות"
-    }
+# סורקים חוסמים (SAST) רצים ב-threads כדי לא לחסום את לולאת האירועים; DAST ו-API
+# אסינכרוניים ורצים ישירות בלולאה. העבודה הכבדה של SAST נעשית בתהליכים חיצוניים,
+# ולכן threads מספיקים כאן.
+COMBINED_SCAN_MAX_WORKERS = int(os.getenv("COMBINED_SCAN_MAX_WORKERS", 8))
+_scan_executor = ThreadPoolExecutor(max_workers=COMBINED_SCAN_MAX_WORKERS, thread_name_prefix="combined-scan")
+
+SCAN_FUNCTIONS = {
+    "sast": run_sast_scan,
+    "dast": run_dast_scan,
+    "api": run_api_scan,
 }
 
+class ScanCancelled(Exception):
+    """נזרקת בתוך סורק חוסם (דרך callback ההתקדמות) כשהסריקה בוטלה או חרגה מהזמן המותר"""
+
+async def run_scanner_async(
+    scan_fn: Callable[..., Any],
+    target: str,
+    parameters: Dict[str, Any],
+    progress_callback: Callable[[Dict[str, Any]], None],
+    timeout: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    הרצת סורק בודד בלי לחסום את לולאת האירועים
+
+    סורק אסינכרוני נקרא ישירות עם await, וסורק חוסם רץ ב-executor.
+    בחריגה מ-timeout או בביטול, הסורק האסינכרוני מבוטל מיד. בסורק חוסם, הכלים
+    החיצוניים שהוא הריץ דרך ProcessStream נהרגים מיד (CancelScope), וה-thread
+    עצמו נעצר בעדכון ההתקדמות הבא שלו. פעולות שלא עוברות דרך ProcessStream
+    (למשל שכפול המאגר, או חלקי סריקה מבוזרת שרצים ב-workers אחרים) ממשיכות
+    עד לסיומן או עד למגבלת הזמן שלהן.
+
+    :param timeout: זמן ריצה מקסימלי בשניות (None - ללא הגבלה)
+    :raises asyncio.TimeoutError: אם הסורק חרג מהזמן המותר
+    """
+    cancel_event = threading.Event()
+    scope = CancelScope()
+    
+    def guarded_callback(data: Dict[str, Any]):
+        if cancel_event.is_set():
+            raise ScanCancelled()
+        progress_callback(data)
+    
+    if asyncio.iscoroutinefunction(scan_fn):
+        scan = scan_fn(target, parameters, guarded_callback)
+    else:
+        loop = asyncio.get_running_loop()
+        scan = loop.run_in_executor(
+            _scan_executor, functools.partial(scope.run, scan_fn, target, parameters, guarded_callback)
+        )
+    
+    try:
+        return await asyncio.wait_for(scan, timeout)
+    except BaseException:
+        cancel_event.set()
+        scope.cancel()
+        raise
+
 async def check_user_permissions(user_id: str, plan: str, scan_types: List[str], supabase_client=None) -> Dict[str, Any]:
     """
     בדיקת הרשאות המשתמש לסריקות המבוקשות
@@ -144,8 +175,18 @@ async def check_user_permissions(user_id: str, plan: str, scan_types: List[str],
             logger.error(f"שגיאה בבדיקת מכסת הסריקות: {str(e)}")
             # במקרה של שגיאה נאפשר לסריקה להמשיך
     
-    # בדיקות נוספות
-    # כאן ניתן להוסיף בדיקות נוספות כמו מספר הסריקות המקבילות הפעילות כרגע
+    # בדיקת מספר הסריקות המקבילות הפעילות כרגע (לפי החכירות של מתזמן הסריקות)
+    if redis_client:
+        try:
+            active_scans = count_active_scans(redis_client, user_id)
+            if active_scans >= plan_limits["max_concurrent_scans"]:
+                return {
+                    "allowed": False,
+                    "error": "הגעת למגבלת הסריקות המקבילות",
+                    "details": f"תוכנית {plan} מוגבלת ל-{plan_limits['max_concurrent_scans']} סריקות מקבילות"
+                }
+        except Exception as e:
+            logger.error(f"שגיאה בבדיקת הסריקות המקבילות: {str(e)}")
     
     return {
         "allowed": True,
@@ -171,8 +212,8 @@ async def run_combined_scan(
     :return: תוצאות הסריקה המשולבת
     """
     start_time = datetime.now(timezone.utc)
-    scan_id = parameters.get("scan_id", f"scan_{int(time.time())}")
     parameters = parameters or {}
+    scan_id = parameters.get("scan_id", f"scan_{int(time.time())}")
     
     # עדכון התקדמות: התחלת סריקה
     if progress_callback:
@@ -256,41 +297,51 @@ async def run_combined_scan(
             }
         }
         
+        # התקדמות ושלבים של כל סריקה, לחישוב ההתקדמות הכוללת (העדכונים מגיעים ממספר threads)
+        steps = [{"id": "auth", "label": "בדיקת הרשאות", "status": "completed"}] + [
+            {"id": scan_type, "label": f"סריקת {scan_type.upper()}", "status": "pending"}
+            for scan_type in targets.keys()
+        ]
+        progress_by_scan = {scan_type: 0 for scan_type in scan_types}
+        progress_lock = threading.Lock()
+        
         # הרצת הסריקות במקביל אם יש יותר מסריקה אחת
         async def run_scan(scan_type, target):
-            scan_progress = 0
-            
             # פונקציה להעברת עדכוני התקדמות מהסורק הספציפי
             def update_scan_progress(scan_data):
-                nonlocal scan_progress
+                if 'overallProgress' not in scan_data or not progress_callback:
+                    return
                 
-                if 'overallProgress' in scan_data:
-                    # עדכון ההתקדמות הכללית
-                    scan_progress = scan_data['overallProgress']
+                with progress_lock:
+                    progress_by_scan[scan_type] = scan_data['overallProgress']
+                    
+                    # משקל כל סריקה הוא 95% / מספר הסריקות
+                    # 5% הראשונים כבר הוקצו לבדיקת ההרשאות
+                    weight_per_scan = 95.0 / len(scan_types)
+                    overall_progress = 5 + sum(
+                        (progress / 100.0) * weight_per_scan for progress in progress_by_scan.values()
+                    )
+                    
+                    # עדכון שלב הסריקה הנוכחי
+                    for step in steps:
+                        if step["id"] == scan_type:
+                            step["status"] = "running"
+                            step["progress"] = progress_by_scan[scan_type]
                     
-                    # חישוב ההתקדמות הכללית של כל הסריקות יחד
-                    if progress_callback:
-                        # משקל כל סריקה הוא 95% / מספר הסריקות
-                        # 5% הראשונים כבר הוקצו לבדיקת ההרשאות
-                        weight_per_scan = 95.0 / len(scan_types)
-                        scan_contribution = (scan_progress / 100.0) * weight_per_scan
-                        
-                        # חישוב ממוצע משוקלל של כל הסריקות + 5% ההתחלתיים
-                        overall_progress = 5 + scan_contribution
-                        
-                        # עדכון שלב הסריקה הנוכחי
-                        updated_steps = []
-                        for step in results.get("steps", []):
-                            if step["id"] == scan_type:
-                                step["status"] = "running"
-                                step["progress"] = scan_progress
-                            updated_steps.append(step)
-                        
-                        scan_data["scanId"] = scan_id
-                        scan_data["overallProgress"] = min(99, overall_progress)
-                        scan_data["steps"] = updated_steps
-                        
-                        progress_callback(scan_data)
+                    scan_data = dict(scan_data)
+                    scan_data["scanId"] = scan_id
+                    scan_data["overallProgress"] = min(99, overall_progress)
+                    scan_data["steps"] = [dict(step) for step in steps]
+                    
+                    progress_callback(scan_data)
+            
+            # זמן הריצה המקסימלי של כל סריקה נלקח מ-max_scan_duration של הסריקה או של התוכנית
+            scan_parameters = dict(parameters.get(scan_type, {}))
+            scan_parameters.setdefault(
+                "max_scan_duration",
+                parameters.get("max_scan_duration", permissions["limits"]["max_scan_duration"])
+            )
+            timeout = scan_parameters["max_scan_duration"]
             
             try:
                 # עדכון מצב הסריקה הנוכחית למצב "running"
@@ -305,18 +356,19 @@ async def run_combined_scan(
                     })
                 
                 # הפעלת הסורק המתאים
-                scan_result = None
-                scan_parameters = parameters.get(scan_type, {})
-                
-                if scan_type == "sast":
-                    scan_result = run_sast_scan(target, scan_parameters, update_scan_progress)
-                elif scan_type == "dast":
-                    scan_result = run_dast_scan(target, scan_parameters, update_scan_progress)
-                elif scan_type == "api":
-                    scan_result = run_api_scan(target, scan_parameters, update_scan_progress)
+                scan_result = await run_scanner_async(
+                    SCAN_FUNCTIONS[scan_type], target, scan_parameters, update_scan_progress, timeout
+                )
                 
                 return scan_type, scan_result
                 
+            except asyncio.TimeoutError:
+                logger.error(f"סריקת {scan_type} חרגה מזמן הריצה המותר ({timeout} שניות)")
+                return scan_type, {
+                    "success": False,
+                    "error": f"סריקת {scan_type} חרגה מזמן הריצה המותר ({timeout} שניות)",
+                    "scan_duration": timeout
+                }
             except Exception as e:
                 logger.error(f"שגיאה בהרצת סריקת {scan_type}: {str(e)}")
                 return scan_type, {
@@ -329,19 +381,23 @@ async def run_combined_scan(
         scan_tasks = []
         
         for scan_type, target in targets.items():
-            if not target:
+            if not target or scan_type not in SCAN_FUNCTIONS:
                 continue
                 
             task = asyncio.create_task(run_scan(scan_type, target))
             scan_tasks.append(task)
         
-        # המתנה לסיום כל הסריקות
+        # המתנה לסיום כל הסריקות; ביטול הסריקה המשולבת מבטל גם את כל הסריקות שרצות
         scan_results = await asyncio.gather(*scan_tasks)
         
         # עיבוד תוצאות הסריקות
         total_findings = 0
         
         for scan_type, result in scan_results:
+            # ממצאי SAST מגיעים כ-FindingTable; התוצאה המשולבת מוחזרת כ-JSON
+            if isinstance(result.get("findings"), FindingTable):
+                result = {**result, "findings": result["findings"].to_dicts()}
+            
             # הוספת תוצאות הסריקה לתוצאות המשולבות
             results["results"][scan_type] = result
             
@@ -409,6 +465,21 @@ async def run_combined_scan(
         
         return results
         
+    except asyncio.CancelledError:
+        logger.warning(f"הסריקה המשולבת {scan_id} בוטלה")
+        
+        if progress_callback:
+            progress_callback({
+                "scanId": scan_id,
+                "status": "cancelled",
+                "logs": [{
+                    "timestamp": datetime.now(timezone.utc).isoformat(),
+                    "level": "warning",
+                    "message": "הסריקה בוטלה"
+                }]
+            })
+        raise
+        
     except Exception as e:
         logger.error(f"שגיאה בסריקה המשולבת: {str(e)}")
         
@@ -1,9 +1,16 @@
 import os
 import json
 import time
+import asyncio
+import uuid
+import logging
 import redis
-import requests
-from typing import Dict, List, Any
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Callable
+from tools.zap_client import ZapPool, ZapLease, ZapError, alert_id
+
+logger = logging.getLogger('dast-scanner')
 
 # קישור למסד הנתונים Redis
 redis_client = redis.Redis(
@@ -13,112 +20,191 @@ redis_client = redis.Redis(
     decode_responses=True
 )
 
-# הגדרות ZAP API
-ZAP_API_URL = os.getenv("ZAP_API_URL", "http://zap:8080/JSON")
+# מאגר שרתי ZAP: כל סריקה מקבלת שרת וקונטקסט משלה, כך שכמה סריקות רצות במקביל
+# (הכתובות מוגדרות ב-ZAP_API_URLS, או ZAP_API_URL לשרת יחיד)
+zap_pool = ZapPool(redis_client)
 
-def start_zap_session(target_url: str) -> str:
-    """יצירת סשן חדש ב-ZAP והפעלת סריקה בסיסית"""
-    session_id = f"arxio-scan-{int(time.time())}"
-    
-    # אתחול סשן ZAP חדש
-    requests.get(f"{ZAP_API_URL}/core/action/newSession", params={"name": session_id})
-    
-    # הגדרת המטרה ל-ZAP
-    requests.get(f"{ZAP_API_URL}/core/action/accessUrl", params={"url": target_url})
-    
-    return session_id
+# מרווח הבדיקה של התקדמות סריקות ZAP: מתחיל קצר ומתארך כל עוד ההתקדמות לא משתנה
+ZAP_POLL_MIN_SECONDS = float(os.getenv("ZAP_POLL_MIN_SECONDS", 1))
+ZAP_POLL_MAX_SECONDS = float(os.getenv("ZAP_POLL_MAX_SECONDS", 15))
+ZAP_POLL_BACKOFF = 1.5
+# ממצאים מתפרסמים ב-Redis בקבוצות, לא הודעה לכל ממצא
+DAST_FINDING_BATCH = int(os.getenv("DAST_FINDING_BATCH", 100))
+# מספר המופעים (URL/פרמטר) שנשמרים לכל ממצא; השאר רק נספרים
+DAST_MAX_INSTANCES = int(os.getenv("DAST_MAX_INSTANCES", 20))
+# בקשת ביטול (ראו request_cancel) נרשמת לכל סריקה שרצה כעת, לפי מזהה הריצה שלה
+CANCEL_KEY_TTL = 3600
+# סריקה בלי משך מקסימלי נחשבת פעילה לכל היותר כך, אם ה-worker שלה קרס
+DAST_RUNNING_TTL = 24 * 3600
 
-def run_spider(target_url: str, project_id: str) -> None:
-    """הפעלת ה-Spider לגילוי דפים ונתיבים באתר"""
-    # עדכון התקדמות
-    redis_client.publish(
-        f"scan:{project_id}",
-        json.dumps({
-            "type": "progress",
-            "status": "scanning",
-            "projectId": project_id,
-            "message": "מריץ סריקת Spider לגילוי נתיבים..."
-        })
-    )
-    
-    # מתחיל סריקת Spider
-    response = requests.get(
-        f"{ZAP_API_URL}/spider/action/scan",
-        params={"url": target_url, "maxChildren": 10}
-    )
-    
-    scan_id = json.loads(response.text)["scan"]
-    
-    # מעקב אחר התקדמות ה-Spider
+class DastScanStopped(Exception):
+    """הסריקה נעצרה לפני שהסתיימה - בוטלה או חרגה ממשך הסריקה המקסימלי"""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+def running_key(project_id: str) -> str:
+    # sorted set של מזהי הריצות הפעילות של הפרויקט, לפי מועד התפוגה שלהן
+    return f"scan:running:dast:{project_id}"
+
+def cancel_key(run_id: str) -> str:
+    return f"scan:cancel:dast:{run_id}"
+
+def request_cancel(project_id: str) -> int:
+    """
+    בקשה לעצור את סריקות ה-DAST שרצות כעת על הפרויקט
+
+    הבקשה נרשמת רק לריצות הפעילות, כך שביטול שנשלח כשאין סריקה לא עוצר את הסריקה הבאה.
+    :return: מספר הסריקות שהתבקש ביטולן
+    """
+    key = running_key(project_id)
+    redis_client.zremrangebyscore(key, "-inf", time.time())
+    run_ids = redis_client.zrange(key, 0, -1)
+    for run_id in run_ids:
+        redis_client.set(cancel_key(run_id), "1", ex=CANCEL_KEY_TTL)
+    return len(run_ids)
+
+def register_run(project_id: str, run_id: str, max_duration: Optional[float] = None):
+    expires_at = time.time() + (max_duration or DAST_RUNNING_TTL) + 60
+    pipe = redis_client.pipeline()
+    pipe.zadd(running_key(project_id), {run_id: expires_at})
+    # ריצות שפגו מנוקות לפי הניקוד; התפוגה של המפתח רק מונעת ממנו להישאר לנצח
+    pipe.expire(running_key(project_id), DAST_RUNNING_TTL + 60)
+    pipe.execute()
+
+def unregister_run(project_id: str, run_id: str):
+    pipe = redis_client.pipeline()
+    pipe.zrem(running_key(project_id), run_id)
+    # בקשת ביטול שלא טופלה לא צריכה להישאר
+    pipe.delete(cancel_key(run_id))
+    pipe.execute()
+
+async def poll_zap_scan(
+    zap: ZapLease,
+    component: str,
+    scan_id: str,
+    project_id: str,
+    label: str,
+    deadline: Optional[float] = None,
+    feed: Optional["AlertFeed"] = None,
+    run_id: Optional[str] = None
+) -> None:
+    """
+    מעקב אחרי סריקת ZAP (spider או ascan) עד שהיא מסתיימת
+
+    מרווח הבדיקה מתארך (עד ZAP_POLL_MAX_SECONDS) כשההתקדמות לא משתנה וחוזר
+    למינימום כשהיא משתנה, ועדכון מתפרסם רק כשההתקדמות השתנתה. בחריגה מ-deadline
+    (זמן monotonic) או כשהתבקש ביטול של הריצה run_id, הסריקה נעצרת ב-ZAP ו-DastScanStopped נזרקת.
+    אם הועבר feed, התראות חדשות נשלפות ומתפרסמות בכל בדיקה, תוך כדי הסריקה.
+    """
+    interval = ZAP_POLL_MIN_SECONDS
+    last_progress = None
     while True:
-        status_response = requests.get(
-            f"{ZAP_API_URL}/spider/view/status",
-            params={"scanId": scan_id}
-        )
-        progress = int(json.loads(status_response.text)["status"])
-        
-        redis_client.publish(
-            f"scan:{project_id}",
-            json.dumps({
+        status_response = await zap.client.call(component, "view", "status", scanId=scan_id)
+        progress = int(status_response["status"])
+        # התראות חדשות הן התקדמות לכל דבר - לא מאריכים את המרווח כשהן מגיעות
+        found = await feed.drain() if feed is not None else 0
+
+        if progress != last_progress:
+            last_progress = progress
+            interval = ZAP_POLL_MIN_SECONDS
+            await publish_event(project_id, {
                 "type": "progress",
                 "status": "scanning",
                 "projectId": project_id,
-                "message": f"סריקת Spider: {progress}% הושלמו"
+                "message": f"{label}: {progress}% הושלמו"
             })
-        )
-        
+        elif found:
+            interval = ZAP_POLL_MIN_SECONDS
+        else:
+            interval = min(interval * ZAP_POLL_BACKOFF, ZAP_POLL_MAX_SECONDS)
+
         if progress >= 100:
-            break
-            
-        time.sleep(2)
+            return
+
+        stopped = None
+        if run_id and await asyncio.to_thread(redis_client.get, cancel_key(run_id)):
+            stopped = DastScanStopped("cancelled", "סריקת DAST בוטלה")
+        elif deadline is not None and time.monotonic() >= deadline:
+            stopped = DastScanStopped("timeout", "סריקת DAST חרגה ממשך הסריקה המקסימלי")
+        if stopped:
+            # עצירת הסריקה ב-ZAP, כדי שלא תמשיך להעסיק את השרת
+            try:
+                await zap.client.call(component, "action", "stop", scanId=scan_id)
+            except ZapError as e:
+                logger.warning(f"עצירת סריקת {component} {scan_id} ב-ZAP נכשלה: {str(e)}")
+            raise stopped
 
-def run_active_scan(target_url: str, project_id: str) -> List[Dict[str, Any]]:
-    """הפעלת סריקה אקטיבית לזיהוי פגיעויות"""
+        if deadline is not None:
+            interval = max(0.0, min(interval, deadline - time.monotonic()))
+        await asyncio.sleep(interval)
+
+async def start_zap_session(zap: ZapLease, target_url: str) -> str:
+    """הכנת הסריקה בקונטקסט שהוקצה לה וגישה ראשונה למטרה"""
+    # בלי newSession - הוא מאפס את ZAP לכל הסריקות האחרות שרצות עליו
+    await zap.client.call("core", "action", "accessUrl", url=target_url)
+    return zap.context_name
+
+async def run_spider(
+    zap: ZapLease, target_url: str, project_id: str,
+    deadline: Optional[float] = None, feed: Optional["AlertFeed"] = None,
+    run_id: Optional[str] = None
+) -> None:
+    """הפעלת ה-Spider לגילוי דפים ונתיבים באתר"""
     # עדכון התקדמות
-    redis_client.publish(
-        f"scan:{project_id}",
-        json.dumps({
-            "type": "progress",
-            "status": "scanning",
-            "projectId": project_id,
-            "message": "מריץ סריקה אקטיבית לזיהוי פגיעויות..."
-        })
+    await publish_event(project_id, {
+        "type": "progress",
+        "status": "scanning",
+        "projectId": project_id,
+        "message": "מריץ סריקת Spider לגילוי נתיבים..."
+    })
+    
+    # מתחיל סריקת Spider בתוך הקונטקסט של הסריקה
+    response = await zap.client.call(
+        "spider", "action", "scan",
+        url=target_url, maxChildren=10, contextName=zap.context_name
     )
     
-    # התחלת סריקה אקטיבית
-    response = requests.get(
-        f"{ZAP_API_URL}/ascan/action/scan",
-        params={"url": target_url, "recurse": "true", "inScopeOnly": "true"}
+    scan_id = response["scan"]
+    
+    # מעקב אחר התקדמות ה-Spider
+    # (הסורק הפסיבי מתריע כבר בשלב הזה)
+    await poll_zap_scan(zap, "spider", scan_id, project_id, "סריקת Spider", deadline, feed, run_id)
+
+async def run_active_scan(
+    zap: ZapLease, target_url: str, project_id: str,
+    deadline: Optional[float] = None, feed: Optional["AlertFeed"] = None,
+    run_id: Optional[str] = None
+) -> int:
+    """
+    הפעלת סריקה אקטיבית לזיהוי פגיעויות
+
+    הממצאים מתפרסמים דרך feed תוך כדי הסריקה; מוחזר מספר הממצאים הכולל.
+    """
+    feed = feed or AlertFeed(zap, target_url, project_id)
+    # עדכון התקדמות
+    await publish_event(project_id, {
+        "type": "progress",
+        "status": "scanning",
+        "projectId": project_id,
+        "message": "מריץ סריקה אקטיבית לזיהוי פגיעויות..."
+    })
+    
+    # התחלת סריקה אקטיבית בתוך הקונטקסט של הסריקה
+    response = await zap.client.call(
+        "ascan", "action", "scan",
+        url=target_url, recurse=True, inScopeOnly=True, contextId=zap.context_id
     )
     
-    scan_id = json.loads(response.text)["scan"]
+    scan_id = response["scan"]
     
     # מעקב אחר התקדמות הסריקה האקטיבית
-    while True:
-        status_response = requests.get(
-            f"{ZAP_API_URL}/ascan/view/status",
-            params={"scanId": scan_id}
-        )
-        progress = int(json.loads(status_response.text)["status"])
-        
-        redis_client.publish(
-            f"scan:{project_id}",
-            json.dumps({
-                "type": "progress",
-                "status": "scanning",
-                "projectId": project_id,
-                "message": f"סריקה אקטיבית: {progress}% הושלמו"
-            })
-        )
-        
-        if progress >= 100:
-            break
-            
-        time.sleep(5)
+    await poll_zap_scan(zap, "ascan", scan_id, project_id, "סריקה אקטיבית", deadline, feed, run_id)
     
-    # קבלת התראות מ-ZAP
-    alerts_response = requests.get(f"{ZAP_API_URL}/core/view/alerts")
-    return json.loads(alerts_response.text)["alerts"]
+    # התראות שנוספו אחרי הבדיקה האחרונה
+    await feed.drain()
+    return len(feed.groups)
 
 def map_zap_severity(risk: str) -> str:
     """המרת רמות סיכון של ZAP לחומרות סטנדרטיות"""
@@ -132,71 +218,213 @@ def map_zap_severity(risk: str) -> str:
     else:
         return "INFO"
 
-def run_dast(project_id: str, url: str):
-    """הרצת סריקת אבטחה דינמית מלאה"""
-    try:
-        # עדכון סטטוס התחלת הסריקה
+class AlertGroups:
+    """
+    איחוד התראות ZAP לממצא אחד לכל plugin
+
+    ZAP מדווח התראה נפרדת לכל URL ופרמטר שבהם נמצאה אותה בעיה; כאן כל plugin
+    הופך לממצא אחד עם רשימת מופעים (עד DAST_MAX_INSTANCES) ומספר המופעים הכולל.
+    """
+
+    def __init__(self):
+        self.groups: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, alert: Dict[str, Any]) -> Dict[str, Any]:
+        plugin_id = str(alert.get("pluginId", "unknown"))
+        finding = self.groups.get(plugin_id)
+        if finding is None:
+            finding = self.groups[plugin_id] = {
+                "severity": map_zap_severity(alert.get("risk", "info")),
+                "ruleId": plugin_id,
+                "title": alert.get("name") or alert.get("alert") or "Unknown issue",
+                "description": alert.get("description", "No description"),
+                "remediation": alert.get("solution", ""),
+                "cwe": alert.get("cweid"),
+                "url": alert.get("url", ""),
+                "evidence": alert.get("evidence", ""),
+                "instances": [],
+                "instance_count": 0
+            }
+        finding["instance_count"] += 1
+        if len(finding["instances"]) < DAST_MAX_INSTANCES:
+            finding["instances"].append({
+                "url": alert.get("url", ""),
+                "method": alert.get("method", ""),
+                "param": alert.get("param", ""),
+                "evidence": alert.get("evidence", "")
+            })
+        return finding
+
+    def findings(self) -> List[Dict[str, Any]]:
+        return list(self.groups.values())
+
+    def __len__(self) -> int:
+        return len(self.groups)
+
+# callback התקדמות של הסריקה הנוכחית (run_dast_scan), בנוסף לפרסום ב-Redis
+_progress_callback: ContextVar[Optional[Callable[[Dict[str, Any]], None]]] = ContextVar(
+    "dast_progress_callback", default=None
+)
+
+async def publish_event(project_id: str, event: Dict[str, Any]):
+    """פרסום הודעה בערוץ הסריקה של הפרויקט, ב-thread כדי לא לעכב את לולאת האירועים"""
+    await asyncio.to_thread(redis_client.publish, f"scan:{project_id}", json.dumps(event))
+    callback = _progress_callback.get()
+    if callback and event.get("message"):
+        callback({
+            "status": event.get("status"),
+            "logs": [{
+                "timestamp": datetime.now().isoformat(),
+                "level": "error" if event.get("type") == "error" else "info",
+                "message": event["message"]
+            }]
+        })
+
+def publish_findings(project_id: str, findings: List[Dict[str, Any]]):
+    """פרסום ממצאים ב-Redis בקבוצות של DAST_FINDING_BATCH"""
+    for i in range(0, len(findings), DAST_FINDING_BATCH):
         redis_client.publish(
             f"scan:{project_id}",
             json.dumps({
-                "type": "progress",
-                "status": "starting",
+                "type": "findings",
+                "tool": "zap",
                 "projectId": project_id,
-                "message": "מתחיל סריקת DAST..."
+                "findings": findings[i:i + DAST_FINDING_BATCH]
             })
         )
+
+class AlertFeed:
+    """
+    שליפה מצטברת של התראות ZAP ופרסומן בזמן שהסריקה רצה
+
+    כל drain שולף בדפים רק את ההתראות שמעבר לסמן (offset) של הקריאה הקודמת,
+    מדלג על התראות שה-id שלהן כבר נראה (ZAP ממספר התראות בסדר עולה), ומפרסם את
+    הממצאים שנוספו או שהתעדכנו. הסמן מתחיל במצב ההתראות של המטרה בזמן הקצאת
+    השרת, כך שהתראות של סריקות קודמות על אותו שרת לא מתפרסמות שוב. ממצא עשוי להתפרסם שוב עם מופעים נוספים - הצרכנים
+    מחליפים ממצא קודם עם אותו ruleId. הזיכרון חסום: נשמרים רק הסמן, ה-id האחרון
+    וממצא אחד לכל plugin.
+    """
+
+    def __init__(self, zap: ZapLease, target_url: str, project_id: str):
+        self.zap = zap
+        self.target_url = target_url
+        self.project_id = project_id
+        self.groups = AlertGroups()
+        self.offset = zap.alert_start
+        self.last_id = zap.alert_id
+
+    async def drain(self) -> int:
+        """שליפת ההתראות החדשות ופרסום הממצאים שהשתנו; מוחזר מספר ההתראות החדשות"""
+        changed: Dict[str, Dict[str, Any]] = {}
+        new_alerts = 0
+        # רק של המטרה הזו, לא של סריקות אחרות על אותו שרת
+        async for page in self.zap.client.alert_pages(self.target_url, start=self.offset):
+            # הסמן מתקדם בכל הדף, כולל התראות שדולגו לפי ה-id, כדי שהשליפה הבאה לא תחזור עליהן
+            self.offset += len(page)
+            for alert in page:
+                current_id = alert_id(alert)
+                if current_id <= self.last_id:
+                    continue
+                if str(alert.get("id", "")).isdigit():
+                    self.last_id = current_id
+                finding = self.groups.add(alert)
+                changed[finding["ruleId"]] = finding
+                new_alerts += 1
+        await asyncio.to_thread(publish_findings, self.project_id, list(changed.values()))
+        return new_alerts
+
+async def run_dast_async(project_id: str, url: str, max_duration: Optional[float] = None) -> Dict[str, Any]:
+    """
+    הרצת סריקת אבטחה דינמית מלאה על שרת ZAP מוקצה
+
+    :param max_duration: משך הסריקה המקסימלי בשניות (max_scan_duration של התוכנית)
+    :return: סטטוס הסריקה והממצאים (ממצא לכל plugin), כפי שפורסמו גם ב-Redis
+    """
+    deadline = time.monotonic() + max_duration if max_duration else None
+    # מזהה הריצה: לבקשות ביטול ולהקצאת שרת ה-ZAP
+    run_id = f"{project_id}-{uuid.uuid4().hex[:8]}"
+    await asyncio.to_thread(register_run, project_id, run_id, max_duration)
+    feed: Optional[AlertFeed] = None
+    result: Dict[str, Any] = {"success": False, "status": "error"}
+    try:
+        # עדכון סטטוס התחלת הסריקה
+        await publish_event(project_id, {
+            "type": "progress",
+            "status": "starting",
+            "projectId": project_id,
+            "message": "מתחיל סריקת DAST..."
+        })
         
-        # התחלת סשן ZAP
-        start_zap_session(url)
-        
-        # הרצת Spider לגילוי תוכן
-        run_spider(url, project_id)
-        
-        # הרצת סריקה אקטיבית
-        findings = run_active_scan(url, project_id)
-        
-        # עיבוד וחיווי הממצאים
-        for finding in findings:
-            mapped_finding = {
-                "severity": map_zap_severity(finding.get("risk", "info")),
-                "ruleId": finding.get("pluginId", "unknown"),
-                "title": finding.get("name", "Unknown issue"),
-                "description": finding.get("description", "No description"),
-                "url": finding.get("url", ""),
-                "evidence": finding.get("evidence", "")
-            }
+        # המתנה לשרת ZAP פנוי; הקונטקסט והשרת משתחררים בסוף הסריקה גם אם היא נכשלה
+        async with zap_pool.lease(run_id, url) as zap:
+            # התחלת סשן ZAP
+            await start_zap_session(zap, url)
             
-            # פרסום הממצא
-            redis_client.publish(
-                f"scan:{project_id}",
-                json.dumps({
-                    "type": "finding",
-                    "tool": "zap",
-                    "projectId": project_id,
-                    "finding": mapped_finding
-                })
-            )
+            # הממצאים (ממצא לכל plugin, עם המופעים שלו) מתפרסמים כבר במהלך הסריקה
+            feed = AlertFeed(zap, url, project_id)
+            
+            # הרצת Spider לגילוי תוכן
+            await run_spider(zap, url, project_id, deadline, feed, run_id)
+            
+            # הרצת סריקה אקטיבית
+            findings_count = await run_active_scan(zap, url, project_id, deadline, feed, run_id)
         
         # עדכון סטטוס סיום הסריקה
-        redis_client.publish(
-            f"scan:{project_id}",
-            json.dumps({
-                "type": "progress",
-                "status": "completed",
-                "projectId": project_id,
-                "message": "סריקת DAST הושלמה",
-                "findings_count": len(findings)
-            })
-        )
-        
+        await publish_event(project_id, {
+            "type": "progress",
+            "status": "completed",
+            "projectId": project_id,
+            "message": "סריקת DAST הושלמה",
+            "findings_count": findings_count
+        })
+        result = {"success": True, "status": "completed"}
+    
+    except DastScanStopped as e:
+        logger.info(f"סריקת DAST של {project_id} נעצרה: {str(e)}")
+        result = {"success": False, "status": "cancelled" if e.reason == "cancelled" else "error", "error": str(e)}
+        await publish_event(project_id, {
+            "type": "progress" if e.reason == "cancelled" else "error",
+            "status": "cancelled" if e.reason == "cancelled" else "error",
+            "projectId": project_id,
+            "message": str(e)
+        })
+    
     except Exception as e:
+        result = {"success": False, "status": "error", "error": str(e)}
         # דיווח על שגיאה
-        redis_client.publish(
-            f"scan:{project_id}",
-            json.dumps({
-                "type": "error",
-                "status": "error",
-                "projectId": project_id,
-                "message": f"שגיאה בסריקת DAST: {str(e)}"
-            })
-        ) 
\ No newline at end of file
+        await publish_event(project_id, {
+            "type": "error",
+            "status": "error",
+            "projectId": project_id,
+            "message": f"שגיאה בסריקת DAST: {str(e)}"
+        })
+
+    finally:
+        await asyncio.to_thread(unregister_run, project_id, run_id)
+
+    result["findings"] = feed.groups.findings() if feed else []
+    return result
+
+async def run_dast_scan(
+    target: str,
+    parameters: Optional[Dict[str, Any]] = None,
+    progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> Dict[str, Any]:
+    """
+    הרצת סריקת DAST בחתימה המשותפת לסורקים (target, parameters, progress_callback)
+
+    מתאם ל-run_dast_async עבור הסריקה המשולבת ו-scan-worker: מזהה הפרויקט
+    (לערוץ ה-Redis ולביטול) נלקח מ-project_id או scan_id שבפרמטרים, ועדכוני
+    ההתקדמות מועברים גם ל-progress_callback.
+    """
+    parameters = parameters or {}
+    project_id = str(parameters.get("project_id") or parameters.get("scan_id") or uuid.uuid4().hex)
+    token = _progress_callback.set(progress_callback)
+    try:
+        return await run_dast_async(project_id, target, parameters.get("max_scan_duration"))
+    finally:
+        _progress_callback.reset(token)
+
+def run_dast(project_id: str, url: str, max_duration: Optional[float] = None):
+    """הרצת סריקת DAST מקוד סינכרוני (למשל משימת רקע של FastAPI, שרצה ב-thread משלה)"""
+    asyncio.run(run_dast_async(project_id, url, max_duration))
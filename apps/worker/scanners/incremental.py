@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+סריקת SAST אינקרמנטלית - סריקה רק של קבצים שהשתנו מאז הסריקה הקודמת
+
+לכל פרויקט וענף נשמר בסיס (baseline): ה-commit האחרון שנסרק והממצאים
+שנמצאו בו. בסריקה הבאה מחושב ה-diff מול אותו commit, הכלים רצים רק על
+הקבצים שהשתנו (ועבור semgrep גם על הקבצים שתלויים בהם), והממצאים של
+הקבצים שלא השתנו מועברים מהבסיס הקודם.
+"""
+
+import os
+import re
+import json
+import zlib
+import base64
+import hashlib
+import logging
+import tempfile
+import subprocess
+from typing import Dict, Iterable, List, Any, Optional, Set, Tuple
+from tools.repo_index import RepoIndex
+
+logger = logging.getLogger('sast-incremental')
+
+# מעל מספר קבצים זה סריקה מלאה זולה יותר מרשימת קבצים ארוכה בשורת הפקודה
+INCREMENTAL_MAX_FILES = int(os.getenv("SAST_INCREMENTAL_MAX_FILES", 2000))
+BASELINE_DIR = os.getenv("SAST_BASELINE_DIR", os.path.join(tempfile.gettempdir(), "arxio-sast-baselines"))
+BASELINE_TTL = 30 * 24 * 3600
+
+# כלים שמנתחים זרימת מידע בין קבצים, ולכן צריכים לקבל גם את הקבצים התלויים
+CROSS_FILE_SCANNERS = {"semgrep"}
+
+_LOCATION_RE = re.compile(r'^(?P<path>.*?):(?P<rest>\d+(?::\d+)?|None(?::None)?)$')
+
+# תבניות ייבוא לזיהוי קבצים שתלויים בקבצים שהשתנו
+_IMPORT_PATTERNS = [
+    re.compile(r'^\s*(?:from\s+([\w.]+)\s+import|import\s+([\w.]+))', re.MULTILINE),           # python
+    re.compile(r'''(?:import\s[^'"]*?from\s*|require\(\s*|import\(\s*)['"]([^'"]+)['"]'''),      # js/ts
+    re.compile(r'^\s*import\s+(?:static\s+)?([\w.]+)\s*;', re.MULTILINE),                       # java
+    re.compile(r'''^\s*(?:require|include)(?:_once)?\s*\(?\s*['"]([^'"]+)['"]''', re.MULTILINE),  # php
+    re.compile(r'^\s*(?:import\s+)?"([\w./-]+)"', re.MULTILINE),                                  # go
+]
+
+
+def _git(target_dir: str, *args) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=target_dir, check=True,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    ).stdout
+
+
+def get_head_commit(target_dir: str) -> Optional[str]:
+    """ה-commit הנוכחי של עותק העבודה, או None אם זו אינה תיקיית git"""
+    try:
+        return _git(target_dir, "rev-parse", "HEAD").strip()
+    except (subprocess.SubprocessError, OSError):
+        return None
+
+
+def changed_files_since(target_dir: str, base_commit: str) -> Optional[Tuple[Set[str], Set[str]]]:
+    """
+    קבצים שהשתנו ושנמחקו בין base_commit ל-HEAD (נתיבים יחסיים לשורש המאגר)
+
+    :return: (changed, deleted), או None אם לא ניתן לחשב diff (למשל אחרי force push)
+    """
+    try:
+        output = _git(target_dir, "diff", "--name-status", "--no-renames", "-z", base_commit, "HEAD")
+    except (subprocess.SubprocessError, OSError) as e:
+        logger.warning(f"לא ניתן לחשב diff מול {base_commit}: {str(e)}")
+        return None
+
+    changed, deleted = set(), set()
+    parts = output.split("\0")
+    for status, path in zip(parts[0::2], parts[1::2]):
+        if status.startswith("D"):
+            deleted.add(path)
+        elif path:
+            changed.add(path)
+    return changed, deleted
+
+
+def _module_names(path: str) -> Set[str]:
+    """שמות אפשריים שבהם קבצים אחרים מייבאים את הקובץ"""
+    stem = os.path.splitext(path)[0]
+    names = {os.path.basename(stem)}
+    if os.path.basename(stem) in ("__init__", "index"):
+        names.add(os.path.basename(os.path.dirname(stem)))
+    names.add(stem.replace(os.sep, "."))
+    return {name for name in names if name}
+
+
+def find_dependents(
+    target_dir: str,
+    changed: Set[str],
+    extensions: List[str],
+    candidates: Optional[Iterable[str]] = None
+) -> Set[str]:
+    """
+    איתור קבצים שמייבאים את אחד הקבצים שהשתנו
+
+    זוהי היוריסטיקה לפי שם המודול בהצהרות import/require, שמספיקה כדי לתת
+    לכלים בין-קבציים את ההקשר של הקבצים שהשתנו.
+
+    :param candidates: הקבצים שנבדקים (ברירת מחדל: כל הקבצים ב-git)
+    """
+    targets = set()
+    for path in changed:
+        targets |= _module_names(path)
+    if not targets:
+        return set()
+
+    dependents = set()
+    if candidates is None:
+        candidates = _git(target_dir, "ls-files", "-z").split("\0")
+    for path in candidates:
+        if not path or path in changed or os.path.splitext(path)[1] not in extensions:
+            continue
+        try:
+            with open(os.path.join(target_dir, path), "r", errors="ignore") as f:
+                content = f.read()
+        except OSError:
+            continue
+        for pattern in _IMPORT_PATTERNS:
+            for match in pattern.finditer(content):
+                imported = next((group for group in match.groups() if group), "")
+                candidates = {imported, imported.split(".")[-1], os.path.basename(imported.rstrip("/"))}
+                candidates |= {os.path.splitext(os.path.basename(imported))[0]}
+                if candidates & targets:
+                    dependents.add(path)
+                    break
+            if path in dependents:
+                break
+    return dependents
+
+
+def split_location(location: str) -> Tuple[str, str]:
+    """פירוק location בפורמט path:line[:column] לנתיב ולשאר"""
+    match = _LOCATION_RE.match(location or "")
+    if not match:
+        return location or "", ""
+    return match.group("path"), match.group("rest")
+
+
+def relativize_finding(finding: Dict[str, Any], target_dir: str) -> Dict[str, Any]:
+    """המרת נתיב הממצא לנתיב יחסי לשורש המאגר (עותק העבודה משתנה בין סריקות)"""
+    path, rest = split_location(finding.get("location", ""))
+    prefix = target_dir.rstrip(os.sep) + os.sep
+    if path.startswith(prefix):
+        path = path[len(prefix):]
+    return {**finding, "location": f"{path}:{rest}" if rest else path}
+
+
+def localize_finding(finding: Dict[str, Any], target_dir: str) -> Dict[str, Any]:
+    """המרת נתיב יחסי שנשמר בבסיס לנתיב בתוך עותק העבודה הנוכחי"""
+    path, rest = split_location(finding.get("location", ""))
+    path = os.path.join(target_dir, path)
+    return {**finding, "location": f"{path}:{rest}" if rest else path}
+
+
+class BaselineStore:
+    """
+    שמירת בסיס הסריקה האחרון לכל פרויקט וענף
+
+    כשיש חיבור ל-Redis הבסיס משותף לכל העובדים, אחרת הוא נשמר בקבצים מקומיים.
+    """
+
+    def __init__(self, redis_client=None, root: str = BASELINE_DIR):
+        self.redis_client = redis_client
+        self.root = root
+
+    @staticmethod
+    def key(project: str, branch: str) -> str:
+        return hashlib.sha256(f"{project}@{branch}".encode()).hexdigest()[:32]
+
+    def get(self, project: str, branch: str) -> Optional[Dict[str, Any]]:
+        key = self.key(project, branch)
+        try:
+            if self.redis_client:
+                blob = self.redis_client.get(f"sast:baseline:{key}")
+            else:
+                path = os.path.join(self.root, f"{key}.json.z")
+                blob = None
+                if os.path.exists(path):
+                    with open(path, "rb") as f:
+                        blob = f.read()
+            if not blob:
+                return None
+            return json.loads(zlib.decompress(base64.b64decode(blob)))
+        except Exception as e:
+            logger.warning(f"לא ניתן לקרוא בסיס סריקה עבור {project}@{branch}: {str(e)}")
+            return None
+
+    @staticmethod
+    def encode(baseline: Dict[str, Any]) -> bytes:
+        """
+        JSON דחוס של הבסיס; "findings" יכול להיות כל iterable
+
+        הממצאים מקודדים ונדחסים אחד אחד, כך שרשימת ממצאים גדולה לא נבנית בזיכרון -
+        רק הפלט הדחוס.
+        """
+        compressor = zlib.compressobj()
+        header = json.dumps({name: value for name, value in baseline.items() if name != "findings"})
+        blob = bytearray(compressor.compress((header[:-1] + (", " if header != "{}" else "") + '"findings": [').encode()))
+        for i, finding in enumerate(baseline.get("findings", ())):
+            blob += compressor.compress(((", " if i else "") + json.dumps(finding)).encode())
+        blob += compressor.compress(b"]}")
+        blob += compressor.flush()
+        return bytes(blob)
+
+    def put(self, project: str, branch: str, baseline: Dict[str, Any]):
+        key = self.key(project, branch)
+        # base64 כדי שהערך יעבור גם דרך client עם decode_responses=True
+        blob = base64.b64encode(self.encode(baseline))
+        try:
+            if self.redis_client:
+                self.redis_client.set(f"sast:baseline:{key}", blob, ex=BASELINE_TTL)
+            else:
+                os.makedirs(self.root, exist_ok=True)
+                tmp_path = os.path.join(self.root, f"{key}.json.z.tmp")
+                with open(tmp_path, "wb") as f:
+                    f.write(blob)
+                os.replace(tmp_path, os.path.join(self.root, f"{key}.json.z"))
+        except Exception as e:
+            logger.warning(f"לא ניתן לשמור בסיס סריקה עבור {project}@{branch}: {str(e)}")
+
+
+def plan_incremental_scan(
+    target_dir: str,
+    baseline: Optional[Dict[str, Any]],
+    scanners: List[str],
+    supported_scanners: Dict[str, Dict[str, Any]],
+    rulesets: Optional[Dict[str, str]] = None,
+    index: Optional[RepoIndex] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    תכנון סריקה אינקרמנטלית מול הבסיס הקודם
+
+    :param rulesets: גרסת החוקים של כל כלי - בסיס שנסרק בחוקים אחרים לא נמשך הלאה
+    :param index: אינדקס הקבצים של המאגר - קבצים שהוא מחריג לא נסרקים
+
+    :return: None אם נדרשת סריקה מלאה, אחרת מילון עם:
+             files - רשימת קבצים (נתיבים מלאים) לכל כלי; כלי שאין לו קבצים לא ירוץ
+             carried_findings - ממצאים מהבסיס עבור קבצים שלא נסרקים מחדש
+             changed, deleted - הקבצים שהשתנו ושנמחקו
+    """
+    if not baseline or sorted(baseline.get("scanners", [])) != sorted(scanners):
+        return None
+    if rulesets is not None and baseline.get("rulesets") != rulesets:
+        logger.info("גרסת החוקים השתנתה מאז הסריקה הקודמת - מבצע סריקה מלאה")
+        return None
+
+    diff = changed_files_since(target_dir, baseline["commit"])
+    if diff is None:
+        return None
+    changed, deleted = diff
+    if index is not None:
+        # קבצים בתיקיות מוחרגות (node_modules, vendor וכו') או ב-.gitignore לא נסרקים גם כשהשתנו
+        changed = {path for path in changed if path in index}
+    if len(changed) > INCREMENTAL_MAX_FILES:
+        logger.info(f"{len(changed)} קבצים השתנו - מבצע סריקה מלאה")
+        return None
+
+    files: Dict[str, List[str]] = {}
+    rescanned: Dict[str, Set[str]] = {}
+    for scanner in scanners:
+        extensions = supported_scanners[scanner]["extensions"]
+        scanner_files = {path for path in changed if os.path.splitext(path)[1] in extensions}
+        if scanner in CROSS_FILE_SCANNERS and scanner_files:
+            scanner_files |= find_dependents(
+                target_dir, scanner_files, extensions, index.paths(extensions) if index is not None else None
+            )
+        rescanned[scanner] = scanner_files
+        if scanner_files:
+            files[scanner] = sorted(os.path.join(target_dir, path) for path in scanner_files)
+
+    # ממצאים של קבצים שנסרקים מחדש או שנמחקו מוחלפים; כל השאר מועברים כמו שהם
+    carried_findings = []
+    for finding in baseline.get("findings", []):
+        path, _ = split_location(finding.get("location", ""))
+        if path in deleted or path in rescanned.get(finding.get("scanner"), ()):
+            continue
+        carried_findings.append(localize_finding(finding, target_dir))
+
+    return {
+        "files": files,
+        "carried_findings": carried_findings,
+        "changed": sorted(changed),
+        "deleted": sorted(deleted),
+    }
@@ -0,0 +1,88 @@
+"""
+הגדרות תוכניות המשתמש (free/pro/enterprise) והמגבלות של כל תוכנית
+
+המגבלות משמשות גם את בדיקת ההרשאות בסריקה המשולבת וגם את מתזמן
+הסריקות, שאוכף את מספר הסריקות המקבילות ואת משך הסריקה המקסימלי.
+"""
+
+import os
+import time
+import logging
+from typing import Dict, Optional, Tuple
+
+import requests
+
+logger = logging.getLogger('scan-plans')
+
+# הגדרות תוכניות המשתמש והמגבלות
+USER_PLAN_LIMITS = {
+    "free": {
+        "allowed_scans": ["dast"],  # רק סריקת DAST בסיסית
+        "max_scans_per_month": 5,
+        "max_concurrent_scans": 1,
+        "max_scan_duration": 600,  # 10 דקות
+        "description": "תוכנית חינמית - מוגבל לסריקות DAST בסיסיות"
+    },
+    "pro": {
+        "allowed_scans": ["dast", "sast", "api"],  # כל סוגי הסריקות
+        "max_scans_per_month": 50,
+        "max_concurrent_scans": 3,
+        "max_scan_duration": 1800,  # 30 דקות
+        "description": "תוכנית מקצועית - כולל סריקות SAST, DAST, ו-API"
+    },
+    "enterprise": {
+        "allowed_scans": ["dast", "sast", "api"],  # כל סוגי הסריקות
+        "max_scans_per_month": 0,  # ללא הגבלה
+        "max_concurrent_scans": 10,
+        "max_scan_duration": 7200,  # 2 שעות
+        "description": "תוכנית ארגונית - ללא הגבלות משמעותיות"
+    }
+}
+
+# התוכנית נקבעת בצד השרת מטבלת users ב-Supabase, ולא לפי מה שנשלח בבקשה,
+# כדי שלקוח לא יוכל להצהיר על עצמו כ-enterprise
+SUPABASE_URL = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
+SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
+DEFAULT_PLAN = "free"
+# זמן שמירת תוכנית שנקראה בזיכרון, כדי שכל סריקה לא תפנה ל-Supabase
+PLAN_CACHE_SECONDS = int(os.getenv("PLAN_CACHE_SECONDS", 60))
+
+_plan_cache: Dict[str, Tuple[str, float]] = {}
+
+
+def resolve_plan(user_id: Optional[str]) -> str:
+    """
+    התוכנית של המשתמש כפי שהיא שמורה בטבלת users
+
+    משתמש לא מזוהה, משתמש שלא נמצא, תוכנית לא מוכרת או שגיאה בגישה
+    ל-Supabase מקבלים את תוכנית ברירת המחדל (free).
+
+    :param user_id: מזהה המשתמש שביקש את הסריקה
+    :return: שם התוכנית
+    """
+    if not user_id or not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
+        return DEFAULT_PLAN
+
+    cached = _plan_cache.get(user_id)
+    if cached and time.monotonic() - cached[1] < PLAN_CACHE_SECONDS:
+        return cached[0]
+
+    try:
+        response = requests.get(
+            f"{SUPABASE_URL.rstrip('/')}/rest/v1/users",
+            params={"id": f"eq.{user_id}", "select": "plan"},
+            headers={"apikey": SUPABASE_SERVICE_KEY, "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}"},
+            timeout=10
+        )
+        response.raise_for_status()
+        rows = response.json()
+    except (requests.RequestException, ValueError) as e:
+        logger.error(f"שגיאה בקריאת תוכנית המשתמש {user_id}: {str(e)}")
+        # שגיאה זמנית לא נשמרת, כדי שהבקשה הבאה תנסה שוב
+        return DEFAULT_PLAN
+
+    plan = rows[0].get("plan") if rows else None
+    if plan not in USER_PLAN_LIMITS:
+        plan = DEFAULT_PLAN
+    _plan_cache[user_id] = (plan, time.monotonic())
+    return plan
@@ -15,12 +15,30 @@ import re
 import json
 import time
 import logging
-import tempfile
 import subprocess
+import resource
+import uuid
+import contextvars
+import ijson
 import redis
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
-from git import Repo
-from typing import Dict, List, Any, Callable, Optional
+from tools.repo_cache import get_repo_cache
+from tools.finding_cache import get_finding_cache, hash_file
+from tools.process_stream import ProcessStream
+from tools.semgrep_rules import get_rule_store
+from tools.repo_index import RepoIndex, REPO_INDEX_EXCLUDES
+from tools.findings_table import FindingTable, FindingSummary
+from tools.parsers import iter_report_items, semgrep_error_paths
+from tools.fingerprints import FingerprintIndex, FingerprintStore, diff_fingerprints
+from tools.job_queue import ScanJobQueue
+from scanners.sharding import (
+    SAST_SHARD_MIN_FILES, SAST_SHARD_HELPERS, ShardStore, get_redis_client, merge_shard_results, plan_shards, process_shards
+)
+from scanners.incremental import (
+    BaselineStore, get_head_commit, plan_incremental_scan, relativize_finding, localize_finding, split_location
+)
+from typing import Dict, List, Any, Callable, Iterable, Iterator, Optional, Set, Tuple
 
 # קביעת רמת רישום לוג
 logging.basicConfig(
@@ -44,34 +62,62 @@ def publish_progress(channel: str, data: Dict[str, Any]):
     if redis_client:
         redis_client.publish(channel, json.dumps(data))
 
+# חוקי semgrep נלקחים מחבילת החוקים המקומית (tools/semgrep_rules) לפי השפות שזוהו.
+# רק כשאין חבילה מותקנת semgrep מקבל את SEMGREP_CONFIG ומושך את החוקים בעצמו בזמן הסריקה
+SEMGREP_CONFIG = os.getenv("SAST_SEMGREP_CONFIG", "auto")
+
 # כלי סריקה פתוחים שנתמכים
+# scan_cmd מקבל את תיקיית היעד, ואופציונלית רשימת קבצים מפורשת לסריקה (בסריקה אינקרמנטלית)
+# ואת השפות שזוהו בפרויקט. exclude_args מחריג את התיקיות שהאינדקס מדלג עליהן כשהכלי סורק את כל התיקייה
+# כל הכלים כותבים את דו"ח ה-JSON ל-stdout, שנקרא ישירות מה-pipe בזמן שהכלי רץ
 SUPPORTED_SCANNERS = {
     "bandit": {
         "cmd": "bandit",
         "extensions": [".py"],
         "languages": ["python"],
-        "scan_cmd": lambda target_dir: ["bandit", "-r", target_dir, "-f", "json", "-o", f"{target_dir}/bandit_results.json"]
+        "max_memory_mb": 1024,
+        "max_cpu_seconds": 600,
+        # קודי יציאה של ריצה שהושלמה (גם כשנמצאו בעיות); ריצה אחרת לא נשמרת במטמון
+        "ok_exit_codes": (0, 1),
+        "scan_cmd": lambda target_dir, paths=None, languages=(): ["bandit", "-r", *(paths or [target_dir]), "-f", "json"],
+        "exclude_args": lambda dirs: ["-x", ",".join(f"*/{name}/*" for name in dirs)]
     },
     "semgrep": {
         "cmd": "semgrep",
         "extensions": [".py", ".js", ".ts", ".jsx", ".tsx", ".go", ".java", ".php"],
         "languages": ["python", "javascript", "typescript", "go", "java", "php"],
-        "scan_cmd": lambda target_dir: ["semgrep", "--config", "auto", "--json", "-o", f"{target_dir}/semgrep_results.json", target_dir]
+        "max_memory_mb": 4096,
+        "max_cpu_seconds": 1800,
+        "ok_exit_codes": (0, 1),
+        "scan_cmd": lambda target_dir, paths=None, languages=(): ["semgrep", *semgrep_config_args(languages), "--json", "--disable-version-check", *(paths or [target_dir])],
+        "exclude_args": lambda dirs: [arg for name in dirs for arg in ("--exclude", name)]
     },
     "eslint": {
         "cmd": "eslint",
         "extensions": [".js", ".jsx", ".ts", ".tsx"],
         "languages": ["javascript", "typescript"],
-        "scan_cmd": lambda target_dir: ["eslint", "-c", ".eslintrc.js", "--format", "json", "-o", f"{target_dir}/eslint_results.json", target_dir]
+        # V8 שומר מרחב כתובות וירטואלי גדול מראש, ולכן מגבלת RLIMIT_AS שוברת את node
+        "max_memory_mb": None,
+        "max_cpu_seconds": 900,
+        "ok_exit_codes": (0, 1),
+        "scan_cmd": lambda target_dir, paths=None, languages=(): ["eslint", "-c", ".eslintrc.js", "--format", "json", *(paths or [target_dir])],
+        "exclude_args": lambda dirs: [arg for name in dirs for arg in ("--ignore-pattern", f"**/{name}/**")]
     },
     "phpcs": {
         "cmd": "phpcs",
         "extensions": [".php"],
         "languages": ["php"],
-        "scan_cmd": lambda target_dir: ["phpcs", "--standard=PSR2", "--report=json", f"{target_dir}", "-o", f"{target_dir}/phpcs_results.json"]
+        "max_memory_mb": 1024,
+        "max_cpu_seconds": 600,
+        "ok_exit_codes": (0, 1, 2),
+        "scan_cmd": lambda target_dir, paths=None, languages=(): ["phpcs", "--standard=PSR2", "--report=json", *(paths or [f"{target_dir}"])],
+        "exclude_args": lambda dirs: [f"--ignore={','.join(f'*/{name}/*' for name in dirs)}"]
     }
 }
 
+# מעל מספר קבצים זה הכלי מקבל את כל התיקייה במקום רשימת קבצים בשורת הפקודה
+MAX_EXPLICIT_FILES = int(os.getenv("SAST_MAX_EXPLICIT_FILES", 2000))
+
 # מיפוי רמות חומרה בין כלים שונים למודל האחיד שלנו
 SEVERITY_MAPPING = {
     "bandit": {
@@ -96,51 +142,34 @@ SEVERITY_MAPPING = {
     }
 }
 
-def clone_repository(repo_url: str, branch: str = "main") -> str:
+def clone_repository(repo_url: str, branch: str = "main", commit: Optional[str] = None) -> str:
     """
     מוריד את קוד המקור מה-repo המבוקש ומחזיר נתיב לתיקייה המקומית
+    
+    :param commit: commit מסוים במקום ראש הענף (למשל כדי שכל ה-shards של סריקה יסרקו אותו קוד)
     """
     logger.info(f"מוריד קוד מהמאגר: {repo_url}, ענף: {branch}")
-    temp_dir = tempfile.mkdtemp(prefix="sast_scan_")
     
     try:
-        repo = Repo.clone_from(repo_url, temp_dir, branch=branch)
+        # העותק נוצר מתוך מטמון מקומי של המאגר, כך שרק שינויים חדשים מורדים מהרשת
+        temp_dir = get_repo_cache().checkout(repo_url, branch, prefix="sast_scan_", commit=commit)
         logger.info(f"הקוד הורד בהצלחה לתיקייה: {temp_dir}")
         return temp_dir
     except Exception as e:
         logger.error(f"שגיאה בהורדת הקוד: {str(e)}")
         raise
 
-def detect_language(target_dir: str) -> List[str]:
-    """
-    זיהוי שפות תכנות בפרויקט לפי סוגי קבצים
-    """
-    language_extensions = {
-        ".py": "python",
-        ".js": "javascript",
-        ".jsx": "javascript",
-        ".ts": "typescript",
-        ".tsx": "typescript",
-        ".go": "go",
-        ".java": "java",
-        ".php": "php",
-        ".rb": "ruby",
-        ".c": "c",
-        ".cpp": "cpp",
-        ".cs": "csharp",
-        ".swift": "swift",
-        ".kt": "kotlin"
-    }
-    
-    languages = set()
-    
-    for root, _, files in os.walk(target_dir):
-        for file in files:
-            _, ext = os.path.splitext(file)
-            if ext in language_extensions:
-                languages.add(language_extensions[ext])
-    
-    return list(languages)
+def release_repository(target_dir: str):
+    """
+    מחיקת עותק העבודה שנוצר על ידי clone_repository בסיום הסריקה
+    """
+    get_repo_cache().release(target_dir)
+
+def detect_language(target_dir: str, index: Optional[RepoIndex] = None) -> List[str]:
+    """
+    זיהוי שפות תכנות בפרויקט לפי סוגי קבצים (מתוך אינדקס הקבצים של המאגר)
+    """
+    return (index or RepoIndex.build(target_dir)).languages
 
 def select_scanners(languages: List[str]) -> List[str]:
     """
@@ -151,113 +180,526 @@ def select_scanners(languages: List[str]) -> List[str]:
     for scanner, info in SUPPORTED_SCANNERS.items():
         if any(lang in info["languages"] for lang in languages):
             # בדיקה אם הכלי מותקן
-            try:
-                subprocess.run([info["cmd"], "--version"], 
-                               stdout=subprocess.DEVNULL, 
-                               stderr=subprocess.DEVNULL, 
-                               check=True)
+            if get_tool_version(scanner) is not None:
                 selected.append(scanner)
-            except (subprocess.SubprocessError, FileNotFoundError):
+            else:
                 logger.warning(f"כלי הסריקה {scanner} לא מותקן, דלג על סריקה זו")
     
     return selected
 
-def run_scanner(scanner: str, target_dir: str) -> Dict[str, Any]:
+# גרסאות הכלים המותקנים (None לכלי שאינו מותקן), מתגלות פעם אחת לכל תהליך
+_tool_versions: Dict[str, Optional[str]] = {}
+
+def _probe_tool_version(scanner: str) -> Optional[str]:
+    try:
+        process = subprocess.run([SUPPORTED_SCANNERS[scanner]["cmd"], "--version"],
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.DEVNULL,
+                                 text=True,
+                                 timeout=60,
+                                 check=True)
+        return process.stdout.strip()
+    except (subprocess.SubprocessError, FileNotFoundError):
+        return None
+
+def get_tool_version(scanner: str) -> Optional[str]:
+    """
+    גרסת כלי הסריקה (פלט --version), או None אם הכלי לא מותקן
+    """
+    if scanner not in _tool_versions:
+        _tool_versions[scanner] = _probe_tool_version(scanner)
+    return _tool_versions[scanner]
+
+def discover_tools() -> Dict[str, Optional[str]]:
+    """
+    גילוי כל כלי הסריקה הנתמכים וגרסאותיהם במקביל - נקרא פעם אחת בעליית העובד
+    """
+    with ThreadPoolExecutor(max_workers=len(SUPPORTED_SCANNERS)) as executor:
+        versions = dict(zip(SUPPORTED_SCANNERS, executor.map(_probe_tool_version, SUPPORTED_SCANNERS)))
+    _tool_versions.update(versions)
+    for scanner, version in versions.items():
+        if version is None:
+            logger.warning(f"כלי הסריקה {scanner} לא מותקן")
+        else:
+            logger.info(f"נמצא כלי סריקה {scanner}: {version.splitlines()[0]}")
+    return versions
+
+def warm_up(tool_versions: Optional[Dict[str, Optional[str]]] = None):
+    """
+    חימום תהליך סריקה לפני הסריקה הראשונה שלו
+    
+    טוען את גרסאות הכלים שהתגלו בעליית העובד (או מגלה אותן מחדש), ומוודא
+    שחבילת חוקי semgrep מותקנת ועדכנית (ובודק את ה-hash שלה), כך שסריקה לא
+    משלמת על הפעלת --version לכל כלי ועל הורדת חוקים מה-registry.
+    """
+    if tool_versions is None:
+        discover_tools()
+    else:
+        _tool_versions.update(tool_versions)
+    if _tool_versions.get("semgrep"):
+        get_rule_store().ensure()
+
+def semgrep_rules(languages: Iterable[str] = ()) -> Tuple[List[str], str]:
+    """
+    קבצי החוקים של semgrep לסריקת השפות הנתונות, ומזהה גרסת החוקים שלהם
+    """
+    bundle = get_rule_store().current()
+    if bundle:
+        return bundle.select(languages)
+    # חוקים שנמשכים מה-registry בזמן הסריקה משתנים עם הזמן, ולכן תוצאות נשמרות ליום אחד
+    return [SEMGREP_CONFIG], f"{SEMGREP_CONFIG}:{datetime.now(timezone.utc).date().isoformat()}"
+
+def semgrep_config_args(languages: Iterable[str] = ()) -> List[str]:
+    configs, _ = semgrep_rules(languages)
+    args = [arg for config in configs for arg in ("--config", config)]
+    # --config auto דורש metrics; חוקים מקומיים לא צריכים אף קריאת רשת
+    return args if configs == [SEMGREP_CONFIG] else args + ["--metrics=off"]
+
+def get_ruleset_id(scanner: str, languages: Iterable[str] = ()) -> str:
+    """
+    מזהה סט החוקים שבו הכלי רץ - נשמר על כל ממצא ומשמש כחלק ממפתח מטמון הממצאים
+    """
+    if scanner == "semgrep":
+        return semgrep_rules(languages)[1]
+    if scanner == "eslint":
+        # קובץ ההגדרות נטען מתיקיית העבודה של העובד
+        config = os.path.abspath(".eslintrc.js")
+        return hash_file(config) if os.path.exists(config) else "no-config"
+    if scanner == "phpcs":
+        return "PSR2"
+    return "default"
+
+def apply_resource_limits(pid: int, max_memory_mb: Optional[int], max_cpu_seconds: Optional[int]):
+    """
+    הגבלת הזיכרון וזמן המעבד של תהליך סורק שכבר רץ
+    
+    preexec_fn אינו בטוח לשימוש כשיש threads נוספים בתהליך, ולכן המגבלות
+    מוחלות על התהליך מיד לאחר יצירתו באמצעות prlimit.
+    """
+    if not hasattr(resource, "prlimit"):
+        return
+    try:
+        if max_memory_mb:
+            limit = max_memory_mb * 1024 * 1024
+            resource.prlimit(pid, resource.RLIMIT_AS, (limit, limit))
+        if max_cpu_seconds:
+            resource.prlimit(pid, resource.RLIMIT_CPU, (max_cpu_seconds, max_cpu_seconds))
+    except (OSError, ValueError) as e:
+        logger.warning(f"לא ניתן להחיל מגבלות משאבים על תהליך {pid}: {str(e)}")
+
+def run_scanner(
+    scanner: str,
+    target_dir: str,
+    timeout: Optional[float] = None,
+    files: Optional[List[str]] = None,
+    languages: Iterable[str] = ()
+) -> Dict[str, Any]:
     """
     הרצת כלי סריקה ספציפי והחזרת התוצאות
+    
+    :param timeout: זמן ריצה מקסימלי (שניות) לפני שהסורק נעצר
+    :param files: רשימת קבצים לסריקה במקום כל התיקייה
+    :param languages: השפות שזוהו בפרויקט, לבחירת החוקים
     """
-    logger.info(f"מריץ סריקת {scanner} על התיקייה {target_dir}")
+    logger.info(f"מריץ סריקת {scanner} על התיקייה {target_dir}" + (f" ({len(files)} קבצים)" if files else ""))
     scanner_info = SUPPORTED_SCANNERS[scanner]
-    cmd = scanner_info["scan_cmd"](target_dir)
+    cmd = scanner_info["scan_cmd"](target_dir, files, languages)
+    if not files:
+        cmd += scanner_info["exclude_args"](sorted(REPO_INDEX_EXCLUDES))
+    ruleset = get_ruleset_id(scanner, languages)
     
     try:
-        # מריץ את הסורק
-        process = subprocess.run(
-            cmd, 
-            capture_output=True, 
-            text=True, 
-            check=False  # לא לזרוק שגיאה אם הסורק מוצא בעיות
+        # מריץ את הסורק בתוך תקציב הזיכרון וזמן המעבד שהוגדר לו
+        # (קוד יציאה שונה מ-0 לא נחשב שגיאה - הסורק מחזיר אותו כשהוא מוצא בעיות)
+        proc = ProcessStream(
+            cmd,
+            timeout=timeout,
+            on_start=lambda process: apply_resource_limits(
+                process.pid, scanner_info.get("max_memory_mb"), scanner_info.get("max_cpu_seconds")
+            )
         )
-        
-        # בדיקה אם קובץ התוצאות נוצר
-        results_file = f"{target_dir}/{scanner}_results.json"
-        if os.path.exists(results_file):
-            with open(results_file, 'r') as f:
-                results = json.load(f)
-            return {"success": True, "data": results}
-        else:
-            # ניסיון לקרוא את הפלט ישירות
-            try:
-                results = json.loads(process.stdout)
-                return {"success": True, "data": results}
-            except:
-                return {
-                    "success": False, 
-                    "error": f"לא ניתן לקרוא תוצאות מהסורק {scanner}", 
-                    "stdout": process.stdout,
-                    "stderr": process.stderr
-                }
+        try:
+            # הדו"ח נקרא מה-pipe בזמן שהכלי רץ, רשומה אחת בכל פעם, בלי קובץ ביניים
+            # כל ממצא מסומן בגרסת החוקים שהפיקה אותו, ונשמר בטבלה עמודתית
+            failed_files = set()
+            with proc:
+                findings = FindingTable(
+                    {**finding, "ruleset": ruleset}
+                    for finding in normalize_findings(scanner, iter_raw_results(scanner, proc.stdout, failed_files))
+                )
+            return {
+                "success": True,
+                "findings": findings,
+                # רק קבצים שהכלי ניתח עד הסוף, בריצה שהושלמה, נשמרים במטמון הממצאים
+                "cacheable": proc.returncode in scanner_info["ok_exit_codes"],
+                "failed_files": sorted(
+                    os.path.relpath(os.path.join(target_dir, path), target_dir) for path in failed_files
+                )
+            }
+        except ijson.JSONError:
+            return {
+                "success": False, 
+                "error": f"לא ניתן לקרוא תוצאות מהסורק {scanner}", 
+                "stderr": proc.stderr
+            }
+    except subprocess.TimeoutExpired:
+        logger.error(f"סריקת {scanner} חרגה מזמן הריצה המותר ({timeout} שניות)")
+        return {"success": False, "error": f"סריקת {scanner} חרגה מזמן הריצה המותר"}
     except Exception as e:
         logger.error(f"שגיאה בהרצת סריקת {scanner}: {str(e)}")
         return {"success": False, "error": str(e)}
 
-def normalize_findings(scanner: str, raw_results: Dict[str, Any]) -> List[Dict[str, Any]]:
+def time_left(deadline: Optional[float]) -> Optional[float]:
+    """הזמן (בשניות) שנותר עד deadline (זמן epoch), או None כשאין מגבלה"""
+    if deadline is None:
+        return None
+    # לפחות שנייה: timeout של 0 הוא "ללא הגבלה" ב-ProcessStream
+    return max(1.0, deadline - time.time())
+
+def run_scanners(
+    scanners: List[str],
+    target_dir: str,
+    max_workers: Optional[int] = None,
+    deadline: Optional[float] = None,
+    files_by_scanner: Optional[Dict[str, List[str]]] = None,
+    languages: Iterable[str] = ()
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    הרצת מספר כלי סריקה במקביל, והחזרת התוצאה של כל כלי ברגע שהוא מסתיים (לפי סדר הסיום)
+    
+    :param max_workers: מספר הכלים שרצים במקביל (ברירת מחדל: מספר הליבות הזמינות)
+    :param deadline: מועד (זמן epoch) שבו כל הכלים נעצרים; כל כלי מקבל את הזמן שנותר עד אליו
+    :param files_by_scanner: רשימת קבצים מפורשת לכל כלי (כלי שלא מופיע סורק את כל התיקייה)
+    """
+    files_by_scanner = files_by_scanner or {}
+    if max_workers is None:
+        max_workers = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    max_workers = max(1, min(max_workers, len(scanners)))
+    
+    # הכלים עצמם רצים כתהליכים נפרדים, ולכן מספיק pool של threads שממתינים להם.
+    # כל thread מקבל עותק של ה-context, כדי שביטול הסריקה (CancelScope) יעצור גם את הכלים שלו
+    def run_until_deadline(scanner):
+        # הזמן שנותר נמדד כשהכלי מתחיל לרוץ, לא כשהוא נכנס לתור
+        return run_scanner(scanner, target_dir, time_left(deadline), files_by_scanner.get(scanner), languages)
+    
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sast-tool") as executor:
+        futures = {
+            executor.submit(contextvars.copy_context().run, run_until_deadline, scanner): scanner
+            for scanner in scanners
+        }
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+def scan_shard_files(
+    target_dir: str,
+    shard: Dict[str, List[str]],
+    max_workers: Optional[int] = None,
+    deadline: Optional[float] = None,
+    languages: Iterable[str] = ()
+) -> Dict[str, Dict[str, Any]]:
+    """
+    הרצת הכלים על קבצי shard אחד
+
+    :param shard: הקבצים (נתיבים יחסיים) שכל כלי סורק
+    :return: תוצאה לכל כלי, כשהמיקומים בממצאים יחסיים לשורש המאגר (כדי שיתאימו לכל עותק)
+    """
+    files_by_scanner = {
+        scanner: [os.path.join(target_dir, path) for path in files] for scanner, files in shard.items() if files
+    }
+    results = {}
+    for scanner, result in run_scanners(
+        list(files_by_scanner), target_dir, max_workers, deadline, files_by_scanner, languages
+    ):
+        if result["success"]:
+            result = {**result, "findings": [relativize_finding(finding, target_dir) for finding in result["findings"]]}
+        results[scanner] = result
+    return results
+
+def run_sharded_scanners(
+    target: str,
+    branch: str,
+    commit: str,
+    target_dir: str,
+    index: RepoIndex,
+    files_by_scanner: Dict[str, List[str]],
+    max_workers: Optional[int] = None,
+    deadline: Optional[float] = None,
+    languages: Iterable[str] = (),
+    progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+    max_scan_duration: Optional[float] = None,
+    user_id: Optional[str] = None
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    סריקה מבוזרת: חלוקת הקבצים ל-shards, שליחת עבודות עזר לעובדים אחרים, סריקת
+    shards גם בתהליך הנוכחי ומיזוג התוצאות. מחזיר תוצאה אחת לכל כלי, כמו run_scanners.
+
+    :param files_by_scanner: הקבצים (נתיבים יחסיים) שכל כלי צריך לסרוק
+    :param deadline: מועד (זמן epoch) שבו הכלים נעצרים, גם בעבודות העזר
+    :param max_scan_duration: מגבלת הזמן של הסריקה, שעוברת גם לעבודות העזר
+    :param user_id: בעל הסריקה; עבודות העזר נספרות במגבלת הסריקות המקבילות שלו
+    """
+    languages = list(languages)
+    members = {scanner: set(files) for scanner, files in files_by_scanner.items()}
+    groups = plan_shards(index, sorted(set().union(*members.values())))
+    shards = [
+        {scanner: [path for path in group if path in files] for scanner, files in members.items()}
+        for group in groups
+    ]
+    
+    redis_conn = get_redis_client()
+    store = ShardStore(redis_conn, uuid.uuid4().hex)
+    store.publish({
+        "target": target,
+        "branch": branch,
+        "commit": commit,
+        "languages": languages,
+        "max_workers": max_workers,
+        "deadline": deadline
+    }, shards)
+    
+    helpers = min(SAST_SHARD_HELPERS, len(shards) - 1)
+    job_queue = ScanJobQueue(redis_conn)
+    for i in range(helpers):
+        job_queue.enqueue({
+            "scanId": f"{store.session}:{i}",
+            "scanType": "SAST_SHARD",
+            "target": target,
+            "userId": user_id,
+            # לעבודת העזר אין תוכנית משלה - היא רצה במגבלת הזמן של הסריקה שהיא חלק ממנה
+            "parameters": {"shard_session": store.session, "max_scan_duration": max_scan_duration}
+        })
+    logger.info(f"סריקה מבוזרת {store.session}: {len(shards)} shards, {helpers} עבודות עזר")
+    
+    def scan_shard(shard):
+        results = scan_shard_files(target_dir, shard, max_workers, deadline, languages)
+        if progress_callback:
+            progress_callback({
+                "logs": [{
+                    "timestamp": datetime.now(timezone.utc).isoformat(),
+                    "level": "info",
+                    "message": f"סריקה מבוזרת: {store.completed() + 1} מתוך {len(shards)} חלקים הושלמו"
+                }]
+            })
+        return results
+    
+    try:
+        # המתאם סורק shards בעצמו כל עוד יש כאלה בתור, ואחר כך ממתין לעובדי העזר
+        while store.completed() < len(shards):
+            if not process_shards(store, scan_shard):
+                store.requeue_stale(len(shards))
+                time.sleep(1)
+        merged = merge_shard_results(list(store.results().values()))
+    finally:
+        store.cleanup()
+    
+    for scanner, result in merged.items():
+        if result["success"]:
+            result["findings"] = [localize_finding(finding, target_dir) for finding in result["findings"]]
+        yield scanner, result
+
+def run_sast_shard(
+    target: str,
+    parameters: Optional[Dict[str, Any]] = None,
+    progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> Dict[str, Any]:
     """
-    הסבת תוצאות גולמיות למבנה אחיד של ממצאים
+    עבודת עזר של סריקה מבוזרת: מוריד את אותו commit וסורק shards מהתור עד שהוא מתרוקן
+    
+    :param parameters: shard_session - מזהה הסריקה המבוזרת (מ-run_sharded_scanners)
     """
-    findings = []
+    store = ShardStore(get_redis_client(), (parameters or {})["shard_session"])
+    spec = store.spec()
+    if not spec or not store.pending():
+        # הסריקה כבר הסתיימה או שהמתאם ושאר העובדים לקחו את כל ה-shards
+        return {"success": True, "shards": 0}
     
+    target_dir = clone_repository(spec["target"], spec["branch"], spec["commit"])
+    try:
+        processed = process_shards(store, lambda shard: scan_shard_files(
+            target_dir, shard, spec["max_workers"], spec.get("deadline"), spec["languages"]
+        ))
+    finally:
+        release_repository(target_dir)
+    return {"success": True, "shards": processed}
+
+def list_scanner_files(target_dir: str, scanners: List[str], index: Optional[RepoIndex] = None) -> Dict[str, List[str]]:
+    """
+    רשימת הקבצים (נתיבים יחסיים) שכל כלי סורק, לפי סיומות הקבצים שלו
+    """
+    index = index or RepoIndex.build(target_dir)
+    return {scanner: index.paths(SUPPORTED_SCANNERS[scanner]["extensions"]) for scanner in scanners}
+
+def lookup_cached_findings(
+    target_dir: str,
+    files_by_scanner: Dict[str, List[str]],
+    languages: Iterable[str] = (),
+    index: Optional[RepoIndex] = None
+) -> Tuple[Dict[str, List[str]], Dict[str, List[Dict[str, Any]]], Dict[str, Dict[str, str]]]:
+    """
+    חיפוש תוצאות קיימות במטמון הממצאים לפי תוכן הקבצים
+
+    :param files_by_scanner: הקבצים (נתיבים יחסיים) שכל כלי אמור לסרוק
+    :param languages: השפות שזוהו בפרויקט (חלק ממזהה סט החוקים)
+    :param index: אינדקס הקבצים של המאגר - ה-hash של כל קובץ מחושב בו פעם אחת
+    :return: (הקבצים שעדיין צריך לסרוק לכל כלי, ממצאים מהמטמון לכל כלי, מפתחות מטמון לקבצים שייסרקו)
+    """
+    cache = get_finding_cache()
+    file_hashes: Dict[str, str] = {}
+    to_scan: Dict[str, List[str]] = {}
+    cached_findings: Dict[str, List[Dict[str, Any]]] = {}
+    pending_keys: Dict[str, Dict[str, str]] = {}
+
+    for scanner, files in files_by_scanner.items():
+        version, ruleset = get_tool_version(scanner) or "", get_ruleset_id(scanner, languages)
+        keys = {}
+        for rel_path in files:
+            if rel_path not in file_hashes:
+                try:
+                    if index is not None and rel_path in index:
+                        file_hashes[rel_path] = index.hash(rel_path)
+                    else:
+                        file_hashes[rel_path] = hash_file(os.path.join(target_dir, rel_path))
+                except OSError:
+                    continue
+            keys[rel_path] = cache.make_key(scanner, version, ruleset, file_hashes[rel_path])
+
+        hits = cache.get_many(keys.values())
+        to_scan[scanner] = []
+        cached_findings[scanner] = []
+        pending_keys[scanner] = {}
+        for rel_path, key in keys.items():
+            if key in hits:
+                cached_findings[scanner].extend(
+                    localize_finding(
+                        {**finding, "location": f"{rel_path}:{finding['location']}" if finding["location"] else rel_path},
+                        target_dir
+                    )
+                    for finding in hits[key]
+                )
+            else:
+                to_scan[scanner].append(rel_path)
+                pending_keys[scanner][rel_path] = key
+
+    return to_scan, cached_findings, pending_keys
+
+def store_findings_in_cache(
+    target_dir: str,
+    findings: List[Dict[str, Any]],
+    pending_keys: Dict[str, str],
+    failed_files: Iterable[str] = ()
+):
+    """
+    שמירת תוצאות הכלי לכל קובץ שנסרק - כולל קבצים ללא ממצאים
+
+    :param failed_files: קבצים (נתיבים יחסיים) שהכלי דיווח עליהם שגיאה - הם לא נשמרים,
+                         אחרת הם היו נחשבים נקיים בכל הסריקות הבאות
+    """
+    failed = set(failed_files)
+    by_file: Dict[str, List[Dict[str, Any]]] = {rel_path: [] for rel_path in pending_keys if rel_path not in failed}
+    for finding in findings:
+        path, rest = split_location(relativize_finding(finding, target_dir)["location"])
+        if path in by_file:
+            # במטמון נשמר רק המיקום בתוך הקובץ, כדי שאותה רשומה תתאים לכל נתיב
+            by_file[path].append({**finding, "location": rest})
+    get_finding_cache().put_many({pending_keys[path]: entries for path, entries in by_file.items()})
+
+def iter_raw_results(scanner: str, stream, failed_files: Optional[Set[str]] = None) -> Iterator[Any]:
+    """
+    קריאה הדרגתית של דו"ח JSON של כלי סריקה - רשומה גולמית אחת בכל פעם
+
+    כך צריכת הזיכרון לא גדלה עם גודל הדו"ח (דו"חות של semgrep על מאגרים
+    גדולים מגיעים למאות MB).
+
+    :param failed_files: אם הועבר, מתווספים אליו הקבצים שהכלי דיווח שלא הצליח לנתח
+    """
+    if scanner in ("bandit", "semgrep"):
+        if failed_files is None:
+            yield from ijson.items(stream, "results.item", use_float=True)
+            return
+        # רשימת השגיאות נקראת באותו מעבר על ה-pipe
+        for prefix, item in iter_report_items(stream, ("results.item", "errors.item")):
+            if prefix == "results.item":
+                yield item
+            elif scanner == "semgrep":
+                failed_files.update(semgrep_error_paths(item))
+            elif item.get("filename"):
+                failed_files.add(item["filename"])
+    elif scanner == "eslint":
+        # דו"ח eslint הוא מערך של תוצאות לכל קובץ
+        for file_result in ijson.items(stream, "item", use_float=True):
+            if failed_files is not None and any(message.get("fatal") for message in file_result.get("messages", [])):
+                # שגיאת parsing - הקובץ לא נבדק
+                failed_files.add(file_result.get("filePath"))
+            yield file_result
+    elif scanner == "phpcs":
+        # ב-phpcs הרשומות הן זוגות (נתיב קובץ, תוצאות הקובץ)
+        yield from ijson.kvitems(stream, "files", use_float=True)
+
+def semgrep_cwe(cwe: Any) -> Optional[int]:
+    """מספר ה-CWE מהמטא-דאטה של חוק semgrep (מחרוזת או רשימה בפורמט "CWE-89: ...")"""
+    for value in (cwe if isinstance(cwe, list) else [cwe]):
+        match = re.search(r"CWE-(\d+)", str(value or ""))
+        if match:
+            return int(match.group(1))
+    return None
+
+def normalize_findings(scanner: str, raw_results: Iterable[Any]) -> Iterator[Dict[str, Any]]:
+    """
+    הסבת רשומות גולמיות (מ-iter_raw_results) למבנה אחיד של ממצאים
+    """
     if scanner == "bandit":
-        for result in raw_results.get("results", []):
-            findings.append({
+        for result in raw_results:
+            yield {
                 "title": result.get("test_name", "Unknown Issue"),
                 "description": result.get("issue_text", ""),
                 "severity": SEVERITY_MAPPING["bandit"].get(result.get("issue_severity", "MEDIUM"), "medium"),
                 "location": f"{result.get('filename')}:{result.get('line_number')}",
                 "code": result.get("code", ""),
                 "cwe": result.get("cwe", {}).get("id") if isinstance(result.get("cwe"), dict) else None,
-                "remediation": result.get("remediation", "")
-            })
+                "remediation": result.get("remediation", ""),
+                "scanner": scanner
+            }
     
     elif scanner == "semgrep":
-        for result in raw_results.get("results", []):
-            findings.append({
+        for result in raw_results:
+            yield {
                 "title": result.get("check_id", "Unknown Issue"),
                 "description": result.get("extra", {}).get("message", ""),
                 "severity": SEVERITY_MAPPING["semgrep"].get(result.get("severity", "WARNING"), "medium"),
                 "location": f"{result.get('path')}:{result.get('start', {}).get('line')}",
                 "code": result.get("extra", {}).get("lines", ""),
-                "cwe": None,  # Semgrep doesn't provide CWE directly
-                "remediation": result.get("extra", {}).get("fix", "")
-            })
+                "cwe": semgrep_cwe(result.get("extra", {}).get("metadata", {}).get("cwe")),
+                "remediation": result.get("extra", {}).get("fix", ""),
+                "scanner": scanner
+            }
     
     elif scanner == "eslint":
         for file_result in raw_results:
             for message in file_result.get("messages", []):
-                findings.append({
+                yield {
                     "title": message.get("ruleId", "Unknown Issue"),
                     "description": message.get("message", ""),
                     "severity": SEVERITY_MAPPING["eslint"].get(str(message.get("severity", 1)), "medium"),
                     "location": f"{file_result.get('filePath')}:{message.get('line')}:{message.get('column')}",
                     "code": "",  # ESLint doesn't provide the code snippet directly
                     "cwe": None,
-                    "remediation": ""
-                })
+                    "remediation": "",
+                    "scanner": scanner
+                }
     
     elif scanner == "phpcs":
-        for file_path, file_data in raw_results.get("files", {}).items():
+        for file_path, file_data in raw_results:
             for message in file_data.get("messages", []):
-                findings.append({
+                yield {
                     "title": message.get("source", "Unknown Issue"),
                     "description": message.get("message", ""),
                     "severity": SEVERITY_MAPPING["phpcs"].get(message.get("type", "WARNING"), "medium"),
                     "location": f"{file_path}:{message.get('line')}:{message.get('column')}",
                     "code": "",
                     "cwe": None,
-                    "remediation": ""
-                })
-    
-    return findings
+                    "remediation": "",
+                    "scanner": scanner
+                }
 
 def run_sast_scan(
     target: str, 
@@ -275,6 +717,9 @@ def run_sast_scan(
     start_time = datetime.now(timezone.utc)
     parameters = parameters or {}
     branch = parameters.get("branch", "main")
+    # מגבלת הזמן חלה על הסריקה כולה: כל כלי מקבל רק את הזמן שנותר ממנה
+    max_scan_duration = parameters.get("max_scan_duration")
+    deadline = start_time.timestamp() + max_scan_duration if max_scan_duration else None
     
     # עדכון התקדמות: התחלת סריקה
     if progress_callback:
@@ -299,6 +744,7 @@ def run_sast_scan(
             }]
         })
     
+    cloned_dir = None
     try:
         # שלב 1: הורדת הקוד אם מדובר ב-repo
         target_dir = target
@@ -326,7 +772,7 @@ def run_sast_scan(
                     }]
                 })
             
-            target_dir = clone_repository(target, branch)
+            target_dir = cloned_dir = clone_repository(target, branch)
         
         # שלב 2: זיהוי שפות
         if progress_callback:
@@ -340,7 +786,9 @@ def run_sast_scan(
                 }]
             })
         
-        languages = detect_language(target_dir)
+        # מעבר אחד על המאגר: רשימת הקבצים לסריקה, גודלם ושפתם (ללא תיקיות מוחרגות וקבצים שב-.gitignore)
+        index = RepoIndex.build(target_dir)
+        languages = detect_language(target_dir, index)
         
         if not languages:
             return {
@@ -394,45 +842,189 @@ def run_sast_scan(
                 ]
             })
         
-        all_findings = []
-        scanner_results = {}
+        # טבלה עמודתית (ראו tools/findings_table.py): בסריקות עם מאות אלפי ממצאים
+        # רשימת מילונים תופסת ג'יגה-בייטים
+        all_findings = FindingTable()
+        # הסיכום (חומרה, כלי, חוק) נבנה תוך כדי הוספת הממצאים לטבלה - מעבר אחד על כל ממצא
+        summary = FindingSummary()
+        # טביעת אצבע יציבה לכל ממצא; ממצא שכבר דווח (גם על ידי כלי אחר) לא נשמר פעמיים
+        fingerprints = FingerprintIndex(target_dir)
+        # מצב ההצלחה של כל כלי; הממצאים עצמם לא נשמרים כאן
+        scanner_status = {}
         
-        for i, scanner in enumerate(scanners):
+        # גרסת החוקים של כל כלי; שינוי בה פוסל את הבסיס האינקרמנטלי ואת רשומות המטמון
+        rulesets = {scanner: get_ruleset_id(scanner, languages) for scanner in scanners}
+        
+        # סריקה אינקרמנטלית: רק קבצים שהשתנו מאז ה-commit האחרון שנסרק בפרויקט ובענף
+        baseline_store = BaselineStore(redis_client)
+        baseline_project = parameters.get("project_id", target)
+        head_commit = get_head_commit(target_dir) if cloned_dir and parameters.get("incremental", True) else None
+        incremental_plan = None
+        if head_commit:
+            incremental_plan = plan_incremental_scan(
+                target_dir, baseline_store.get(baseline_project, branch), scanners, SUPPORTED_SCANNERS, rulesets, index
+            )
+        
+        scanners_to_run = scanners
+        files_by_scanner = None
+        if incremental_plan:
+            files_by_scanner = incremental_plan["files"]
+            scanners_to_run = [scanner for scanner in scanners if scanner in files_by_scanner]
+            all_findings.extend(summary.observe(fingerprints.unique(incremental_plan["carried_findings"])))
+            
             if progress_callback:
-                current_progress = 30 + (i / len(scanners)) * 40
                 progress_callback({
-                    "overallProgress": current_progress,
                     "logs": [{
                         "timestamp": datetime.now(timezone.utc).isoformat(),
                         "level": "info",
-                        "message": f"מריץ סריקת {scanner}"
+                        "message": f"סריקה אינקרמנטלית: {len(incremental_plan['changed'])} קבצים השתנו, "
+                                   f"{len(incremental_plan['deleted'])} נמחקו, "
+                                   f"{len(incremental_plan['carried_findings'])} ממצאים הועברו מהסריקה הקודמת"
                     }]
                 })
+        
+        # מטמון ממצאים לפי תוכן: קבצים שכבר נותחו באותו כלי, גרסה וסט חוקים לא נסרקים שוב
+        # הכלים מקבלים רשימות קבצים מפורשות מהאינדקס, כך שתיקיות מוחרגות לא נסרקות
+        cache_keys = {}
+        shard_files = None
+        # הממצאים של כל כלי (מהמטמון ומהריצה) ממתינים כאן עד שמגיע תורו לפי merge_order
+        scanner_findings: Dict[str, List[Iterable[Dict[str, Any]]]] = {scanner: [] for scanner in scanners}
+        if scanners_to_run:
+            if files_by_scanner is not None:
+                candidate_files = {
+                    scanner: [os.path.relpath(path, target_dir) for path in files_by_scanner[scanner]]
+                    for scanner in scanners_to_run
+                }
+            else:
+                candidate_files = list_scanner_files(target_dir, scanners_to_run, index)
+            remaining, cached_findings = candidate_files, {}
+            if parameters.get("finding_cache", True):
+                remaining, cached_findings, cache_keys = lookup_cached_findings(
+                    target_dir, candidate_files, languages, index
+                )
+            
+            # מאגר גדול מאוד מחולק ל-shards שנסרקים במקביל בכמה עובדים (ראו scanners/sharding.py)
+            if (cloned_dir and not incremental_plan and parameters.get("sharding", True)
+                    and sum(len(files) for files in remaining.values()) >= SAST_SHARD_MIN_FILES):
+                shard_commit = get_head_commit(target_dir)
+                if shard_commit:
+                    shard_files = {scanner: remaining[scanner] for scanner in scanners_to_run if remaining[scanner]}
             
-            result = run_scanner(scanner, target_dir)
-            scanner_results[scanner] = result
+            files_by_scanner = {}
+            cached_count = 0
+            for scanner in list(scanners_to_run):
+                if not shard_files and not incremental_plan and len(remaining[scanner]) > MAX_EXPLICIT_FILES:
+                    # רשימה ארוכה מדי לשורת הפקודה: הכלי סורק את כל התיקייה (עם exclude_args).
+                    # סריקה כזו תחזיר גם את הממצאים שבמטמון, ולכן הם לא מתווספים
+                    continue
+                scanner_findings[scanner].append(cached_findings.get(scanner, []))
+                cached_count += len(candidate_files[scanner]) - len(remaining[scanner])
+                if remaining[scanner]:
+                    files_by_scanner[scanner] = [os.path.join(target_dir, path) for path in remaining[scanner]]
+                else:
+                    scanners_to_run = [name for name in scanners_to_run if name != scanner]
+            
+            if progress_callback and cached_count:
+                progress_callback({
+                    "logs": [{
+                        "timestamp": datetime.now(timezone.utc).isoformat(),
+                        "level": "info",
+                        "message": f"תוצאות {cached_count} קבצים נלקחו ממטמון הממצאים"
+                    }]
+                })
+        
+        # ברירת המחדל היא הרצה מקבילית; parallel_scanners=False מריץ את הכלים אחד אחרי השני
+        max_workers = parameters.get("max_parallel_scanners")
+        if not parameters.get("parallel_scanners", True):
+            max_workers = 1
+        
+        if progress_callback:
+            progress_callback({
+                "logs": [{
+                    "timestamp": datetime.now(timezone.utc).isoformat(),
+                    "level": "info",
+                    "message": f"מריץ סריקת {scanner}"
+                } for scanner in scanners_to_run]
+            })
+        
+        if shard_files:
+            scanner_runs = run_sharded_scanners(
+                target, branch, shard_commit, target_dir, index, shard_files, max_workers,
+                deadline, languages, progress_callback, max_scan_duration, parameters.get("user_id")
+            )
+        else:
+            scanner_runs = run_scanners(
+                scanners_to_run, target_dir, max_workers, deadline, files_by_scanner,
+                languages
+            )
+        
+        # ממצאים נכנסים לאינדקס טביעות האצבע לפי סדר קבוע של הכלים ולא לפי סדר הסיום שלהם,
+        # כך שבעיה שדווחה בשני כלים נשמרת תמיד מאותו כלי, גם כשחלק מהכלים הגיעו מהמטמון
+        merge_order = [scanner for scanner in SUPPORTED_SCANNERS if scanner in scanner_findings]
+        running = set(scanners_to_run)
+        
+        def merge_ready_findings():
+            while merge_order and merge_order[0] not in running:
+                for findings in scanner_findings.pop(merge_order.pop(0)):
+                    all_findings.extend(summary.observe(fingerprints.unique(findings)))
+        
+        merge_ready_findings()
+        for completed, (scanner, result) in enumerate(scanner_runs, start=1):
+            scanner_status[scanner] = result["success"]
+            running.discard(scanner)
             
             if result["success"]:
-                findings = normalize_findings(scanner, result["data"])
-                all_findings.extend(findings)
+                # הפלט של הכלי משוחרר אחרי שהממצאים עברו לטבלה ולמטמון
+                findings = result.pop("findings")
+                scanner_findings[scanner].append(findings)
+                merge_ready_findings()
+                if scanner in cache_keys and result.get("cacheable", True):
+                    store_findings_in_cache(target_dir, findings, cache_keys[scanner], result.get("failed_files", ()))
+                findings_count = len(findings)
+                del findings
                 
                 if progress_callback:
                     progress_callback({
+                        "overallProgress": 30 + (completed / len(scanners_to_run)) * 40,
                         "logs": [{
                             "timestamp": datetime.now(timezone.utc).isoformat(),
                             "level": "info",
-                            "message": f"סריקת {scanner} הושלמה: נמצאו {len(findings)} ממצאים"
+                            "message": f"סריקת {scanner} הושלמה: נמצאו {findings_count} ממצאים"
                         }]
                     })
             else:
+                merge_ready_findings()
                 if progress_callback:
                     progress_callback({
+                        "overallProgress": 30 + (completed / len(scanners_to_run)) * 40,
                         "logs": [{
                             "timestamp": datetime.now(timezone.utc).isoformat(),
                             "level": "warning",
                             "message": f"סריקת {scanner} נכשלה: {result.get('error', 'שגיאה לא ידועה')}"
                         }]
                     })
+        running.clear()
+        merge_ready_findings()
+        
+        # שמירת בסיס לסריקה האינקרמנטלית הבאה - רק אם כל הכלים הצליחו, אחרת ממצאים היו הולכים לאיבוד
+        if head_commit and all(scanner_status.values()):
+            baseline_store.put(baseline_project, branch, {
+                "commit": head_commit,
+                "scanners": scanners,
+                "rulesets": rulesets,
+                # נכתב ישירות מהטבלה, ממצא אחד בכל פעם
+                "findings": (relativize_finding(finding, target_dir) for finding in all_findings)
+            })
+        
+        # ממצאים חדשים, שתוקנו ושלא השתנו מול הסריקה המלאה הקודמת של אותם כלים בפרויקט ובענף
+        finding_changes = None
+        if all(scanner_status.values()):
+            fingerprint_store = FingerprintStore(redis_client or get_redis_client())
+            fingerprint_scope = f"{branch}|{','.join(sorted(scanners))}"
+            finding_changes = diff_fingerprints(
+                fingerprint_store.get(baseline_project, fingerprint_scope), fingerprints.fingerprints
+            )
+            fingerprint_store.put(baseline_project, fingerprint_scope, fingerprints.fingerprints)
         
         # שלב 5: ניתוח וסיווג ממצאים
         if progress_callback:
@@ -453,21 +1045,6 @@ def run_sast_scan(
                 }]
             })
         
-        # מיון ממצאים לפי חומרה
-        findings_by_severity = {
-            "critical": [],
-            "high": [],
-            "medium": [],
-            "low": [],
-            "info": []
-        }
-        
-        for finding in all_findings:
-            severity = finding.get("severity", "medium")
-            if severity not in findings_by_severity:
-                severity = "medium"
-            findings_by_severity[severity].append(finding)
-        
         # שלב 6: יצירת דוח
         if progress_callback:
             progress_callback({
@@ -488,12 +1065,7 @@ def run_sast_scan(
             })
         
         # חישוב סיכום ממצאים
-        findings_summary = {
-            "total": len(all_findings),
-            "by_severity": {severity: len(findings) for severity, findings in findings_by_severity.items()},
-            "by_scanner": {scanner: len(normalize_findings(scanner, result["data"])) if result["success"] else 0 
-                          for scanner, result in scanner_results.items()}
-        }
+        findings_summary = {**summary.as_dict(scanners), "duplicates": fingerprints.duplicates}
         
         end_time = datetime.now(timezone.utc)
         scan_duration = (end_time - start_time).total_seconds()
@@ -526,8 +1098,11 @@ def run_sast_scan(
             "scan_end": end_time.isoformat(),
             "scan_duration": scan_duration,
             "findings_summary": findings_summary,
+            # הטבלה עצמה (דחוסה גם במעבר בין תהליכים); הצרכנים ממירים ל-dict רק היכן שנדרש JSON
             "findings": all_findings,
-            "scanners_used": list(scanner_results.keys())
+            "finding_changes": finding_changes,
+            "scanners_used": scanners,
+            "incremental": bool(incremental_plan)
         }
         
     except Exception as e:
@@ -548,6 +1123,10 @@ def run_sast_scan(
             "error": str(e),
             "scan_duration": (datetime.now(timezone.utc) - start_time).total_seconds()
         }
+    finally:
+        # ניקוי עותק העבודה (מטמון המאגר עצמו נשמר לסריקות הבאות)
+        if cloned_dir:
+            release_repository(cloned_dir)
 
 if __name__ == "__main__":
     # דוגמה לשימוש ישיר במודול
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+סריקת SAST מבוזרת (sharding) למאגרים גדולים
+
+מאגר גדול מחולק לקבוצות קבצים (shards) מאוזנות לפי גודל, כשקבצים מאותה
+תיקייה נשארים יחד. ה-shards נשמרים ב-Redis, והעובד שמתאם את הסריקה שולח
+עבודות עזר לתור העבודות. כל עובד שמקבל עבודת עזר, וגם המתאם עצמו, לוקח
+shards מהתור המשותף ומריץ עליהם את הכלים. המתאם אוסף את התוצאות, מחזיר
+לתור shards של עובדים שהפסיקו לדווח, וממזג את התוצאות לתוצאה אחת לכל כלי.
+"""
+
+import os
+import json
+import zlib
+import heapq
+import logging
+import threading
+import time
+import redis
+from collections import defaultdict
+from typing import Dict, List, Any, Callable, Optional, Tuple
+from tools.repo_index import RepoIndex
+
+logger = logging.getLogger('sast-sharding')
+
+# סריקה מתחלקת ל-shards רק מעל מספר קבצים זה
+SAST_SHARD_MIN_FILES = int(os.getenv("SAST_SHARD_MIN_FILES", 20000))
+# יעד הגודל ומספר הקבצים המקסימלי בכל shard
+SAST_SHARD_TARGET_BYTES = int(os.getenv("SAST_SHARD_TARGET_BYTES", 100 * 1024 * 1024))
+SAST_SHARD_MAX_FILES = int(os.getenv("SAST_SHARD_MAX_FILES", 2000))
+SAST_MAX_SHARDS = int(os.getenv("SAST_MAX_SHARDS", 64))
+# מספר עבודות העזר שנשלחות לעובדים אחרים לכל סריקה מבוזרת
+SAST_SHARD_HELPERS = int(os.getenv("SAST_SHARD_HELPERS", 4))
+# shard שהעובד שלקח אותו לא דיווח עליו זמן זה מוחזר לתור
+SAST_SHARD_STALE_SECONDS = int(os.getenv("SAST_SHARD_STALE_SECONDS", 180))
+SHARD_HEARTBEAT_SECONDS = 30
+SHARD_STATE_TTL = 24 * 3600
+
+# לקיחת shard מהתור ורישום הדיווח הראשון שלו בפעולה אחת: shard שנלקח אבל עדיין
+# לא נרשם נראה ל-requeue_stale כמו shard של עובד שקרס, והיה מוחזר לתור
+_CLAIM_SHARD = """
+local shard_id = redis.call('LPOP', KEYS[1])
+if shard_id then
+    redis.call('HSET', KEYS[2], shard_id, ARGV[1])
+    redis.call('EXPIRE', KEYS[2], ARGV[2])
+end
+return shard_id
+"""
+
+_redis_client = None
+
+def get_redis_client() -> redis.Redis:
+    """חיבור Redis של תהליך הסריקה (נוצר בשימוש הראשון)"""
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379'), decode_responses=True)
+    return _redis_client
+
+def plan_shards(
+    index: RepoIndex,
+    paths: List[str],
+    target_bytes: int = SAST_SHARD_TARGET_BYTES,
+    max_files: int = SAST_SHARD_MAX_FILES,
+    max_shards: int = SAST_MAX_SHARDS
+) -> List[List[str]]:
+    """
+    חלוקת קבצים (נתיבים יחסיים מתוך האינדקס) ל-shards מאוזנים לפי גודל
+
+    הקבצים מקובצים לפי תיקייה, כדי שכלים בין-קבציים יראו קבצים קשורים יחד;
+    תיקייה גדולה מפוצלת לכמה קבוצות. הקבוצות מחולקות בשיטת "הגדולה ביותר לקל ביותר"
+    (LPT), שנותנת shards בגודל דומה.
+    """
+    by_dir: Dict[str, List[str]] = defaultdict(list)
+    for path in sorted(paths):
+        by_dir[os.path.dirname(path)].append(path)
+
+    # קבוצה היא עד רבע shard, כדי שהחלוקה תוכל לאזן בין ה-shards
+    unit_files, unit_max_bytes = max(1, max_files // 4), max(1, target_bytes // 4)
+    units: List[Tuple[int, List[str]]] = []
+    for files in by_dir.values():
+        unit, unit_bytes = [], 0
+        for path in files:
+            size = index.files[path].size if path in index else 0
+            if unit and (len(unit) >= unit_files or unit_bytes + size > unit_max_bytes):
+                units.append((unit_bytes, unit))
+                unit, unit_bytes = [], 0
+            unit.append(path)
+            unit_bytes += size
+        if unit:
+            units.append((unit_bytes, unit))
+
+    total_bytes = sum(size for size, _ in units)
+    count = max(-(-total_bytes // max(1, target_bytes)), -(-len(paths) // max(1, max_files)), 1)
+    count = min(count, max_shards, len(units))
+
+    # (גודל, מספר קבצים, מזהה) - ה-shard הקל ביותר מקבל את הקבוצה הבאה
+    heap = [(0, 0, i) for i in range(count)]
+    shards: List[List[str]] = [[] for _ in range(count)]
+    for size, unit in sorted(units, key=lambda item: (-item[0], item[1][0])):
+        shard_bytes, shard_files, i = heapq.heappop(heap)
+        shards[i].extend(unit)
+        heapq.heappush(heap, (shard_bytes + size, shard_files + len(unit), i))
+    return [sorted(shard) for shard in shards if shard]
+
+
+def _pack(data: Any) -> str:
+    return zlib.compress(json.dumps(data).encode()).hex()
+
+def _unpack(data: str) -> Any:
+    return json.loads(zlib.decompress(bytes.fromhex(data)))
+
+
+class ShardStore:
+    """
+    מצב סריקה מבוזרת ב-Redis: הגדרת הסריקה, רשימות הקבצים, תור ה-shards
+    הממתינים, מי לקח כל shard ומתי דיווח לאחרונה, והתוצאות
+    """
+
+    def __init__(self, redis_client: redis.Redis, session: str):
+        self.redis = redis_client
+        self.session = session
+        prefix = f"scan:shards:{session}"
+        self.spec_key = f"{prefix}:spec"
+        self.files_key = f"{prefix}:files"
+        self.pending_key = f"{prefix}:pending"
+        self.claims_key = f"{prefix}:claims"
+        self.results_key = f"{prefix}:results"
+        self._claim = redis_client.register_script(_CLAIM_SHARD)
+
+    def publish(self, spec: Dict[str, Any], shards: List[Dict[str, List[str]]]):
+        """שמירת הסריקה; כל shard הוא מיפוי מכלי לקבצים (נתיבים יחסיים) שהוא סורק ב-shard"""
+        pipe = self.redis.pipeline()
+        pipe.set(self.spec_key, json.dumps({**spec, "shards": len(shards)}), ex=SHARD_STATE_TTL)
+        pipe.hset(self.files_key, mapping={str(i): _pack(files) for i, files in enumerate(shards)})
+        pipe.rpush(self.pending_key, *[str(i) for i in range(len(shards))])
+        for key in (self.files_key, self.pending_key):
+            pipe.expire(key, SHARD_STATE_TTL)
+        pipe.execute()
+
+    def spec(self) -> Optional[Dict[str, Any]]:
+        spec = self.redis.get(self.spec_key)
+        return json.loads(spec) if spec else None
+
+    def pending(self) -> int:
+        return self.redis.llen(self.pending_key)
+
+    def claim(self) -> Optional[Tuple[str, Dict[str, List[str]]]]:
+        shard_id = self._claim(keys=[self.pending_key, self.claims_key], args=[time.time(), SHARD_STATE_TTL])
+        if shard_id is None:
+            return None
+        return shard_id, _unpack(self.redis.hget(self.files_key, shard_id))
+
+    def heartbeat(self, shard_id: str):
+        self.redis.hset(self.claims_key, shard_id, time.time())
+        self.redis.expire(self.claims_key, SHARD_STATE_TTL)
+
+    def release(self, shard_id: str):
+        """החזרת shard לתור, כדי שעובד אחר ייקח אותו"""
+        self.redis.hdel(self.claims_key, shard_id)
+        self.redis.lpush(self.pending_key, shard_id)
+
+    def complete(self, shard_id: str, results: Dict[str, Dict[str, Any]]):
+        # התוצאה הראשונה של shard נשמרת (shard שהוחזר לתור עשוי להיסרק פעמיים)
+        self.redis.hsetnx(self.results_key, shard_id, _pack(results))
+        self.redis.expire(self.results_key, SHARD_STATE_TTL)
+        self.redis.hdel(self.claims_key, shard_id)
+
+    def completed(self) -> int:
+        return self.redis.hlen(self.results_key)
+
+    def results(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        return {shard_id: _unpack(data) for shard_id, data in self.redis.hgetall(self.results_key).items()}
+
+    def requeue_stale(self, total: int, stale_seconds: int = SAST_SHARD_STALE_SECONDS) -> List[str]:
+        """החזרה לתור של shards שהעובד שלקח אותם הפסיק לדווח (למשל כי קרס)"""
+        now = time.time()
+        # קריאה אחת (MULTI): shard שעובר בין התור, הלקיחה והתוצאות באמצע הבדיקה לא ייראה חסר
+        pipe = self.redis.pipeline()
+        pipe.hgetall(self.claims_key)
+        pipe.hkeys(self.results_key)
+        pipe.lrange(self.pending_key, 0, -1)
+        claims, done, pending = pipe.execute()
+        done, pending = set(done), set(pending)
+        stale = [shard_id for shard_id, seen in claims.items()
+                 if now - float(seen) > stale_seconds and shard_id not in done]
+        # shard שנלקח מהתור אבל העובד קרס לפני שרשם אותו
+        stale += [str(i) for i in range(total) if str(i) not in claims and str(i) not in done and str(i) not in pending]
+        for shard_id in stale:
+            logger.warning(f"shard {shard_id} של {self.session} לא דיווח {stale_seconds} שניות - מוחזר לתור")
+            self.release(shard_id)
+        return stale
+
+    def cleanup(self):
+        self.redis.delete(self.spec_key, self.files_key, self.pending_key, self.claims_key, self.results_key)
+
+
+def _heartbeat(store: ShardStore, shard_id: str, done: threading.Event):
+    while not done.wait(SHARD_HEARTBEAT_SECONDS):
+        try:
+            store.heartbeat(shard_id)
+        except redis.RedisError as e:
+            logger.warning(f"עדכון shard {shard_id} נכשל: {str(e)}")
+
+
+def process_shards(
+    store: ShardStore,
+    scan_shard: Callable[[Dict[str, List[str]]], Dict[str, Dict[str, Any]]]
+) -> int:
+    """
+    לקיחת shards מהתור והרצתם עד שהתור מתרוקן
+
+    :param scan_shard: מקבל את קבצי ה-shard לכל כלי ומחזיר את תוצאות הכלים עליו
+    :return: מספר ה-shards שנסרקו
+    """
+    processed = 0
+    while True:
+        claimed = store.claim()
+        if claimed is None:
+            return processed
+        shard_id, files = claimed
+
+        # דיווח תקופתי שה-shard עדיין בעבודה, כדי שלא יוחזר לתור
+        done = threading.Event()
+        threading.Thread(target=_heartbeat, args=(store, shard_id, done), daemon=True).start()
+
+        try:
+            results = scan_shard(files)
+        except BaseException:
+            store.release(shard_id)
+            raise
+        finally:
+            done.set()
+        store.complete(shard_id, results)
+        processed += 1
+        logger.info(f"shard {shard_id} של {store.session} הושלם")
+
+
+def merge_shard_results(shard_results: List[Dict[str, Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+    """
+    מיזוג תוצאות ה-shards לתוצאה אחת לכל כלי
+
+    כלי הצליח רק אם הצליח בכל ה-shards. ממצאים כפולים (אותו כלי, כותרת ומיקום -
+    למשל מקבצים שנסרקו בשני shards) מופיעים פעם אחת.
+    """
+    merged: Dict[str, Dict[str, Any]] = {}
+    seen = defaultdict(set)
+    for results in shard_results:
+        for scanner, result in results.items():
+            target = merged.setdefault(scanner, {"success": True, "findings": [], "cacheable": True, "failed_files": []})
+            if not result.get("success"):
+                target["success"] = False
+                target.setdefault("error", result.get("error"))
+                continue
+            target["cacheable"] = target["cacheable"] and result.get("cacheable", True)
+            target["failed_files"].extend(result.get("failed_files", []))
+            for finding in result.get("findings", []):
+                key = (finding.get("title"), finding.get("location"))
+                if key not in seen[scanner]:
+                    seen[scanner].add(key)
+                    target["findings"].append(finding)
+    for result in merged.values():
+        if not result["success"]:
+            result.pop("findings")
+    return merged
@@ -0,0 +1,106 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from scanners import dast
+from scanners.combined_scan import SCAN_FUNCTIONS, ScanCancelled, run_scanner_async
+
+
+def test_scan_functions_cover_all_scan_types():
+    assert set(SCAN_FUNCTIONS) == {"sast", "dast", "api"}
+    assert asyncio.iscoroutinefunction(SCAN_FUNCTIONS["dast"])
+
+
+def test_blocking_scanner_runs_in_executor():
+    updates = []
+    callers = []
+
+    def scanner(target, parameters, progress_callback):
+        callers.append(threading.current_thread().name)
+        progress_callback({"overallProgress": 50})
+        return {"success": True, "target": target, "parameters": parameters}
+
+    result = asyncio.run(run_scanner_async(scanner, "repo", {"a": 1}, updates.append))
+
+    assert result == {"success": True, "target": "repo", "parameters": {"a": 1}}
+    assert updates == [{"overallProgress": 50}]
+    assert callers[0].startswith("combined-scan")
+
+
+def test_async_scanner_is_awaited_directly():
+    updates = []
+    loops = []
+
+    async def scanner(target, parameters, progress_callback):
+        loops.append(asyncio.get_running_loop())
+        progress_callback({"status": "scanning"})
+        return {"success": True}
+
+    async def run():
+        result = await run_scanner_async(scanner, "https://example.com", {}, updates.append)
+        return result, asyncio.get_running_loop()
+
+    result, loop = asyncio.run(run())
+
+    assert result == {"success": True}
+    assert loops == [loop]
+    assert updates == [{"status": "scanning"}]
+
+
+def test_timeout_stops_blocking_scanner_at_next_progress_update():
+    stopped = threading.Event()
+
+    def scanner(target, parameters, progress_callback):
+        try:
+            while True:
+                progress_callback({})
+                time.sleep(0.01)
+        except ScanCancelled:
+            stopped.set()
+            raise
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(run_scanner_async(scanner, "repo", {}, lambda data: None, timeout=0.05))
+    assert stopped.wait(1)
+
+
+def test_timeout_cancels_async_scanner():
+    cancelled = []
+
+    async def scanner(target, parameters, progress_callback):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(run_scanner_async(scanner, "repo", {}, lambda data: None, timeout=0.05))
+    assert cancelled == [True]
+
+
+def test_dast_adapter_maps_parameters(monkeypatch):
+    calls = []
+    published = []
+    updates = []
+
+    async def fake_run_dast_async(project_id, url, max_duration=None):
+        calls.append((project_id, url, max_duration))
+        await dast.publish_event(project_id, {"type": "progress", "status": "scanning", "message": "spider"})
+        return {"success": True, "status": "completed", "findings": []}
+
+    monkeypatch.setattr(dast, "run_dast_async", fake_run_dast_async)
+    monkeypatch.setattr(dast.redis_client, "publish", lambda channel, data: published.append(channel))
+
+    result = asyncio.run(run_scanner_async(
+        SCAN_FUNCTIONS["dast"], "https://example.com",
+        {"scan_id": "scan-1", "max_scan_duration": 60}, updates.append
+    ))
+
+    assert result["success"] is True
+    assert calls == [("scan-1", "https://example.com", 60)]
+    assert published == ["scan:scan-1"]
+    assert updates[0]["status"] == "scanning"
+    assert updates[0]["logs"][0]["message"] == "spider"
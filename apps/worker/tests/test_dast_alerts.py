@@ -0,0 +1,36 @@
+import asyncio
+from types import SimpleNamespace
+
+from scanners import dast
+from tools.zap_client import ZapClient
+
+
+class FakeZap(ZapClient):
+    def __init__(self, alerts):
+        self.alerts = alerts
+        self.starts = []
+
+    async def call(self, component, kind, name, **params):
+        assert (component, kind, name) == ("core", "view", "alerts")
+        self.starts.append(params["start"])
+        return {"alerts": self.alerts[params["start"]:params["start"] + params["count"]]}
+
+
+def _alert(i):
+    return {"id": str(i), "pluginId": str(i % 3), "name": f"A{i % 3}", "risk": "High", "url": f"http://t/{i}"}
+
+
+def test_offset_advances_past_skipped_alerts(monkeypatch):
+    monkeypatch.setattr(dast, "publish_findings", lambda project_id, findings: None)
+    client = FakeZap([_alert(i) for i in range(10)])
+    # The lease's id cursor is ahead of its offset cursor: alerts 0-4 belong to an earlier scan
+    feed = dast.AlertFeed(SimpleNamespace(client=client, alert_start=0, alert_id=4), "http://t", "p1")
+
+    assert asyncio.run(feed.drain()) == 5
+    assert feed.offset == 10
+
+    client.alerts += [_alert(10), _alert(11)]
+    client.starts.clear()
+    assert asyncio.run(feed.drain()) == 2
+    assert client.starts == [10]
+    assert feed.groups.groups["1"]["instance_count"] == 2
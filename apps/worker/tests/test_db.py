@@ -0,0 +1,37 @@
+from sqlalchemy import inspect, select
+
+import db
+from models import Finding, ScanStatus, Severity
+from tools.findings_table import FindingTable
+
+
+def _engine(monkeypatch, tmp_path):
+    monkeypatch.setattr(db, "DATABASE_URL", f"sqlite:///{tmp_path / 'worker.db'}")
+    monkeypatch.setattr(db, "_engine", None)
+    return db.get_engine()
+
+
+def test_finding_indexes(monkeypatch, tmp_path):
+    indexes = {index["name"] for index in inspect(_engine(monkeypatch, tmp_path)).get_indexes("finding")}
+    assert {"ix_finding_scan_id", "ix_finding_severity", "ix_finding_rule_id", "ix_finding_fingerprint"} <= indexes
+
+
+def test_finalize_scan_stores_table_rows(monkeypatch, tmp_path):
+    engine = _engine(monkeypatch, tmp_path)
+    findings = FindingTable([
+        {"title": "SQL injection", "severity": "high", "location": "app.py:10:4", "ruleset": "r1", "fingerprint": "f1"},
+        {"title": "Weak hash", "severity": "bogus", "location": "lib.py"},
+    ])
+    scan_id = db.create_scan("project")
+
+    assert db.finalize_scan(scan_id, "project", ScanStatus.SUCCESS, findings) == 2
+    # A redelivered job replaces the findings instead of duplicating them
+    assert db.finalize_scan(scan_id, "project", ScanStatus.SUCCESS, findings) == 2
+
+    with engine.connect() as conn:
+        rows = conn.execute(select(Finding.__table__).order_by(Finding.__table__.c.id)).mappings().all()
+    assert [(row["rule_id"], row["severity"], row["file_path"], row["line_start"]) for row in rows] == [
+        ("SQL injection", Severity.HIGH, "app.py", 10),
+        ("Weak hash", Severity.MEDIUM, "lib.py", None),
+    ]
+    assert len({row["id"] for row in rows}) == 2
@@ -0,0 +1,44 @@
+import pickle
+
+from tools.findings_table import FindingTable
+
+FINDINGS = [
+    {"title": "SQL injection", "severity": "high", "location": "app.py:10:4", "scanner": "bandit", "line": 10},
+    {"title": "Weak hash", "severity": "medium", "location": "app.py:20", "scanner": "bandit"},
+    {"title": "SQL injection", "severity": "high", "location": "db.py:3", "scanner": "semgrep"},
+    {"title": "Debug enabled", "scanner": "semgrep"},
+]
+
+
+def test_rows_round_trip():
+    table = FindingTable(FINDINGS)
+    assert len(table) == 4
+    assert table.to_dicts() == FINDINGS
+    assert table[-1] == FINDINGS[-1]
+
+
+def test_count_by():
+    table = FindingTable(FINDINGS)
+    assert table.count_by("severity") == {"high": 2, "medium": 1}
+    assert table.count_by("severity", default="unknown") == {"high": 2, "medium": 1, "unknown": 1}
+    assert table.count_by("path") == {"app.py": 2, "db.py": 1}
+
+
+def test_where():
+    table = FindingTable(FINDINGS)
+    assert list(table.where(severity="high", scanner="semgrep")) == [FINDINGS[2]]
+    assert list(table.where(severity="critical")) == []
+
+
+def test_to_orm_is_lazy():
+    built = []
+    rows = FindingTable(FINDINGS).to_orm(lambda finding: built.append(finding) or finding["title"])
+    assert built == []
+    assert next(rows) == "SQL injection"
+    assert len(built) == 1
+
+
+def test_pickles_as_table():
+    table = pickle.loads(pickle.dumps(FindingTable(FINDINGS)))
+    assert isinstance(table, FindingTable)
+    assert table.to_dicts() == FINDINGS
@@ -0,0 +1,28 @@
+import fakeredis
+import pytest
+
+from tools.job_queue import ScanJobQueue
+
+
+@pytest.fixture
+def redis_client():
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+def test_enqueue_is_idempotent_per_scan(redis_client):
+    queue = ScanJobQueue(redis_client, consumer="a")
+    assert queue.enqueue({"scanId": "s1"})
+    assert queue.enqueue({"scanId": "s1"}) is None
+    assert redis_client.xlen(queue.stream) == 1
+
+
+def test_reclaim_walks_the_pending_list(redis_client):
+    dead = ScanJobQueue(redis_client, consumer="dead")
+    ids = [dead.enqueue({"scanId": f"s{i}"}) for i in range(3)]
+    redis_client.xreadgroup(dead.group, dead.consumer, {dead.stream: ">"}, count=3)
+
+    live = ScanJobQueue(redis_client, consumer="live", claim_idle_ms=0)
+    reclaimed = [live._next_message(block_ms=10)[0] for _ in range(3)]
+
+    assert reclaimed == ids
+    assert live._claim_cursor == "0-0"
@@ -0,0 +1,40 @@
+import time
+
+import fakeredis
+import pytest
+
+from scanners.sharding import ShardStore, merge_shard_results, process_shards
+
+
+@pytest.fixture
+def store():
+    store = ShardStore(fakeredis.FakeRedis(decode_responses=True), "session")
+    store.publish({"target": "repo"}, [{"bandit": ["a.py"]}, {"bandit": ["b.py"]}, {"bandit": ["c.py"]}])
+    return store
+
+
+def test_claim_registers_the_shard(store):
+    shard_id, files = store.claim()
+    assert files == {"bandit": ["a.py"]}
+    assert float(store.redis.hget(store.claims_key, shard_id)) <= time.time()
+    # Claimed a moment ago: not stale, even before the first periodic heartbeat
+    assert store.requeue_stale(3) == []
+    assert store.pending() == 2
+
+
+def test_stale_claim_is_requeued(store):
+    shard_id, _ = store.claim()
+    store.redis.hset(store.claims_key, shard_id, time.time() - 3600)
+    assert store.requeue_stale(3, stale_seconds=60) == [shard_id]
+    assert store.pending() == 3
+
+
+def test_process_shards_completes_every_shard(store):
+    def scan_shard(files):
+        return {"bandit": {"success": True, "findings": [{"title": "t", "location": f"{files['bandit'][0]}:1"}]}}
+
+    assert process_shards(store, scan_shard) == 3
+    assert store.completed() == 3
+    assert store.requeue_stale(3) == []
+    merged = merge_shard_results(list(store.results().values()))
+    assert len(merged["bandit"]["findings"]) == 3
@@ -0,0 +1,137 @@
+import fcntl, json, logging, os, random, sqlite3, tempfile, threading, time
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger("callback-client")
+
+CALLBACK_CONNECT_TIMEOUT = float(os.getenv("CALLBACK_CONNECT_TIMEOUT", 3))
+CALLBACK_READ_TIMEOUT = float(os.getenv("CALLBACK_READ_TIMEOUT", 10))
+CALLBACK_MAX_RETRIES = int(os.getenv("CALLBACK_MAX_RETRIES", 4))
+CALLBACK_BACKOFF_SECONDS = float(os.getenv("CALLBACK_BACKOFF_SECONDS", 0.5))
+CALLBACK_POOL_SIZE = int(os.getenv("CALLBACK_POOL_SIZE", 10))
+CALLBACK_OUTBOX_PATH = os.getenv("CALLBACK_OUTBOX_PATH", os.path.join(tempfile.gettempdir(), "arxio-callback-outbox.sqlite"))
+# How often undelivered messages are retried while the API is unreachable
+CALLBACK_REPLAY_INTERVAL = float(os.getenv("CALLBACK_REPLAY_INTERVAL", 15))
+# Messages older than this are dropped instead of replayed
+CALLBACK_OUTBOX_MAX_AGE = float(os.getenv("CALLBACK_OUTBOX_MAX_AGE", 24 * 3600))
+
+_RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class CallbackClient:
+    """Shared HTTP client for worker -> API server callbacks.
+
+    One keep-alive connection pool is reused for every call; each request has
+    bounded connect/read timeouts and is retried with exponential backoff and
+    jitter on connection errors and 5xx/429 responses.
+
+    `post` is synchronous and meant for best-effort traffic (progress
+    snapshots that a later one supersedes). `send` is for state changes that
+    must not be lost: the message is written to an on-disk SQLite outbox and
+    delivered in order by a background thread, which keeps replaying it
+    across API outages and worker restarts.
+    """
+
+    def __init__(self, base_url: str, api_key: str,
+                 outbox_path: str = CALLBACK_OUTBOX_PATH,
+                 max_retries: int = CALLBACK_MAX_RETRIES,
+                 pool_size: int = CALLBACK_POOL_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.timeout = (CALLBACK_CONNECT_TIMEOUT, CALLBACK_READ_TIMEOUT)
+        self.session = requests.Session()
+        self.session.headers.update({"x-api-key": api_key, "Content-Type": "application/json"})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.outbox_path = outbox_path
+        os.makedirs(os.path.dirname(outbox_path) or ".", exist_ok=True)
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(outbox_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, path TEXT NOT NULL, payload TEXT NOT NULL,"
+            " created_at REAL NOT NULL)")
+
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._deliver_loop, name="callback-outbox", daemon=True)
+        self._thread.start()
+
+    def post(self, path: str, payload: Dict[str, Any], retries: Optional[int] = None) -> bool:
+        """POST `payload` as JSON, retrying transient failures. Returns whether it was delivered."""
+        return self._post(path, json.dumps(payload), self.max_retries if retries is None else retries) is True
+
+    def send(self, path: str, payload: Dict[str, Any]):
+        """Queue `payload` for durable, in-order delivery. Never blocks on the network."""
+        with self._db_lock:
+            self._db.execute("INSERT INTO outbox (path, payload, created_at) VALUES (?, ?, ?)",
+                             (path, json.dumps(payload), time.time()))
+        self._wakeup.set()
+
+    def close(self, timeout: float = 10):
+        """Try to deliver what is queued, then stop. Anything left is replayed on next start."""
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+
+    def _post(self, path: str, body: str, retries: int) -> Optional[bool]:
+        """True when delivered, False when the server rejected it, None when it could not be reached."""
+        url = f"{self.base_url}{path}"
+        for attempt in range(retries + 1):
+            try:
+                response = self.session.post(url, data=body, timeout=self.timeout)
+                if response.status_code < 400:
+                    return True
+                if response.status_code not in _RETRY_STATUSES:
+                    logger.error(f"API rejected callback to {path}: {response.status_code} {response.text[:200]}")
+                    return False
+                error = f"HTTP {response.status_code}"
+            except requests.RequestException as e:
+                error = str(e)
+            if attempt < retries:
+                delay = CALLBACK_BACKOFF_SECONDS * (2 ** attempt)
+                time.sleep(delay + random.uniform(0, delay))
+        logger.warning(f"Callback to {path} failed after {retries + 1} attempts: {error}")
+        return None
+
+    def _deliver_loop(self):
+        while True:
+            self._wakeup.wait(CALLBACK_REPLAY_INTERVAL)
+            self._wakeup.clear()
+            try:
+                self._drain()
+            except Exception as e:
+                logger.error(f"Failed to deliver queued callbacks: {e}")
+            if self._stop.is_set():
+                return
+
+    def _drain(self):
+        # Workers sharing a host share the outbox; only one drains it at a time
+        with open(f"{self.outbox_path}.lock", "a+") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+            while True:
+                with self._db_lock:
+                    row = self._db.execute(
+                        "SELECT id, path, payload, created_at FROM outbox ORDER BY id LIMIT 1").fetchone()
+                if row is None:
+                    return
+                message_id, path, body, created_at = row
+                if time.time() - created_at > CALLBACK_OUTBOX_MAX_AGE:
+                    logger.error(f"Dropping undelivered callback to {path} queued at {time.ctime(created_at)}")
+                    delivered = False
+                else:
+                    # During shutdown, give up quickly and leave the rest for the next start
+                    delivered = self._post(path, body, 0 if self._stop.is_set() else self.max_retries)
+                if delivered is None:
+                    # API unreachable: keep the message and everything behind it, in order
+                    return
+                with self._db_lock:
+                    self._db.execute("DELETE FROM outbox WHERE id = ?", (message_id,))
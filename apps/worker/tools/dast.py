@@ -1,12 +1,35 @@
-import json, subprocess, tempfile, pathlib, os, uuid
-from .parsers import zap_to_findings
+import asyncio, time, uuid
+from .parsers import zap_alerts_to_findings
+from .zap_client import ZapLease
+from .zap_containers import get_zap_containers
+
+# zap-baseline.py -m 5: spider for at most 5 minutes, then report the passive scan's alerts
+BASELINE_SPIDER_MINUTES = 5
+PASSIVE_SCAN_TIMEOUT = 300
+POLL_SECONDS = 2
+
+async def _wait(zap: ZapLease, component: str, name: str, done, timeout: float, **params):
+    deadline = time.monotonic() + timeout
+    while not done(await zap.client.call(component, "view", name, **params)):
+        if time.monotonic() >= deadline:
+            return False
+        await asyncio.sleep(POLL_SECONDS)
+    return True
+
+async def _baseline(target_url: str):
+    async with get_zap_containers().lease(f"baseline-{uuid.uuid4().hex[:8]}", target_url) as zap:
+        await zap.client.call("core", "action", "accessUrl", url=target_url)
+        scan_id = (await zap.client.call("spider", "action", "scan", url=target_url,
+                                         contextName=zap.context_name))["scan"]
+        if not await _wait(zap, "spider", "status", lambda r: int(r["status"]) >= 100,
+                           BASELINE_SPIDER_MINUTES * 60, scanId=scan_id):
+            await zap.client.call("spider", "action", "stop", scanId=scan_id)
+        # The passive scanner is shared by the daemon's scans; a timeout reports what it has so far
+        await _wait(zap, "pscan", "recordsToScan", lambda r: int(r["recordsToScan"]) == 0, PASSIVE_SCAN_TIMEOUT)
+        # The daemon keeps the alerts of its earlier scans of the target; only this scan's are reported
+        return [alert async for alert in zap.client.iter_alerts(target_url, start=zap.alert_start,
+                                                                after_id=zap.alert_id)]
 
 def run_dast(target_url: str):
-    outdir = tempfile.mkdtemp(prefix="dast-")
-    report = pathlib.Path(outdir, "zap.json")
-    subprocess.run([
-        "docker", "run", "--network=host", "-v", f"{outdir}:/zap/wrk:z",
-        "owasp/zap2docker-stable", "zap-baseline.py",
-        "-t", target_url, "-J", "/zap/wrk/zap.json", "-m", "5"
-    ], check=False)
-    yield from zap_to_findings(report) 
\ No newline at end of file
+    """Baseline (spider + passive) scan on a pooled ZAP daemon instead of a one-shot container."""
+    yield from zap_alerts_to_findings(asyncio.run(_baseline(target_url)))
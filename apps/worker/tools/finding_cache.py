@@ -0,0 +1,122 @@
+import hashlib, json, logging, os, sqlite3, tempfile, threading, time, zlib
+from typing import Any, Dict, Iterable, List
+
+logger = logging.getLogger("finding-cache")
+
+FINDING_CACHE_PATH = os.getenv("FINDING_CACHE_PATH", os.path.join(tempfile.gettempdir(), "arxio-findings.sqlite"))
+FINDING_CACHE_MAX_BYTES = int(os.getenv("FINDING_CACHE_MAX_BYTES", 1024 ** 3))
+# Batch last-used updates instead of writing on every lookup
+_TOUCH_INTERVAL = 3600
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FindingCache:
+    """Per-file scanner results, keyed by tool, tool version, ruleset and file content hash.
+
+    An entry holds every finding a tool reported for one file (an empty list
+    is a valid, cacheable result), so identical files are analysed once no
+    matter which branch, fork or project they appear in. Entries are stored
+    zlib-compressed in SQLite and evicted least-recently-used once the cache
+    grows past `max_bytes`.
+    """
+
+    def __init__(self, path: str = FINDING_CACHE_PATH, max_bytes: int = FINDING_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        # Must be set before the first table is created to let deleted pages be returned to the OS
+        self._db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS findings ("
+            " key TEXT PRIMARY KEY, payload BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS findings_last_used ON findings(last_used)")
+        # Running estimate, so the exact size is only summed when eviction might be due
+        self._approx_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM findings").fetchone()[0]
+
+    @staticmethod
+    def make_key(tool: str, tool_version: str, ruleset: str, file_hash: str) -> str:
+        return hashlib.sha256(f"{tool}\0{tool_version}\0{ruleset}\0{file_hash}".encode()).hexdigest()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, List[Dict[str, Any]]]:
+        keys = list(keys)
+        results, stale = {}, []
+        now = time.time()
+        with self._lock:
+            # SQLite caps the number of bound parameters per statement
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                rows = self._db.execute(
+                    f"SELECT key, payload, last_used FROM findings WHERE key IN ({','.join('?' * len(batch))})",
+                    batch).fetchall()
+                for key, payload, last_used in rows:
+                    results[key] = json.loads(zlib.decompress(payload))
+                    if now - last_used > _TOUCH_INTERVAL:
+                        stale.append((now, key))
+            if stale:
+                self._db.executemany("UPDATE findings SET last_used = ? WHERE key = ?", stale)
+        return results
+
+    def put_many(self, entries: Dict[str, List[Dict[str, Any]]]):
+        if not entries:
+            return
+        now = time.time()
+        rows = []
+        for key, findings in entries.items():
+            payload = zlib.compress(json.dumps(findings).encode())
+            rows.append((key, payload, len(payload) + len(key), now))
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO findings (key, payload, size, last_used) VALUES (?, ?, ?, ?)", rows)
+                self._db.execute("COMMIT")
+            except sqlite3.Error:
+                self._db.execute("ROLLBACK")
+                raise
+            self._approx_bytes += sum(row[2] for row in rows)
+            if self._approx_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Called with the lock held
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM findings").fetchone()[0]
+        self._approx_bytes = total
+        if total <= self.max_bytes:
+            return
+        # Trim to 90% of the budget so eviction doesn't run on every insert
+        target = int(self.max_bytes * 0.9)
+        freed, doomed = 0, []
+        cursor = self._db.execute("SELECT key, size FROM findings ORDER BY last_used")
+        for key, size in cursor:
+            if total - freed <= target:
+                break
+            doomed.append((key,))
+            freed += size
+        cursor.close()
+        self._db.executemany("DELETE FROM findings WHERE key = ?", doomed)
+        self._db.execute("PRAGMA incremental_vacuum")
+        self._approx_bytes = total - freed
+        logger.info(f"Evicted {len(doomed)} cached file results ({freed} bytes)")
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_finding_cache() -> FindingCache:
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = FindingCache()
+        return _default_cache
@@ -0,0 +1,185 @@
+from array import array
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Columns of a finding dict as built by scanners.sast.normalize_findings. "location"
+# ("path:line[:col]") is stored as two columns, so a path shared by many findings is pooled once.
+FINDING_FIELDS = (
+    "title", "description", "severity", "location", "code", "cwe", "remediation", "scanner", "ruleset", "fingerprint",
+)
+_COLUMNS = tuple(name for field in FINDING_FIELDS for name in (("path", "position") if field == "location" else (field,)))
+_MISSING = 0
+
+
+class _Pool:
+    """Dictionary encoding for one column: every distinct value is stored once and cells hold its code."""
+    __slots__ = ("codes", "values")
+
+    def __init__(self):
+        self.codes: Dict[Any, int] = {}
+        # Code 0 marks a finding without the field
+        self.values: List[Any] = [None]
+
+    def encode(self, value: Any) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class FindingTable:
+    """Columnar, dictionary-encoded storage for large sets of finding dicts.
+
+    Each column is an array of 32-bit codes into a per-column pool, so a rule
+    id, path, severity or message repeated across thousands of findings is
+    held once; a finding costs roughly 4 bytes per field instead of a dict
+    plus its strings. Queries run on the code arrays (`count_by`, `where`),
+    and findings are only turned back into dicts when iterated (`__iter__`,
+    `to_dicts`) or into ORM rows by `to_orm`. Keys outside FINDING_FIELDS are
+    kept in a sparse side table. run_sast_scan returns its table as-is: it
+    crosses the scan pool's pipe as a few arrays and pools, and consumers
+    stream rows out of it (finalize_scan) or call `to_dicts` only where a JSON
+    list is needed.
+    """
+    __slots__ = ("_pools", "_columns", "_extras", "_size")
+
+    def __init__(self, findings: Iterable[Dict[str, Any]] = ()):
+        self._pools = {name: _Pool() for name in _COLUMNS}
+        self._columns = {name: array("I") for name in _COLUMNS}
+        self._extras: Dict[int, Dict[str, Any]] = {}
+        self._size = 0
+        self.extend(findings)
+
+    def append(self, finding: Dict[str, Any]):
+        for field in FINDING_FIELDS:
+            if field == "location":
+                continue
+            self._columns[field].append(self._pools[field].encode(finding[field]) if field in finding else _MISSING)
+        if "location" in finding:
+            path, sep, position = str(finding["location"]).partition(":")
+            self._columns["path"].append(self._pools["path"].encode(path))
+            self._columns["position"].append(self._pools["position"].encode(position) if sep else _MISSING)
+        else:
+            self._columns["path"].append(_MISSING)
+            self._columns["position"].append(_MISSING)
+        extra = {key: value for key, value in finding.items() if key not in FINDING_FIELDS}
+        if extra:
+            self._extras[self._size] = extra
+        self._size += 1
+
+    def extend(self, findings: Iterable[Dict[str, Any]]):
+        for finding in findings:
+            self.append(finding)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __bool__(self) -> bool:
+        return self._size > 0
+
+    def __getitem__(self, row: int) -> Dict[str, Any]:
+        if row < 0:
+            row += self._size
+        if not 0 <= row < self._size:
+            raise IndexError("finding index out of range")
+        return self._row(row)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for row in range(self._size):
+            yield self._row(row)
+
+    def _row(self, row: int) -> Dict[str, Any]:
+        finding = {}
+        for field in FINDING_FIELDS:
+            if field == "location":
+                path = self._columns["path"][row]
+                if path != _MISSING:
+                    position = self._columns["position"][row]
+                    location = self._pools["path"].values[path]
+                    if position != _MISSING:
+                        location = f"{location}:{self._pools['position'].values[position]}"
+                    finding["location"] = location
+                continue
+            code = self._columns[field][row]
+            if code != _MISSING:
+                finding[field] = self._pools[field].values[code]
+        if row in self._extras:
+            finding.update(self._extras[row])
+        return finding
+
+    def count_by(self, column: str, default: Optional[Any] = None) -> Dict[Any, int]:
+        """Number of findings per value of `column` (any field, or "path").
+
+        Counts the column's codes in one pass, without building any finding.
+        Findings without the field are counted under `default`, or left out when it is None.
+        """
+        values = self._pools[column].values
+        counts: Dict[Any, int] = {}
+        for code, count in Counter(self._columns[column]).items():
+            if code == _MISSING and default is None:
+                continue
+            value = values[code] if code != _MISSING else default
+            counts[value] = counts.get(value, 0) + count
+        return counts
+
+    def where(self, **criteria: Any) -> Iterator[Dict[str, Any]]:
+        """Findings whose columns equal the given values, e.g. where(severity="high", scanner="bandit")."""
+        wanted: List[Tuple[array, int]] = []
+        for column, value in criteria.items():
+            code = self._pools[column].codes.get(value)
+            if code is None:
+                return
+            wanted.append((self._columns[column], code))
+        for row in range(self._size):
+            if all(cells[row] == code for cells, code in wanted):
+                yield self._row(row)
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """Plain JSON-serializable list, for APIs and callbacks."""
+        return list(self)
+
+    def to_orm(self, factory: Callable[[Dict[str, Any]], Any]) -> Iterator[Any]:
+        """ORM rows built one at a time by `factory(finding)`, so a large table is never duplicated as objects."""
+        for finding in self:
+            yield factory(finding)
+
+
+SEVERITIES = ("critical", "high", "medium", "low", "info")
+
+
+class FindingSummary:
+    """Severity, scanner and rule histograms, updated as findings stream past.
+
+    `observe` passes findings through unchanged while counting them, so the
+    summary is built in the same pass that stores them and no scanner's
+    output has to be walked (or kept) a second time.
+    """
+    __slots__ = ("total", "by_severity", "by_scanner", "by_rule")
+
+    def __init__(self):
+        self.total = 0
+        self.by_severity: Counter = Counter({severity: 0 for severity in SEVERITIES})
+        self.by_scanner: Counter = Counter()
+        self.by_rule: Counter = Counter()
+
+    def add(self, finding: Dict[str, Any]):
+        severity = finding.get("severity", "medium")
+        self.total += 1
+        self.by_severity[severity if severity in SEVERITIES else "medium"] += 1
+        self.by_scanner[finding.get("scanner")] += 1
+        self.by_rule[finding.get("title")] += 1
+
+    def observe(self, findings: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        for finding in findings:
+            self.add(finding)
+            yield finding
+
+    def as_dict(self, scanners: Iterable[str]) -> Dict[str, Any]:
+        """The `findings_summary` of a scan result; rules are ordered from most to least frequent."""
+        return {
+            "total": self.total,
+            "by_severity": {severity: self.by_severity[severity] for severity in SEVERITIES},
+            "by_scanner": {scanner: self.by_scanner[scanner] for scanner in scanners},
+            "by_rule": dict(self.by_rule.most_common()),
+        }
@@ -0,0 +1,183 @@
+import base64, hashlib, json, logging, os, re, zlib
+from collections import Counter
+from typing import Any, Dict, Iterable, Iterator, Optional, Set, Tuple
+
+logger = logging.getLogger("fingerprints")
+
+# Bumped when the fingerprint recipe changes, so old and new fingerprints never collide
+FINGERPRINT_VERSION = "1"
+FINGERPRINT_TTL = int(os.getenv("FINGERPRINT_TTL", 90 * 24 * 3600))
+
+_LOCATION_RE = re.compile(r"^(?P<path>.*?):(?P<line>\d+|None)(?::(?:\d+|None))?$")
+_WHITESPACE_RE = re.compile(r"\s+")
+_CWE_RE = re.compile(r"CWE-(\d+)", re.IGNORECASE)
+_SECRET_RULE_RE = re.compile(r"secret|hardcoded|password|credential|api[-_.]?key|trufflehog", re.IGNORECASE)
+# Hard-coded credentials (798, 259, 321) are reported as one category, whichever tool found them
+_SECRET_CWES = {"798", "259", "321"}
+# What semgrep reports as the flagged code when not logged in; the same for every finding, so not a snippet
+_PLACEHOLDER_SNIPPETS = {"requires login"}
+
+
+def _field(finding: Any, name: str) -> Any:
+    """Attribute of a Finding model, or key of a scanner finding dict."""
+    if isinstance(finding, dict):
+        return finding.get(name)
+    return getattr(finding, name, None)
+
+
+def normalize_path(path: Optional[str], root: Optional[str] = None) -> str:
+    path = (path or "").replace("\\", "/")
+    if root:
+        prefix = root.replace("\\", "/").rstrip("/") + "/"
+        if path.startswith(prefix):
+            path = path[len(prefix):]
+    while path.startswith("./"):
+        path = path[2:]
+    return path
+
+
+def finding_location(finding: Any, root: Optional[str] = None) -> Tuple[str, str]:
+    """(repository-relative path or URL, line) of a finding; line is "" when unknown."""
+    location = _field(finding, "location")
+    if location:
+        match = _LOCATION_RE.match(location)
+        if match:
+            line = match.group("line")
+            return normalize_path(match.group("path"), root), "" if line == "None" else line
+        return normalize_path(location, root), ""
+    file_path = _field(finding, "file_path")
+    if file_path:
+        line = _field(finding, "line_start")
+        return normalize_path(file_path, root), "" if line is None else str(line)
+    # DAST/API findings: endpoint, qualified by method when known
+    url = _field(finding, "url") or _field(finding, "path") or ""
+    method = (_field(finding, "details") or {}).get("method", "") if isinstance(finding, dict) else ""
+    return f"{method} {url}".strip(), ""
+
+
+def snippet_hash(code: Optional[str]) -> str:
+    """Hash of the flagged code with whitespace collapsed, so reindenting or moving it keeps the hash.
+
+    "" when there is no real code, so the finding is anchored by its line instead.
+    """
+    code = _WHITESPACE_RE.sub(" ", code or "").strip()
+    if not code or code in _PLACEHOLDER_SNIPPETS:
+        return ""
+    return hashlib.sha256(code.encode()).hexdigest()[:16]
+
+
+def rule_id(finding: Any) -> str:
+    return str(_field(finding, "rule_id") or _field(finding, "ruleId") or _field(finding, "title") or "unknown")
+
+
+def category(finding: Any) -> Optional[str]:
+    """Tool-independent class of the issue (CWE, or "secret"), used to spot one issue reported by several tools."""
+    cwe = _field(finding, "cwe")
+    match = _CWE_RE.search(str(cwe)) if cwe is not None else None
+    cwe = match.group(1) if match else (str(cwe) if isinstance(cwe, int) else None)
+    if cwe in _SECRET_CWES or _SECRET_RULE_RE.search(rule_id(finding)):
+        return "secret"
+    return f"CWE-{cwe}" if cwe else None
+
+
+def fingerprint(finding: Any, root: Optional[str] = None, occurrence: int = 0) -> str:
+    """Stable identity of a finding across scans.
+
+    Built from the rule, the repository-relative path and the hash of the
+    flagged code. The line number is only used when the tool reports no
+    code, so a finding keeps its fingerprint when unrelated edits shift it.
+    `occurrence` tells apart identical code flagged more than once in a file.
+    """
+    path, line = finding_location(finding, root)
+    anchor = snippet_hash(_field(finding, "code")) or line
+    parts = (FINGERPRINT_VERSION, rule_id(finding), path, anchor, str(occurrence))
+    return hashlib.sha256("\0".join(parts).encode()).hexdigest()[:32]
+
+
+class FingerprintIndex:
+    """Fingerprints the findings of one scan and drops duplicates as they stream in.
+
+    A finding is a duplicate when it has the same rule and location as one
+    already seen (the same file reported by two shards, or by the cache and
+    a fresh run), or when another tool already reported an issue of the same
+    category (CWE, or hard-coded secret) on the same line.
+    """
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root
+        self.fingerprints: Set[str] = set()
+        self.duplicates = 0
+        self._seen: Set[Tuple[str, str, str, str]] = set()
+        self._occurrences: Counter = Counter()
+        self._categories: Dict[Tuple[str, str, str], Any] = {}
+
+    def add(self, finding: Any, scanner: Optional[str] = None) -> Any:
+        """The finding with its fingerprint set, or None if it duplicates one already added.
+
+        Finding dicts are copied with a "fingerprint" key; Finding models get
+        the attribute set. `scanner` defaults to the finding's own "scanner".
+        """
+        path, line = finding_location(finding, self.root)
+        rule, anchor = rule_id(finding), snippet_hash(_field(finding, "code")) or line
+        if (rule, path, line, anchor) in self._seen:
+            self.duplicates += 1
+            return None
+        issue = category(finding)
+        scanner = scanner or _field(finding, "scanner")
+        if issue and line:
+            owner = self._categories.setdefault((issue, path, line), scanner)
+            if owner != scanner:
+                self.duplicates += 1
+                return None
+        self._seen.add((rule, path, line, anchor))
+        occurrence = self._occurrences[(rule, path, anchor)]
+        self._occurrences[(rule, path, anchor)] += 1
+        value = fingerprint(finding, self.root, occurrence)
+        self.fingerprints.add(value)
+        if isinstance(finding, dict):
+            return {**finding, "fingerprint": value}
+        finding.fingerprint = value
+        return finding
+
+    def unique(self, findings: Iterable[Any], scanner: Optional[str] = None) -> Iterator[Any]:
+        for finding in findings:
+            finding = self.add(finding, scanner)
+            if finding is not None:
+                yield finding
+
+
+def diff_fingerprints(previous: Optional[Set[str]], current: Set[str]) -> Optional[Dict[str, Any]]:
+    """New, fixed and unchanged findings relative to the previous scan; None for the first scan."""
+    if previous is None:
+        return None
+    return {
+        "new": sorted(current - previous),
+        "fixed": sorted(previous - current),
+        "unchanged": len(current & previous),
+    }
+
+
+class FingerprintStore:
+    """The fingerprints of the last complete scan of each project and branch, in Redis."""
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+
+    @staticmethod
+    def key(project: str, branch: Optional[str]) -> str:
+        return "findings:fingerprints:" + hashlib.sha256(f"{project}@{branch or ''}".encode()).hexdigest()[:32]
+
+    def get(self, project: str, branch: Optional[str]) -> Optional[Set[str]]:
+        try:
+            blob = self.redis.get(self.key(project, branch))
+            return set(json.loads(zlib.decompress(base64.b64decode(blob)))) if blob else None
+        except Exception as e:
+            logger.warning(f"Cannot read fingerprints of {project}@{branch}: {e}")
+            return None
+
+    def put(self, project: str, branch: Optional[str], fingerprints: Iterable[str]):
+        blob = base64.b64encode(zlib.compress(json.dumps(sorted(fingerprints)).encode()))
+        try:
+            self.redis.set(self.key(project, branch), blob, ex=FINGERPRINT_TTL)
+        except Exception as e:
+            logger.warning(f"Cannot store fingerprints of {project}@{branch}: {e}")
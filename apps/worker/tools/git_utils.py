@@ -1,12 +1,12 @@
-import subprocess, tempfile, os, shutil
+import subprocess
+from .repo_cache import get_repo_cache
 
 def clone_repo(repo_url: str, branch: str) -> str:
-    workdir = tempfile.mkdtemp(prefix="arxio-")
+    # Checkouts come from the local mirror cache; only new commits hit the network
     try:
-        subprocess.run(
-            ["git", "clone", "--depth", "1", "--branch", branch, repo_url, workdir],
-            check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        return workdir
-    except subprocess.CalledProcessError as e:
-        shutil.rmtree(workdir, ignore_errors=True)
-        raise RuntimeError(f"Git clone failed: {e.stderr.decode()}") 
\ No newline at end of file
+        return get_repo_cache().checkout(repo_url, branch)
+    except (RuntimeError, subprocess.SubprocessError) as e:
+        raise RuntimeError(f"Git clone failed: {e}")
+
+def release_repo(workdir: str):
+    get_repo_cache().release(workdir)
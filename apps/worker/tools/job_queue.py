@@ -0,0 +1,186 @@
+import json, logging, os, socket, threading, time, uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+import redis
+
+from .scheduler import RequeueJob
+
+logger = logging.getLogger("scan-queue")
+
+STREAM_KEY = os.getenv("SCAN_JOBS_STREAM", "scan:jobs")
+DEAD_LETTER_KEY = f"{STREAM_KEY}:dead"
+GROUP_NAME = os.getenv("SCAN_JOBS_GROUP", "scan-workers")
+
+# A job that was delivered but not acked for this long belongs to a dead consumer.
+# Live consumers refresh the idle time of their in-flight jobs well before that.
+CLAIM_IDLE_MS = int(os.getenv("SCAN_JOBS_CLAIM_IDLE_MS", 5 * 60 * 1000))
+MAX_ATTEMPTS = int(os.getenv("SCAN_JOBS_MAX_ATTEMPTS", 3))
+JOB_STATE_TTL = 7 * 24 * 3600
+STREAM_MAXLEN = 100_000
+REQUEUE_DELAY_SECONDS = 2
+
+
+def _job_state_key(scan_id: str) -> str:
+    return f"scan:job:{scan_id}"
+
+
+class ScanJobQueue:
+    """Durable scan queue on top of a Redis Streams consumer group.
+
+    Every replica reads from the same group, so each job is delivered to a
+    single consumer. Jobs are acked only after the handler returns; jobs left
+    pending by a crashed consumer, or by a handler that raised, are reclaimed
+    with XAUTOCLAIM and retried, up to `max_attempts` deliveries before they
+    go to the dead-letter stream.
+    """
+
+    def __init__(self, redis_client: redis.Redis, max_workers: int = 2,
+                 consumer: Optional[str] = None, stream: str = STREAM_KEY,
+                 group: str = GROUP_NAME, claim_idle_ms: int = CLAIM_IDLE_MS,
+                 max_attempts: int = MAX_ATTEMPTS):
+        self.redis = redis_client
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.max_workers = max_workers
+        self.claim_idle_ms = claim_idle_ms
+        self.heartbeat_seconds = max(1, claim_idle_ms // 1000 // 5)
+        self.max_attempts = max_attempts
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._in_flight: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._claim_cursor = "0-0"
+        self.ensure_group()
+
+    def ensure_group(self):
+        try:
+            self.redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def enqueue(self, job: Dict[str, Any]) -> Optional[str]:
+        """Add a job to the stream. Idempotent per scanId; returns None for duplicates."""
+        scan_id = job.get("scanId")
+        if scan_id and not self.redis.set(_job_state_key(scan_id), "queued", nx=True, ex=JOB_STATE_TTL):
+            logger.info(f"Scan {scan_id} already queued, ignoring duplicate request")
+            return None
+        try:
+            return self.redis.xadd(self.stream, {"job": json.dumps(job)},
+                                   maxlen=STREAM_MAXLEN, approximate=True)
+        except BaseException:
+            # Otherwise every retry of the request would be ignored as a duplicate
+            if scan_id:
+                self.redis.delete(_job_state_key(scan_id))
+            raise
+
+    def consume(self, handler: Callable[[Dict[str, Any]], None],
+                stop_event: Optional[threading.Event] = None, block_ms: int = 5000):
+        """Run jobs through `handler` with at most `max_workers` in flight until stopped."""
+        stop_event = stop_event or threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(stop_event,), daemon=True)
+        heartbeat.start()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="scan") as pool:
+            while not stop_event.is_set():
+                # Only pull a job from Redis when there is a free slot for it,
+                # so undelivered jobs stay available to other replicas.
+                if not self._slots.acquire(timeout=1):
+                    continue
+                try:
+                    message = self._next_message(block_ms)
+                except redis.ConnectionError as e:
+                    logger.error(f"Redis connection error while reading jobs: {e}")
+                    self._slots.release()
+                    time.sleep(1)
+                    continue
+                if not message:
+                    self._slots.release()
+                    continue
+
+                message_id, fields = message
+                with self._lock:
+                    self._in_flight[message_id] = fields.get("job", "")
+                pool.submit(self._process, message_id, fields, handler)
+
+    def _next_message(self, block_ms: int):
+        # Stalled jobs from dead consumers take precedence over new ones
+        # The cursor XAUTOCLAIM returns resumes the scan of the pending list after this batch,
+        # and is back at 0-0 once the whole list was scanned
+        next_id, claimed, *_ = self.redis.xautoclaim(
+            self.stream, self.group, self.consumer, self.claim_idle_ms,
+            start_id=self._claim_cursor, count=1)
+        self._claim_cursor = next_id
+        if claimed:
+            logger.warning(f"Reclaimed stalled job {claimed[0][0]}")
+            return claimed[0]
+
+        response = self.redis.xreadgroup(self.group, self.consumer, {self.stream: ">"},
+                                         count=1, block=block_ms)
+        if not response:
+            return None
+        _, messages = response[0]
+        return messages[0] if messages else None
+
+    def _process(self, message_id: str, fields: Dict[str, str], handler):
+        ack = True
+        try:
+            try:
+                job = json.loads(fields.get("job", ""))
+            except json.JSONDecodeError:
+                logger.error(f"Dropping malformed job {message_id}: {fields}")
+                return
+
+            scan_id = job.get("scanId")
+            state_key = _job_state_key(scan_id) if scan_id else None
+            if state_key and self.redis.get(state_key) == "done":
+                logger.info(f"Scan {scan_id} already completed, skipping redelivery")
+                return
+
+            attempts = self.redis.hincrby(f"{self.stream}:attempts", message_id, 1)
+            if attempts > self.max_attempts:
+                logger.error(f"Job {message_id} exceeded {self.max_attempts} attempts, moving to dead letter")
+                self.redis.xadd(DEAD_LETTER_KEY, {"job": fields.get("job", ""), "source_id": message_id},
+                                maxlen=STREAM_MAXLEN, approximate=True)
+                return
+
+            try:
+                handler(job)
+            except RequeueJob as e:
+                # Back to the tail of the stream, as a fresh message with a fresh attempt count
+                logger.info(f"Requeueing job {message_id}: {e}")
+                time.sleep(REQUEUE_DELAY_SECONDS)
+                self.redis.xadd(self.stream, {"job": fields.get("job", "")},
+                                maxlen=STREAM_MAXLEN, approximate=True)
+                return
+            if state_key:
+                self.redis.set(state_key, "done", ex=JOB_STATE_TTL)
+        except Exception as e:
+            # Left pending: without heartbeats it is reclaimed after claim_idle_ms and retried
+            ack = False
+            logger.exception(f"Job {message_id} failed, will retry in {self.claim_idle_ms // 1000}s: {e}")
+        finally:
+            with self._lock:
+                self._in_flight.pop(message_id, None)
+            if ack:
+                try:
+                    self.redis.xack(self.stream, self.group, message_id)
+                    self.redis.hdel(f"{self.stream}:attempts", message_id)
+                except redis.RedisError as e:
+                    # The job stays pending and will be reclaimed; the done marker prevents a rerun
+                    logger.error(f"Failed to ack job {message_id}: {e}")
+            self._slots.release()
+
+    def _heartbeat(self, stop_event: threading.Event):
+        # Re-claiming our own pending jobs resets their idle time, which keeps
+        # other replicas from stealing scans that are still running here.
+        while not stop_event.wait(self.heartbeat_seconds):
+            with self._lock:
+                message_ids = list(self._in_flight)
+            if not message_ids:
+                continue
+            try:
+                self.redis.xclaim(self.stream, self.group, self.consumer, 0, message_ids, justid=True)
+            except redis.RedisError as e:
+                logger.error(f"Heartbeat for in-flight jobs failed: {e}")
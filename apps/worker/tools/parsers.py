@@ -1,67 +1,115 @@
 import json, pathlib
+from contextlib import contextmanager
+import ijson
 from models import Finding, Severity
 
-def semgrep_to_findings(path: pathlib.Path):
-    if not path.exists(): 
-        return
-    data = json.loads(path.read_text())
-    for res in data.get("results", []):
-        sev = Severity[res["extra"]["severity"].upper()]
-        yield Finding(
-            rule_id=res["check_id"],
-            title=res["extra"]["message"][:120],
-            description=res["extra"].get("metadata", {}).get("description", ""),
-            severity=sev,
-            file_path=res["path"],
-            line_start=res["start"]["line"],
-            line_end=res["end"]["line"]
-        )
+# Reports are parsed incrementally: only the record being converted is held in
+# memory, so large semgrep/ZAP reports don't grow the worker's footprint.
 
-def trufflehog_to_findings(path: pathlib.Path):
+@contextmanager
+def _open_report(source):
+    """Binary stream for a report path, or `source` itself if it is already a stream."""
+    if hasattr(source, "read"):
+        yield source
+        return
+    path = pathlib.Path(source)
     if not path.exists() or path.stat().st_size == 0:
+        yield None
         return
-    
-    lines = path.read_text().splitlines()
-    for line in lines:
-        if not line.strip():
-            continue
-        
-        try:
-            result = json.loads(line)
+    with path.open("rb") as fh:
+        yield fh
+
+_CONTAINERS = {"start_map": 1, "start_array": 1, "end_map": -1, "end_array": -1}
+
+def iter_report_items(fh, prefixes):
+    """(prefix, item) for the items of several arrays of a report (e.g. "results.item",
+    "errors.item"), in one pass, so a pipe can be read for both without buffering either."""
+    builder, depth, current = None, 0, None
+    for prefix, event, value in ijson.parse(fh, use_float=True):
+        if builder is None:
+            if prefix not in prefixes or event in ("end_map", "end_array", "map_key"):
+                continue
+            if event not in ("start_map", "start_array"):
+                yield prefix, value
+                continue
+            builder, depth, current = ijson.ObjectBuilder(), 0, prefix
+        builder.event(event, value)
+        depth += _CONTAINERS.get(event, 0)
+        if depth == 0:
+            yield current, builder.value
+            builder = None
+
+def semgrep_error_paths(error):
+    """Files a semgrep `errors` entry is about (named in "path" or in its spans)."""
+    paths = {error["path"]} if error.get("path") else set()
+    paths.update(span["file"] for span in error.get("spans") or [] if span.get("file"))
+    return paths
+
+def semgrep_to_findings(source, errors=None):
+    """Findings of a semgrep JSON report; the report's `errors` entries are appended to `errors` if given."""
+    with _open_report(source) as fh:
+        if fh is None:
+            return
+        if errors is None:
+            items = (("results.item", res) for res in ijson.items(fh, "results.item", use_float=True))
+        else:
+            items = iter_report_items(fh, ("results.item", "errors.item"))
+        for prefix, res in items:
+            if prefix == "errors.item":
+                errors.append(res)
+                continue
+            sev = Severity[res["extra"]["severity"].upper()]
             yield Finding(
-                rule_id=f"trufflehog:{result.get('DetectorType', 'secret')}",
-                title=f"Secret found: {result.get('DetectorType', 'Unknown')}",
-                description=f"Found potentially hardcoded secret of type {result.get('DetectorType')}\n"
-                            f"Secret: {result.get('Raw', '')[:20]}...",
-                severity=Severity.HIGH,
-                file_path=result.get("SourceMetadata", {}).get("Data", {}).get("Filesystem", {}).get("file", ""),
-                line_start=result.get("SourceMetadata", {}).get("Data", {}).get("Filesystem", {}).get("line", 0),
-                line_end=result.get("SourceMetadata", {}).get("Data", {}).get("Filesystem", {}).get("line", 0),
+                rule_id=res["check_id"],
+                title=res["extra"]["message"][:120],
+                description=res["extra"].get("metadata", {}).get("description", ""),
+                severity=sev,
+                file_path=res["path"],
+                line_start=res["start"]["line"],
+                line_end=res["end"]["line"]
             )
-        except (json.JSONDecodeError, KeyError) as e:
-            print(f"Error parsing TruffleHog result: {e}")
-            continue
 
-def osv_to_findings(path: pathlib.Path):
-    if not path.exists() or path.stat().st_size == 0:
-        return
-    
-    try:
-        data = json.loads(path.read_text())
-        for result in data.get("results", []):
-            for pkg in result.get("packages", []):
+def trufflehog_to_findings(source):
+    with _open_report(source) as fh:
+        if fh is None:
+            return
+        for line in fh:
+            if not line.strip():
+                continue
+
+            try:
+                result = json.loads(line)
+                yield Finding(
+                    rule_id=f"trufflehog:{result.get('DetectorType', 'secret')}",
+                    title=f"Secret found: {result.get('DetectorType', 'Unknown')}",
+                    description=f"Found potentially hardcoded secret of type {result.get('DetectorType')}\n"
+                                f"Secret: {result.get('Raw', '')[:20]}...",
+                    severity=Severity.HIGH,
+                    file_path=result.get("SourceMetadata", {}).get("Data", {}).get("Filesystem", {}).get("file", ""),
+                    line_start=result.get("SourceMetadata", {}).get("Data", {}).get("Filesystem", {}).get("line", 0),
+                    line_end=result.get("SourceMetadata", {}).get("Data", {}).get("Filesystem", {}).get("line", 0),
+                )
+            except (json.JSONDecodeError, KeyError) as e:
+                print(f"Error parsing TruffleHog result: {e}")
+                continue
+
+def osv_to_findings(source):
+    severity_mapping = {
+        "CRITICAL": Severity.CRITICAL,
+        "HIGH": Severity.HIGH,
+        "MEDIUM": Severity.MEDIUM,
+        "LOW": Severity.LOW,
+        "": Severity.INFO
+    }
+    with _open_report(source) as fh:
+        if fh is None:
+            return
+        try:
+            for pkg in ijson.items(fh, "results.item.packages.item", use_float=True):
                 for vuln in pkg.get("vulnerabilities", []):
-                    severity_mapping = {
-                        "CRITICAL": Severity.CRITICAL,
-                        "HIGH": Severity.HIGH,
-                        "MEDIUM": Severity.MEDIUM,
-                        "LOW": Severity.LOW,
-                        "": Severity.INFO
-                    }
-                    
                     sev_str = vuln.get("severity", "").upper()
                     sev = severity_mapping.get(sev_str, Severity.INFO)
-                    
+
                     yield Finding(
                         rule_id=f"osv:{vuln.get('id', 'unknown')}",
                         title=f"Vulnerable dependency: {pkg.get('name')} {pkg.get('version')}",
@@ -70,27 +118,26 @@ def osv_to_findings(path: pathlib.Path):
                         file_path="package.json",
                         url=vuln.get("references", [{}])[0].get("url", "")
                     )
-    except (json.JSONDecodeError, KeyError) as e:
-        print(f"Error parsing OSV scanner result: {e}")
-        return
+        except (ijson.JSONError, KeyError) as e:
+            print(f"Error parsing OSV scanner result: {e}")
+            return
+
+# Map ZAP risk to our severity
+ZAP_RISK_TO_SEVERITY = {
+    "High": Severity.HIGH,
+    "Medium": Severity.MEDIUM,
+    "Low": Severity.LOW,
+    "Informational": Severity.INFO
+}
+
+def zap_to_findings(source):
+    with _open_report(source) as fh:
+        if fh is None:
+            return
+        try:
+            for alert in ijson.items(fh, "site.item.alerts.item", use_float=True):
+                sev = ZAP_RISK_TO_SEVERITY.get(alert.get("risk", ""), Severity.INFO)
 
-def zap_to_findings(path: pathlib.Path):
-    if not path.exists() or path.stat().st_size == 0:
-        return
-    
-    try:
-        data = json.loads(path.read_text())
-        for site in data.get("site", []):
-            for alert in site.get("alerts", []):
-                # Map ZAP risk to our severity
-                risk_to_severity = {
-                    "High": Severity.HIGH,
-                    "Medium": Severity.MEDIUM,
-                    "Low": Severity.LOW,
-                    "Informational": Severity.INFO
-                }
-                sev = risk_to_severity.get(alert.get("risk", ""), Severity.INFO)
-                
                 # Get instances of this alert
                 for instance in alert.get("instances", []):
                     yield Finding(
@@ -100,6 +147,17 @@ def zap_to_findings(path: pathlib.Path):
                         severity=sev,
                         url=instance.get("uri", "")
                     )
-    except (json.JSONDecodeError, KeyError) as e:
-        print(f"Error parsing ZAP result: {e}")
-        return 
\ No newline at end of file
+        except (ijson.JSONError, KeyError) as e:
+            print(f"Error parsing ZAP result: {e}")
+            return
+
+def zap_alerts_to_findings(alerts):
+    """Findings for alerts from ZAP's API (core/view/alerts), one alert per instance."""
+    for alert in alerts:
+        yield Finding(
+            rule_id=f"zap:{alert.get('pluginId', '')}",
+            title=(alert.get("name") or alert.get("alert", ""))[:120],
+            description=f"{alert.get('description', '')}\n\nSolution: {alert.get('solution', '')}",
+            severity=ZAP_RISK_TO_SEVERITY.get(alert.get("risk", ""), Severity.INFO),
+            url=alert.get("url", "")
+        )
@@ -0,0 +1,147 @@
+import collections, contextvars, subprocess, threading
+from typing import Any, Callable, List, Optional
+
+# Only the tail of stderr is kept, for error reporting
+STDERR_TAIL_BYTES = 64 * 1024
+
+
+class CancelScope:
+    """Kills the tools a scan started, from any thread, when the scan is cancelled.
+
+    Every ProcessStream entered while the scope is current (`scope.run(fn)`,
+    and threads started with `contextvars.copy_context().run`) registers its
+    process; `cancel` kills them all and any stream opened later is killed as
+    soon as it starts, so a cancelled scan stops within one read.
+    """
+    __slots__ = ("cancelled", "_lock", "_processes")
+
+    def __init__(self):
+        self.cancelled = False
+        self._lock = threading.Lock()
+        self._processes = set()
+
+    def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        token = _current_scope.set(self)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current_scope.reset(token)
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            processes = list(self._processes)
+        for process in processes:
+            _kill(process)
+
+    def _register(self, process: subprocess.Popen):
+        with self._lock:
+            if not self.cancelled:
+                self._processes.add(process)
+                return
+        _kill(process)
+
+    def _unregister(self, process: subprocess.Popen):
+        with self._lock:
+            self._processes.discard(process)
+
+
+_current_scope: "contextvars.ContextVar[Optional[CancelScope]]" = contextvars.ContextVar(
+    "process_cancel_scope", default=None)
+
+
+def _kill(process: subprocess.Popen):
+    try:
+        process.kill()
+    except ProcessLookupError:
+        pass
+
+
+class ProcessStream:
+    """Run a tool and expose its stdout as a pipe for incremental parsing.
+
+    Output is consumed while the tool is still running, so nothing is written
+    to disk or buffered whole in memory. stderr is drained on a background
+    thread so the tool never blocks on a full pipe. If `timeout` elapses the
+    process is killed and `subprocess.TimeoutExpired` is raised on exit.
+
+        with ProcessStream(cmd, timeout=600) as proc:
+            yield from semgrep_to_findings(proc.stdout)
+    """
+
+    def __init__(self, cmd: List[str], timeout: Optional[float] = None,
+                 on_start: Optional[Callable[[subprocess.Popen], None]] = None):
+        self.cmd = cmd
+        self.timeout = timeout
+        self.on_start = on_start
+        self.process: Optional[subprocess.Popen] = None
+        self.timed_out = threading.Event()
+        self._stderr = collections.deque()
+        self._stderr_size = 0
+        self._stderr_thread = None
+        self._timer = None
+        self._scope = _current_scope.get()
+
+    @property
+    def stdout(self):
+        return self.process.stdout
+
+    @property
+    def stderr(self) -> str:
+        return b"".join(self._stderr).decode(errors="replace")
+
+    @property
+    def returncode(self) -> Optional[int]:
+        return self.process.returncode if self.process else None
+
+    def __enter__(self) -> "ProcessStream":
+        self.process = subprocess.Popen(self.cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if self._scope:
+            self._scope._register(self.process)
+        self._stderr_thread = threading.Thread(target=self._drain_stderr, daemon=True)
+        self._stderr_thread.start()
+        if self.timeout:
+            self._timer = threading.Timer(self.timeout, self._kill_on_timeout)
+            self._timer.daemon = True
+            self._timer.start()
+        if self.on_start:
+            try:
+                self.on_start(self.process)
+            except BaseException:
+                self.__exit__(None, None, None)
+                raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                # The parser may stop before EOF (e.g. trailing metadata); let the tool finish writing
+                for _ in iter(lambda: self.process.stdout.read(65536), b""):
+                    pass
+            else:
+                # Consumer failed or stopped early; nobody will read the rest
+                self.process.kill()
+            self.process.wait()
+        finally:
+            if self._timer:
+                self._timer.cancel()
+            if self._scope:
+                self._scope._unregister(self.process)
+            self.process.stdout.close()
+            self._stderr_thread.join()
+            self.process.stderr.close()
+        if self.timed_out.is_set() and exc_type is not GeneratorExit:
+            # A kill mid-report usually surfaces as a parse error; report the real cause
+            raise subprocess.TimeoutExpired(self.cmd, self.timeout, stderr=self.stderr) from exc
+        return False
+
+    def _kill_on_timeout(self):
+        self.timed_out.set()
+        self.process.kill()
+
+    def _drain_stderr(self):
+        for chunk in iter(lambda: self.process.stderr.read(8192), b""):
+            self._stderr.append(chunk)
+            self._stderr_size += len(chunk)
+            while self._stderr_size > STDERR_TAIL_BYTES and len(self._stderr) > 1:
+                self._stderr_size -= len(self._stderr.popleft())
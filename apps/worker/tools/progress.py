@@ -0,0 +1,171 @@
+import json, logging, os, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
+
+import redis
+
+logger = logging.getLogger("scan-progress")
+
+PROGRESS_MAX_UPDATES_PER_SECOND = float(os.getenv("PROGRESS_MAX_UPDATES_PER_SECOND", 2))
+# Older log lines are dropped from the stored snapshot so it doesn't grow without bound
+PROGRESS_MAX_LOGS = int(os.getenv("PROGRESS_MAX_LOGS", 500))
+# Snapshots of different scans are posted concurrently, so one slow request doesn't hold up the rest
+PROGRESS_POST_WORKERS = int(os.getenv("PROGRESS_POST_WORKERS", 4))
+
+
+class _ScanProgress:
+    __slots__ = ("snapshot", "delta", "last_flush", "final", "posting", "next_post")
+
+    def __init__(self):
+        self.snapshot: Dict[str, Any] = {"logs": [], "steps": []}
+        self.delta: Dict[str, Any] = {}
+        self.last_flush = 0.0
+        self.final = False
+        # A post of this scan is in flight; `next_post` is the newest snapshot waiting behind it
+        self.posting = False
+        self.next_post: Optional[str] = None
+
+
+class ProgressAggregator:
+    """Coalesces scan progress updates and flushes them on a background thread.
+
+    Scanners call `update` as often as they like; it only merges into an
+    in-memory snapshot and never blocks on Redis or HTTP. Each scan is flushed
+    at most `max_rate` times per second: the full snapshot is stored under
+    `scan:progress:{scan_id}` (and handed to `post`, if given) and only the
+    changes since the previous flush are published on `scan:updates`.
+    Posts run on a small pool, one at a time per scan: a snapshot that is
+    superseded while the previous post is still in flight is never sent.
+
+    Merge rules: `logs` are appended, `steps` are matched by id, and any other
+    key is replaced.
+    """
+
+    def __init__(self, redis_client: redis.Redis,
+                 post: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                 max_rate: float = PROGRESS_MAX_UPDATES_PER_SECOND,
+                 max_logs: int = PROGRESS_MAX_LOGS, post_workers: int = PROGRESS_POST_WORKERS):
+        self.redis = redis_client
+        self.post = post
+        self._posts = ThreadPoolExecutor(max_workers=post_workers, thread_name_prefix="progress-post") if post else None
+        self.interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        self.max_logs = max_logs
+        self._cond = threading.Condition()
+        self._scans: Dict[str, _ScanProgress] = {}
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="progress-flush", daemon=True)
+        self._thread.start()
+
+    def update(self, scan_id: str, update: Dict[str, Any], final: bool = False):
+        """Merge `update` into the scan's progress. `final` flushes right away and forgets the scan."""
+        with self._cond:
+            state = self._scans.get(scan_id)
+            if state is None:
+                state = self._scans[scan_id] = _ScanProgress()
+            self._merge(state, update)
+            state.final = state.final or final
+            self._cond.notify()
+
+    def close(self, timeout: float = 10):
+        """Flush everything still pending, wait for posts in flight and stop the background threads."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        if self._posts:
+            self._posts.shutdown(wait=True)
+
+    def _merge(self, state: _ScanProgress, update: Dict[str, Any]):
+        snapshot, delta = state.snapshot, state.delta
+        for key, value in update.items():
+            if key == "logs":
+                snapshot["logs"].extend(value)
+                del snapshot["logs"][:-self.max_logs]
+                delta.setdefault("logs", []).extend(value)
+            elif key == "steps":
+                index = {step.get("id"): i for i, step in enumerate(snapshot["steps"])}
+                changed = {step.get("id"): step for step in delta.get("steps", [])}
+                for step in value:
+                    i = index.get(step.get("id"))
+                    if i is None:
+                        index[step.get("id")] = len(snapshot["steps"])
+                        snapshot["steps"].append(step)
+                    elif snapshot["steps"][i] != step:
+                        snapshot["steps"][i] = step
+                    else:
+                        continue
+                    changed[step.get("id")] = step
+                if changed:
+                    delta["steps"] = list(changed.values())
+            elif snapshot.get(key, object()) != value:
+                snapshot[key] = value
+                delta[key] = value
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    due, next_due = [], None
+                    for scan_id, state in self._scans.items():
+                        if not state.delta and not state.final:
+                            continue
+                        ready_at = state.last_flush + self.interval
+                        if state.final or self._closed or ready_at <= now:
+                            due.append(scan_id)
+                        elif next_due is None or ready_at < next_due:
+                            next_due = ready_at
+                    if due or self._closed:
+                        break
+                    self._cond.wait(None if next_due is None else next_due - now)
+
+                batch = []
+                for scan_id in due:
+                    state = self._scans[scan_id]
+                    batch.append((scan_id, state, json.dumps(state.snapshot), state.delta))
+                    state.delta = {}
+                    state.last_flush = now
+                    if state.final:
+                        del self._scans[scan_id]
+                if self._closed and not batch:
+                    return
+
+            for scan_id, state, snapshot, delta in batch:
+                self._flush(scan_id, snapshot, delta)
+                if self.post:
+                    self._queue_post(scan_id, state, snapshot)
+
+    def _queue_post(self, scan_id: str, state: _ScanProgress, snapshot: str):
+        with self._cond:
+            if state.posting:
+                # Replaces any older snapshot still waiting; only the newest one is worth sending
+                state.next_post = snapshot
+                return
+            state.posting = True
+        self._posts.submit(self._post, scan_id, state, snapshot)
+
+    def _post(self, scan_id: str, state: _ScanProgress, snapshot: str):
+        while True:
+            try:
+                self.post(scan_id, json.loads(snapshot))
+            except Exception as e:
+                logger.error(f"Failed to send progress for scan {scan_id}: {e}")
+            with self._cond:
+                snapshot, state.next_post = state.next_post, None
+                if snapshot is None:
+                    state.posting = False
+                    return
+
+    def _flush(self, scan_id: str, snapshot: str, delta: Dict[str, Any]):
+        try:
+            self.redis.set(f"scan:progress:{scan_id}", snapshot)
+            if delta:
+                self.redis.publish("scan:updates", json.dumps({
+                    "scanId": scan_id,
+                    "type": "progress_update",
+                    "timestamp": datetime.now(timezone.utc).isoformat(),
+                    "data": delta,
+                }))
+        except redis.RedisError as e:
+            logger.error(f"Failed to store progress for scan {scan_id}: {e}")
@@ -0,0 +1,194 @@
+import fcntl, hashlib, logging, os, shutil, subprocess, tempfile, time
+from contextlib import contextmanager
+from typing import Optional
+
+logger = logging.getLogger("repo-cache")
+
+REPO_CACHE_DIR = os.getenv("REPO_CACHE_DIR", os.path.join(tempfile.gettempdir(), "arxio-repo-cache"))
+REPO_CACHE_MAX_BYTES = int(os.getenv("REPO_CACHE_MAX_BYTES", 10 * 1024 ** 3))
+GIT_TIMEOUT = int(os.getenv("REPO_CACHE_GIT_TIMEOUT", 600))
+
+
+def _git(*args, cwd: Optional[str] = None, timeout: int = GIT_TIMEOUT) -> subprocess.CompletedProcess:
+    try:
+        return subprocess.run(["git", *args], cwd=cwd, check=True, timeout=timeout,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"git {args[0]} failed: {e.stderr.decode(errors='replace')}")
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _mirror_size(mirror: str) -> int:
+    """Bytes used by a mirror's objects, from `git count-objects` rather than a walk of the tree."""
+    sizes = dict(line.split(": ", 1) for line in
+                 _git("count-objects", "-v", cwd=mirror).stdout.decode().splitlines() if ": " in line)
+    return sum(int(sizes.get(field, 0)) for field in ("size", "size-pack", "size-garbage")) * 1024
+
+
+class RepoMirrorCache:
+    """Local bare mirrors of remote repositories, keyed by repo URL.
+
+    The first checkout of a repo clones a mirror; later ones only run an
+    incremental `git fetch` and add a detached `git worktree`, so objects are
+    shared and nothing is downloaded twice. A per-repo file lock serialises
+    fetches: scans that wait on an in-progress fetch reuse its result.
+    Mirrors are evicted least-recently-used first once the cache exceeds
+    `max_bytes`, skipping any that are locked or have live worktrees. Each
+    mirror's size is recorded when it is fetched, so eviction never has to
+    walk the cache.
+    """
+
+    def __init__(self, root: str = REPO_CACHE_DIR, max_bytes: int = REPO_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.mirrors_dir = os.path.join(root, "mirrors")
+        self.locks_dir = os.path.join(root, "locks")
+        self.worktrees_dir = os.path.join(root, "worktrees")
+        for path in (self.mirrors_dir, self.locks_dir, self.worktrees_dir):
+            os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def _key(repo_url: str) -> str:
+        normalized = repo_url.strip().rstrip("/")
+        if normalized.endswith(".git"):
+            normalized = normalized[:-4]
+        return hashlib.sha256(normalized.lower().encode()).hexdigest()[:24]
+
+    def mirror_path(self, repo_url: str) -> str:
+        return os.path.join(self.mirrors_dir, f"{self._key(repo_url)}.git")
+
+    @contextmanager
+    def _lock(self, key: str, blocking: bool = True):
+        with open(os.path.join(self.locks_dir, f"{key}.lock"), "a+") as fh:
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            try:
+                fcntl.flock(fh, flags)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def update(self, repo_url: str) -> str:
+        """Clone or incrementally fetch the mirror for `repo_url` and return its path."""
+        wait_started = time.time()
+        with self._lock(self._key(repo_url)):
+            mirror = self._update_locked(repo_url, wait_started)
+        self._evict(keep=self._key(repo_url))
+        return mirror
+
+    def checkout(self, repo_url: str, branch: str, prefix: str = "arxio-", commit: Optional[str] = None) -> str:
+        """Return a fresh working tree of `branch` (or of `commit`, if given), backed by the cached mirror."""
+        workdir = tempfile.mkdtemp(prefix=prefix, dir=self.worktrees_dir)
+        os.rmdir(workdir)  # git worktree add wants to create the directory itself
+        wait_started = time.time()
+        # Fetch and worktree registration happen under one lock, so the mirror
+        # cannot be evicted by another process in between
+        with self._lock(self._key(repo_url)):
+            mirror = self._update_locked(repo_url, wait_started)
+            _git("worktree", "add", "--detach", workdir, commit or f"refs/heads/{branch}", cwd=mirror)
+        self._evict(keep=self._key(repo_url))
+        return workdir
+
+    def _update_locked(self, repo_url: str, wait_started: float) -> str:
+        mirror = self.mirror_path(repo_url)
+        stamp = os.path.join(mirror, "arxio-last-fetch")
+        if os.path.isdir(mirror):
+            # Another scan finished a fetch while we were waiting for the lock
+            if os.path.exists(stamp) and os.path.getmtime(stamp) >= wait_started:
+                logger.info(f"Reusing concurrent fetch of {repo_url}")
+            else:
+                logger.info(f"Fetching updates for cached mirror of {repo_url}")
+                _git("fetch", "--prune", "--tags", "origin", cwd=mirror)
+                self._record_size(mirror)
+        else:
+            logger.info(f"Creating mirror of {repo_url}")
+            partial = f"{mirror}.partial"
+            shutil.rmtree(partial, ignore_errors=True)
+            _git("clone", "--mirror", repo_url, partial)
+            os.rename(partial, mirror)
+            self._record_size(mirror)
+        # Also serves as the last-used time for LRU eviction
+        with open(stamp, "w") as fh:
+            fh.write(repo_url)
+        return mirror
+
+    @staticmethod
+    def _record_size(mirror: str) -> int:
+        try:
+            size = _mirror_size(mirror)
+        except (RuntimeError, ValueError, subprocess.SubprocessError):
+            size = _dir_size(mirror)
+        with open(os.path.join(mirror, "arxio-size"), "w") as fh:
+            fh.write(str(size))
+        return size
+
+    @classmethod
+    def _recorded_size(cls, mirror: str) -> int:
+        try:
+            with open(os.path.join(mirror, "arxio-size")) as fh:
+                return int(fh.read())
+        except (OSError, ValueError):
+            # Mirror from before sizes were recorded
+            return cls._record_size(mirror)
+
+    def release(self, workdir: str):
+        """Remove a working tree created by `checkout`."""
+        try:
+            mirror = _git("rev-parse", "--git-common-dir", cwd=workdir).stdout.decode().strip()
+            mirror = os.path.abspath(os.path.join(workdir, mirror))
+            key = os.path.basename(mirror)[:-len(".git")]
+            with self._lock(key):
+                _git("worktree", "remove", "--force", workdir, cwd=mirror)
+        except (RuntimeError, OSError, subprocess.SubprocessError) as e:
+            logger.warning(f"Failed to remove worktree {workdir}: {e}")
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    def _evict(self, keep: str):
+        mirrors = []
+        for name in os.listdir(self.mirrors_dir):
+            path = os.path.join(self.mirrors_dir, name)
+            if not name.endswith(".git") or not os.path.isdir(path):
+                continue
+            stamp = os.path.join(path, "arxio-last-fetch")
+            last_used = os.path.getmtime(stamp) if os.path.exists(stamp) else 0
+            mirrors.append((last_used, name[:-len(".git")], path, self._recorded_size(path)))
+
+        total = sum(size for *_, size in mirrors)
+        for _, key, path, size in sorted(mirrors):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            with self._lock(key, blocking=False) as locked:
+                if not locked:
+                    continue
+                _git("worktree", "prune", cwd=path)
+                live_worktrees = os.path.join(path, "worktrees")
+                if os.path.isdir(live_worktrees) and os.listdir(live_worktrees):
+                    continue  # still checked out by a running scan
+                logger.info(f"Evicting cached mirror {path} ({size} bytes)")
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+
+
+_default_cache = None
+
+
+def get_repo_cache() -> RepoMirrorCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = RepoMirrorCache()
+    return _default_cache
@@ -0,0 +1,217 @@
+import fnmatch, hashlib, logging, os, re, stat
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("repo-index")
+
+LANGUAGE_EXTENSIONS = {
+    ".py": "python",
+    ".js": "javascript",
+    ".jsx": "javascript",
+    ".ts": "typescript",
+    ".tsx": "typescript",
+    ".go": "go",
+    ".java": "java",
+    ".php": "php",
+    ".rb": "ruby",
+    ".c": "c",
+    ".cpp": "cpp",
+    ".cs": "csharp",
+    ".swift": "swift",
+    ".kt": "kotlin",
+}
+
+# Never scanned: VCS metadata, dependencies and vendored code, virtualenvs and tool caches
+DEFAULT_EXCLUDES = {
+    ".git", ".hg", ".svn", "node_modules", "bower_components", "jspm_packages", "vendor", "third_party",
+    "__pycache__", ".venv", "venv", ".tox", ".nox", ".mypy_cache", ".pytest_cache", ".gradle", ".idea",
+}
+REPO_INDEX_EXCLUDES = DEFAULT_EXCLUDES | {
+    name.strip() for name in os.getenv("REPO_INDEX_EXCLUDES", "").split(",") if name.strip()
+}
+# Files larger than this are left out (minified bundles, generated code, data dumps)
+REPO_INDEX_MAX_FILE_BYTES = int(os.getenv("REPO_INDEX_MAX_FILE_BYTES", 5 * 1024 * 1024))
+
+
+class _IgnoreRule:
+    __slots__ = ("regex", "negate", "dir_only", "anchored")
+
+    def __init__(self, pattern: str):
+        self.negate = pattern.startswith("!")
+        if self.negate:
+            pattern = pattern[1:]
+        elif pattern.startswith("\\"):
+            pattern = pattern[1:]
+        self.dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        # A slash anywhere but the end anchors the pattern to the .gitignore's directory
+        self.anchored = "/" in pattern
+        pattern = pattern.lstrip("/")
+        prefix = ""
+        if pattern.startswith("**/"):
+            # Leading **/ matches in any directory
+            pattern, prefix = pattern[3:], "(?:.*/)?"
+        self.regex = re.compile(prefix + self._translate(pattern))
+
+    @staticmethod
+    def _translate(pattern: str) -> str:
+        out, i = [], 0
+        while i < len(pattern):
+            if pattern.startswith("/**/", i):
+                out.append("(?:/|/.*/)")
+                i += 4
+            elif pattern.startswith("/**", i) and i + 3 == len(pattern):
+                out.append("/.*")
+                i += 3
+            elif pattern[i] == "*":
+                out.append("[^/]*")
+                i += 1
+            elif pattern[i] == "?":
+                out.append("[^/]")
+                i += 1
+            elif pattern[i] == "[":
+                end = pattern.find("]", i + 1)
+                if end == -1:
+                    out.append(re.escape("["))
+                    i += 1
+                else:
+                    # fnmatch already handles [!...] and escaping inside classes
+                    out.append(fnmatch.translate(pattern[i:end + 1])[4:-3])
+                    i = end + 1
+            else:
+                out.append(re.escape(pattern[i]))
+                i += 1
+        return "".join(out) + r"\Z"
+
+    def matches(self, rel_path: str, name: str, is_dir: bool) -> bool:
+        if self.dir_only and not is_dir:
+            return False
+        return bool(self.regex.match(rel_path if self.anchored else name))
+
+
+class _Ignore:
+    """The .gitignore rules in effect for one directory (its own plus its parents')."""
+
+    def __init__(self, parent: Optional["_Ignore"], base: str, rules: List[_IgnoreRule]):
+        self.parent = parent
+        self.base = base
+        self.rules = rules
+
+    def ignored(self, rel_path: str, name: str, is_dir: bool) -> bool:
+        # The deepest .gitignore wins, and within a file the last matching rule wins
+        node = self
+        while node is not None:
+            local = rel_path[len(node.base) + 1:] if node.base else rel_path
+            for rule in reversed(node.rules):
+                if rule.matches(local, name, is_dir):
+                    return not rule.negate
+            node = node.parent
+        return False
+
+    @staticmethod
+    def load(parent: Optional["_Ignore"], abs_dir: str, rel_dir: str) -> Optional["_Ignore"]:
+        try:
+            with open(os.path.join(abs_dir, ".gitignore"), errors="replace") as fh:
+                lines = fh.read().splitlines()
+        except OSError:
+            return parent
+        rules = []
+        for line in lines:
+            line = line.rstrip()
+            if line and not line.startswith("#"):
+                rules.append(_IgnoreRule(line))
+        return _Ignore(parent, rel_dir, rules) if rules else parent
+
+
+class FileEntry:
+    __slots__ = ("path", "size", "language", "_hash", "_abs_path")
+
+    def __init__(self, path: str, abs_path: str, size: int, language: Optional[str]):
+        self.path = path
+        self._abs_path = abs_path
+        self.size = size
+        self.language = language
+        self._hash = None
+
+    @property
+    def sha256(self) -> str:
+        """Content hash, read on first use, so indexing itself never opens files."""
+        if self._hash is None:
+            digest = hashlib.sha256()
+            with open(self._abs_path, "rb") as fh:
+                for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+                    digest.update(chunk)
+            self._hash = digest.hexdigest()
+        return self._hash
+
+
+class RepoIndex:
+    """Manifest of the files in a checkout that are worth scanning.
+
+    Built in one os.scandir pass that skips DEFAULT_EXCLUDES, anything the
+    repository's .gitignore files ignore, symlinks and oversized files.
+    Entries carry path (relative, '/'-separated), size and language; the
+    content hash is computed lazily, so callers that only need languages or
+    file lists never read file contents, and callers that need hashes (the
+    finding cache) read each file at most once.
+    """
+
+    def __init__(self, root: str, files: Dict[str, FileEntry], skipped_dirs: List[str]):
+        self.root = root
+        self.files = files
+        self.skipped_dirs = skipped_dirs
+        self.languages = sorted({entry.language for entry in files.values() if entry.language})
+
+    @classmethod
+    def build(cls, root: str, excludes: Iterable[str] = REPO_INDEX_EXCLUDES,
+              max_file_bytes: int = REPO_INDEX_MAX_FILE_BYTES) -> "RepoIndex":
+        root = os.path.abspath(root)
+        excludes = set(excludes)
+        files: Dict[str, FileEntry] = {}
+        skipped_dirs: List[str] = []
+        stack: List[Tuple[str, str, Optional[_Ignore]]] = [(root, "", None)]
+        while stack:
+            abs_dir, rel_dir, ignore = stack.pop()
+            ignore = _Ignore.load(ignore, abs_dir, rel_dir)
+            try:
+                entries = list(os.scandir(abs_dir))
+            except OSError as e:
+                logger.warning(f"Cannot index {abs_dir}: {e}")
+                continue
+            for entry in entries:
+                rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                try:
+                    if entry.is_symlink():
+                        continue
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    if is_dir and entry.name in excludes:
+                        skipped_dirs.append(rel_path)
+                        continue
+                    if ignore is not None and ignore.ignored(rel_path, entry.name, is_dir):
+                        continue
+                    if is_dir:
+                        stack.append((entry.path, rel_path, ignore))
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                if not stat.S_ISREG(st.st_mode) or st.st_size > max_file_bytes:
+                    continue
+                language = LANGUAGE_EXTENSIONS.get(os.path.splitext(entry.name)[1])
+                files[rel_path] = FileEntry(rel_path, entry.path, st.st_size, language)
+        return cls(root, files, skipped_dirs)
+
+    def paths(self, extensions: Optional[Iterable[str]] = None) -> List[str]:
+        """Relative paths, optionally only those with one of `extensions`."""
+        if extensions is None:
+            return sorted(self.files)
+        extensions = set(extensions)
+        return sorted(path for path in self.files if os.path.splitext(path)[1] in extensions)
+
+    def hash(self, rel_path: str) -> str:
+        return self.files[rel_path].sha256
+
+    def __contains__(self, rel_path: str) -> bool:
+        return rel_path in self.files
+
+    def __len__(self) -> int:
+        return len(self.files)
@@ -1,25 +1,109 @@
-import json, subprocess, pathlib, tempfile
-from .parsers import semgrep_to_findings, trufflehog_to_findings, osv_to_findings
+import subprocess, os, functools
+from datetime import date
+from models import Finding, Severity
+from .parsers import semgrep_to_findings, semgrep_error_paths, trufflehog_to_findings, osv_to_findings
+from .finding_cache import get_finding_cache
+from .repo_index import RepoIndex, REPO_INDEX_EXCLUDES
+from .process_stream import ProcessStream
+from .semgrep_rules import get_rule_store
+from .fingerprints import FingerprintIndex
+
+SEMGREP_RULESET = "p/owasp-top-ten"
+# Files semgrep is pointed at when only cache misses are rescanned
+SEMGREP_EXTENSIONS = {
+    ".py", ".js", ".jsx", ".ts", ".tsx", ".go", ".java", ".php", ".rb", ".cs", ".kt", ".scala",
+    ".c", ".cpp", ".h", ".swift", ".rs", ".html", ".yaml", ".yml", ".json", ".tf", ".sh",
+}
+SEMGREP_CHUNK = 1000
+# semgrep exits 0 (or 1 with --error) when the scan completed; anything else is a failed run
+SEMGREP_OK_EXIT = (0, 1)
+_CACHED_FIELDS = ("rule_id", "title", "description", "severity", "line_start", "line_end", "url")
+
+@functools.lru_cache(maxsize=None)
+def _semgrep_version() -> str:
+    return subprocess.run(["semgrep", "--version"], stdout=subprocess.PIPE, text=True).stdout.strip()
+
+def _semgrep_rules():
+    """Rule files and their version: the bundle's common rules, or the registry ruleset if none is installed."""
+    bundle = get_rule_store().current()
+    if bundle:
+        return bundle.select([])
+    # Fetched by semgrep at scan time and may change, so cached results are only trusted for a day
+    return [SEMGREP_RULESET], f"{SEMGREP_RULESET}:{date.today().isoformat()}"
+
+def _run_semgrep(targets, rules, ruleset, extra_args=(), failed=None):
+    """Findings for `targets`; paths that were not fully analysed are added to `failed`.
+
+    A target is failed when semgrep reported an error for it, or when its
+    chunk's run did not complete. Findings are still reported either way.
+    """
+    config = [arg for path in rules for arg in ("--config", path)] + list(extra_args)
+    for i in range(0, len(targets), SEMGREP_CHUNK):
+        chunk = targets[i:i + SEMGREP_CHUNK]
+        cmd = ["semgrep", *config, "--json", "--metrics=off", "--disable-version-check", *chunk]
+        errors = []
+        with ProcessStream(cmd) as proc:
+            for finding in semgrep_to_findings(proc.stdout, errors):
+                finding.rule_version = ruleset
+                yield finding
+        if failed is not None:
+            if proc.returncode not in SEMGREP_OK_EXIT:
+                failed.update(os.path.normpath(path) for path in chunk)
+            for error in errors:
+                failed.update(os.path.normpath(path) for path in semgrep_error_paths(error))
+
+def _semgrep_with_cache(repo_path: str):
+    cache = get_finding_cache()
+    rules, ruleset = _semgrep_rules()
+    version = _semgrep_version()
+
+    index = RepoIndex.build(repo_path)
+    keys = {}
+    # Files outside SEMGREP_EXTENSIONS are not cached and are scanned on every run
+    uncached = []
+    for rel_path in index.paths():
+        path = os.path.normpath(os.path.join(repo_path, rel_path))
+        if os.path.splitext(rel_path)[1] in SEMGREP_EXTENSIONS:
+            keys[path] = cache.make_key("semgrep", version, ruleset, index.hash(rel_path))
+        else:
+            uncached.append(path)
+
+    hits = cache.get_many(keys.values())
+    misses = [path for path, key in keys.items() if key not in hits]
+    for path, key in keys.items():
+        for row in hits.get(key, []):
+            yield Finding(**{**row, "severity": Severity(row["severity"])}, file_path=path, rule_version=ruleset)
+
+    if not misses and not uncached:
+        return
+    if len(misses) == len(keys):
+        # Cold cache: scan the whole tree as before
+        targets = [repo_path]
+        extra_args = [arg for name in sorted(REPO_INDEX_EXCLUDES) for arg in ("--exclude", name)]
+    else:
+        targets, extra_args = misses + uncached, []
+    fresh = {path: [] for path in misses}
+    failed = set()
+    for finding in _run_semgrep(targets, rules, ruleset, extra_args, failed):
+        path = os.path.normpath(finding.file_path or "")
+        if path in fresh:
+            row = {field: getattr(finding, field) for field in _CACHED_FIELDS}
+            fresh[path].append({**row, "severity": finding.severity.value})
+        yield finding
+    if os.path.normpath(repo_path) in failed:
+        return
+    # A file semgrep did not fully analyse must not be cached as clean
+    cache.put_many({keys[path]: rows for path, rows in fresh.items() if path not in failed})
 
 def run_sast(repo_path: str):
-    outdir = tempfile.mkdtemp(prefix="sast-")
-    semgrep_json = pathlib.Path(outdir, "semgrep.json")
-    subprocess.run(
-        ["semgrep", "--config", "p/owasp-top-ten", "--json", "-o", str(semgrep_json), repo_path],
-        check=False)      # we tolerate rule errors
-    yield from semgrep_to_findings(semgrep_json)
-
-    th_json = pathlib.Path(outdir, "secrets.json")
-    subprocess.run(
-        ["trufflehog", "filesystem", "--json", repo_path], 
-        stdout=open(th_json, "w")
-    )
-    yield from trufflehog_to_findings(th_json)
-
-    osv_json = pathlib.Path(outdir, "deps.json")
-    subprocess.run(
-        ["osv-scanner", "--lockfile", pathlib.Path(repo_path, "package-lock.json")],
-        stdout=open(osv_json, "w"), 
-        check=False
-    )
-    yield from osv_to_findings(osv_json) 
\ No newline at end of file
+    # A secret flagged by both semgrep and trufflehog is reported once
+    fingerprints = FingerprintIndex(repo_path)
+    yield from fingerprints.unique(_semgrep_with_cache(repo_path), "semgrep")
+
+    with ProcessStream(["trufflehog", "filesystem", "--json", repo_path]) as proc:
+        yield from fingerprints.unique(trufflehog_to_findings(proc.stdout), "trufflehog")
+
+    lockfile = os.path.join(repo_path, "package-lock.json")
+    if os.path.exists(lockfile):
+        with ProcessStream(["osv-scanner", "--format", "json", "--lockfile", lockfile]) as proc:
+            yield from osv_to_findings(proc.stdout)
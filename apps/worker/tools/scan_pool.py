@@ -0,0 +1,221 @@
+import asyncio, logging, multiprocessing, os, queue, resource, signal, threading, time, traceback
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger("scan-pool")
+
+# Executors are replaced after this many scans, so leaks in scanners or tools don't accumulate
+SCAN_EXECUTOR_MAX_JOBS = int(os.getenv("SCAN_EXECUTOR_MAX_JOBS", 20))
+SCAN_EXECUTOR_MEMORY_MB = int(os.getenv("SCAN_EXECUTOR_MEMORY_MB", 4096)) or None
+SCAN_EXECUTOR_CPU_SECONDS = int(os.getenv("SCAN_EXECUTOR_CPU_SECONDS", 3600)) or None
+# Optional delegated cgroup v2 directory. When set, each executor gets a child cgroup whose
+# memory.max caps the executor together with every tool it starts.
+SCAN_EXECUTOR_CGROUP = os.getenv("SCAN_EXECUTOR_CGROUP")
+
+
+class ScanTimeout(TimeoutError):
+    """The scan overran its timeout and its process tree was killed."""
+
+
+class ScanExecutorError(RuntimeError):
+    """The scan raised, or its executor process died (e.g. killed for exceeding a resource limit)."""
+
+
+def _executor_main(conn, memory_mb: Optional[int], cpu_seconds: Optional[int], max_jobs: int,
+                   initializer: Optional[Callable[..., Any]], initargs: tuple):
+    # Own process group, so the executor and every tool it spawns can be killed together
+    os.setsid()
+    if memory_mb:
+        # RLIMIT_DATA rather than RLIMIT_AS: it is inherited by the tools, and node/V8
+        # reserves far more address space than it ever touches
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_DATA, (limit, limit))
+    if initializer:
+        # Runs while the executor is idle in the pool, so warm-up cost is off the scan's clock
+        try:
+            initializer(*initargs)
+        except Exception:
+            logger.warning(f"Executor initializer failed:\n{traceback.format_exc()}")
+
+    for _ in range(max_jobs):
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        fn, args, with_progress = job
+
+        if cpu_seconds:
+            # RLIMIT_CPU counts the process lifetime, so the budget is re-armed per job
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            soft = int(usage.ru_utime + usage.ru_stime) + cpu_seconds
+            resource.setrlimit(resource.RLIMIT_CPU, (soft, resource.getrlimit(resource.RLIMIT_CPU)[1]))
+
+        if with_progress:
+            args = (*args, lambda data: conn.send(("progress", data)))
+        try:
+            if asyncio.iscoroutinefunction(fn):
+                result = asyncio.run(fn(*args))
+            else:
+                result = fn(*args)
+            conn.send(("result", result))
+        except BaseException as e:
+            conn.send(("error", f"{type(e).__name__}: {e}\n{traceback.format_exc()}"))
+
+
+class _Executor:
+    def __init__(self, ctx, memory_mb, cpu_seconds, max_jobs, initializer, initargs):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_executor_main, args=(child_conn, memory_mb, cpu_seconds, max_jobs, initializer, initargs),
+            name="scan-executor", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+        self.cgroup = None
+
+    def kill_tree(self):
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            # Not yet in its own group, or already gone
+            if self.process.is_alive():
+                self.process.kill()
+        self.process.join(5)
+        self.conn.close()
+
+
+class ScanProcessPool:
+    """Pre-started executor processes that run scans in isolation from the worker.
+
+    A scan that leaks memory, burns CPU or hangs only takes down its own
+    executor: each one runs in its own process group under RLIMIT_DATA /
+    RLIMIT_CPU caps (and a cgroup v2 memory.max when SCAN_EXECUTOR_CGROUP is
+    set). A scan that overruns its timeout has its whole process tree killed.
+    Executors are replaced after `max_jobs` scans or after any failure.
+
+    `initializer(*initargs)` runs once in every executor as soon as it starts
+    (e.g. to discover tools and fetch rules), before it takes its first scan.
+
+    `run` keeps the scanners' `progress_callback` contract: updates sent from
+    the executor over a pipe are delivered to the callback in the calling
+    process.
+    """
+
+    def __init__(self, size: int, max_jobs: int = SCAN_EXECUTOR_MAX_JOBS,
+                 memory_mb: Optional[int] = SCAN_EXECUTOR_MEMORY_MB,
+                 cpu_seconds: Optional[int] = SCAN_EXECUTOR_CPU_SECONDS,
+                 cgroup_root: Optional[str] = SCAN_EXECUTOR_CGROUP,
+                 initializer: Optional[Callable[..., Any]] = None, initargs: tuple = ()):
+        # spawn: executors must not inherit the worker's threads and open connections
+        self._ctx = multiprocessing.get_context("spawn")
+        self.max_jobs = max_jobs
+        self.memory_mb = memory_mb
+        self.cpu_seconds = cpu_seconds
+        self.cgroup_root = cgroup_root
+        self.initializer = initializer
+        self.initargs = initargs
+        self._idle: "queue.Queue[_Executor]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._executors = set()
+        self._closed = False
+        for _ in range(size):
+            self._idle.put(self._spawn())
+
+    def run(self, fn: Callable[..., Any], *args,
+            progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+            timeout: Optional[float] = None) -> Any:
+        """Run `fn(*args[, progress_callback])` on an idle executor and return its result.
+
+        `fn` must be a module-level function (coroutine functions are run with
+        asyncio.run). Blocks until an executor is free.
+        """
+        executor = self._idle.get()
+        healthy = False
+        try:
+            try:
+                executor.conn.send((fn, args, progress_callback is not None))
+            except OSError:
+                raise ScanExecutorError(self._describe_exit(executor.process.exitcode))
+            executor.jobs += 1
+            deadline = time.monotonic() + timeout if timeout else None
+            while True:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise ScanTimeout(f"scan exceeded {timeout} seconds")
+                if not executor.conn.poll(remaining):
+                    continue
+                try:
+                    kind, payload = executor.conn.recv()
+                except (EOFError, OSError):
+                    executor.process.join(5)
+                    raise ScanExecutorError(self._describe_exit(executor.process.exitcode))
+                if kind == "progress":
+                    if progress_callback:
+                        try:
+                            progress_callback(payload)
+                        except Exception as e:
+                            logger.error(f"Progress callback failed: {e}")
+                    continue
+                healthy = True
+                if kind == "error":
+                    raise ScanExecutorError(payload)
+                return payload
+        finally:
+            self._recycle(executor, healthy)
+
+    def close(self):
+        """Stop all executors, killing any scan still running."""
+        with self._lock:
+            self._closed = True
+            executors = list(self._executors)
+        for executor in executors:
+            self._retire(executor)
+
+    def _spawn(self) -> _Executor:
+        executor = _Executor(self._ctx, self.memory_mb, self.cpu_seconds, self.max_jobs,
+                             self.initializer, self.initargs)
+        if self.cgroup_root and self.memory_mb:
+            self._attach_cgroup(executor)
+        with self._lock:
+            self._executors.add(executor)
+        return executor
+
+    def _recycle(self, executor: _Executor, healthy: bool):
+        if healthy and executor.jobs < self.max_jobs and not self._closed:
+            self._idle.put(executor)
+            return
+        # Spawning takes a moment (the child imports the scanners); don't hold up the caller
+        self._retire(executor)
+        if not self._closed:
+            threading.Thread(target=lambda: self._idle.put(self._spawn()), daemon=True).start()
+
+    def _retire(self, executor: _Executor):
+        executor.kill_tree()
+        with self._lock:
+            self._executors.discard(executor)
+        if executor.cgroup:
+            try:
+                os.rmdir(executor.cgroup)
+            except OSError as e:
+                logger.warning(f"Failed to remove cgroup {executor.cgroup}: {e}")
+
+    def _attach_cgroup(self, executor: _Executor):
+        path = os.path.join(self.cgroup_root, f"scan-executor-{executor.process.pid}")
+        try:
+            os.makedirs(path, exist_ok=True)
+            with open(os.path.join(path, "memory.max"), "w") as fh:
+                fh.write(str(self.memory_mb * 1024 * 1024))
+            with open(os.path.join(path, "cgroup.procs"), "w") as fh:
+                fh.write(str(executor.process.pid))
+            executor.cgroup = path
+        except OSError as e:
+            logger.warning(f"Failed to place scan executor in cgroup {path}, relying on rlimits: {e}")
+
+    @staticmethod
+    def _describe_exit(exitcode: Optional[int]) -> str:
+        if exitcode is not None and exitcode < 0:
+            sig = -exitcode
+            reason = {signal.SIGXCPU: "CPU time limit", signal.SIGKILL: "killed, likely out of memory"}.get(sig)
+            return f"scan executor died on signal {signal.Signals(sig).name}" + (f" ({reason})" if reason else "")
+        return f"scan executor exited unexpectedly (exit code {exitcode})"
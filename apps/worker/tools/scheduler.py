@@ -0,0 +1,217 @@
+import logging, threading, time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, Optional
+
+import redis
+
+logger = logging.getLogger("scan-scheduler")
+
+# Lower rank is dispatched first. A waiting job gains one rank every
+# PLAN_AGING_SECONDS, so lower plans are delayed during peaks but never starved.
+PLAN_RANK = {"enterprise": 0, "pro": 1, "free": 2}
+PLAN_AGING_SECONDS = 60
+# Each scan a tenant already runs on this node pushes its next job back by this much
+FAIR_SHARE_PENALTY_SECONDS = 30
+
+# Per-tenant leases live in a sorted set scored by their deadline. A running job
+# pushes its deadline forward every LEASE_TTL_SECONDS / 3, so a lease outlives a
+# long scan but one held by a crashed worker expires within LEASE_TTL_SECONDS.
+LEASE_TTL_SECONDS = 60
+_ACQUIRE_LEASE = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZSCORE', KEYS[1], ARGV[4]) then
+    return 1
+end
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[3]) then
+    redis.call('ZADD', KEYS[1], ARGV[2], ARGV[4])
+    redis.call('EXPIREAT', KEYS[1], math.ceil(tonumber(ARGV[2])) + 60)
+    return 1
+end
+return 0
+"""
+
+
+def _lease_key(user_id: str) -> str:
+    return f"scan:leases:{user_id}"
+
+
+def count_active_scans(redis_client: redis.Redis, user_id: str) -> int:
+    """Number of scans currently holding a lease for this tenant, across all workers."""
+    key = _lease_key(user_id)
+    redis_client.zremrangebyscore(key, "-inf", time.time())
+    return redis_client.zcard(key)
+
+
+class RequeueJob(Exception):
+    """Raised when a job cannot be admitted soon and should go back to the shared queue."""
+
+
+class _Ticket:
+    __slots__ = ("job_id", "user_id", "plan", "limits", "enqueued_at", "admitted")
+
+    def __init__(self, job_id, user_id, plan, limits):
+        self.job_id = job_id
+        self.user_id = user_id
+        self.plan = plan
+        self.limits = limits
+        self.enqueued_at = time.monotonic()
+        self.admitted = False
+
+
+class PlanScheduler:
+    """Admission control between job intake and scan execution.
+
+    Waiting jobs are kept in per-plan, per-tenant FIFO queues. At most
+    `max_running` scans run on this node; each one also holds a tenant lease
+    in Redis, which enforces the plan's `max_concurrent_scans` across replicas
+    and is renewed for as long as the scan runs.
+    """
+
+    def __init__(self, redis_client: redis.Redis, plan_limits: Dict[str, Dict[str, Any]],
+                 max_running: int, default_plan: str = "free", lease_ttl: int = LEASE_TTL_SECONDS):
+        self.redis = redis_client
+        self.lease_ttl = lease_ttl
+        self.plan_limits = plan_limits
+        self.max_running = max_running
+        self.default_plan = default_plan
+        self._acquire = redis_client.register_script(_ACQUIRE_LEASE)
+        self._cond = threading.Condition()
+        self._waiting: Dict[str, "OrderedDict[str, deque]"] = {plan: OrderedDict() for plan in plan_limits}
+        self._running = 0
+        self._running_by_user: Dict[str, int] = {}
+
+    def run(self, job_id: str, user_id: Optional[str], plan: Optional[str],
+            fn: Callable[..., Any], *args, **kwargs):
+        """Block until the job is admitted, run `fn`, then free its slot and lease.
+
+        Jobs without a user_id get plan priority but no tenant limit.
+        """
+        plan = plan if plan in self.plan_limits else self.default_plan
+        ticket = _Ticket(job_id, user_id, plan, self.plan_limits[plan])
+
+        with self._cond:
+            user_queue = self._waiting[plan].get(user_id) if user_id else None
+            # Anything beyond the tenant's limit can't run here anyway; hand it back
+            # so it doesn't occupy a prefetch slot that other tenants could use.
+            if user_queue is not None and len(user_queue) >= ticket.limits["max_concurrent_scans"]:
+                raise RequeueJob(f"tenant {user_id} already has {len(user_queue)} jobs waiting")
+            self._waiting[plan].setdefault(user_id, deque()).append(ticket)
+            try:
+                while not ticket.admitted:
+                    self._dispatch()
+                    if not ticket.admitted:
+                        # Leases held on other replicas are released without notifying us
+                        self._cond.wait(timeout=1)
+            except BaseException:
+                self._discard(ticket)
+                raise
+
+        waited = time.monotonic() - ticket.enqueued_at
+        logger.info(f"Admitted job {job_id} (plan={plan}, user={user_id}) after {waited:.1f}s in queue")
+
+        done = threading.Event()
+        if ticket.user_id:
+            threading.Thread(target=self._renew_lease, args=(ticket, done), daemon=True).start()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            done.set()
+            self._release(ticket)
+
+    def _dispatch(self):
+        # Called with the condition held
+        while self._running < self.max_running:
+            ticket = self._next_ticket()
+            if not ticket:
+                return
+            user_queue = self._waiting[ticket.plan][ticket.user_id]
+            user_queue.popleft()
+            if not user_queue:
+                del self._waiting[ticket.plan][ticket.user_id]
+            ticket.admitted = True
+            self._running += 1
+            self._running_by_user[ticket.user_id] = self._running_by_user.get(ticket.user_id, 0) + 1
+            self._cond.notify_all()
+
+    def _next_ticket(self) -> Optional[_Ticket]:
+        now = time.monotonic()
+        candidates = []
+        for plan, users in self._waiting.items():
+            for user_id, user_queue in users.items():
+                head = user_queue[0]
+                score = (PLAN_RANK.get(plan, len(PLAN_RANK)) * PLAN_AGING_SECONDS
+                         - (now - head.enqueued_at)
+                         + self._running_by_user.get(user_id, 0) * FAIR_SHARE_PENALTY_SECONDS)
+                candidates.append((score, head.enqueued_at, head))
+
+        for _, _, ticket in sorted(candidates, key=lambda c: (c[0], c[1])):
+            if self._acquire_lease(ticket):
+                return ticket
+        return None
+
+    def _acquire_lease(self, ticket: _Ticket) -> bool:
+        if not ticket.user_id:
+            return True
+        now = time.time()
+        try:
+            return bool(self._acquire(
+                keys=[_lease_key(ticket.user_id)],
+                args=[now, now + self.lease_ttl,
+                      ticket.limits["max_concurrent_scans"], ticket.job_id]))
+        except redis.RedisError as e:
+            # Without Redis the queue itself is down; don't block scans already in hand
+            logger.error(f"Failed to acquire tenant lease for {ticket.user_id}: {e}")
+            return True
+
+    def _renew_lease(self, ticket: _Ticket, done: threading.Event):
+        key = _lease_key(ticket.user_id)
+        while not done.wait(self.lease_ttl / 3):
+            deadline = time.time() + self.lease_ttl
+            try:
+                # XX: a lease that already expired may have been handed to another job
+                pipe = self.redis.pipeline()
+                pipe.zadd(key, {ticket.job_id: deadline}, xx=True, ch=True)
+                pipe.expireat(key, int(deadline) + 60)
+                renewed, _ = pipe.execute()
+                if not renewed:
+                    logger.warning(f"Tenant lease of job {ticket.job_id} expired while it was running")
+                    return
+            except redis.RedisError as e:
+                logger.error(f"Failed to renew tenant lease for {ticket.user_id}: {e}")
+
+    def _release(self, ticket: _Ticket):
+        self._release_lease(ticket)
+        with self._cond:
+            self._forget_running(ticket)
+            self._dispatch()
+            self._cond.notify_all()
+
+    def _discard(self, ticket: _Ticket):
+        # Called with the condition held, when a waiting thread is interrupted
+        if ticket.admitted:
+            self._release_lease(ticket)
+            self._forget_running(ticket)
+            self._dispatch()
+            return
+        users = self._waiting[ticket.plan]
+        user_queue = users.get(ticket.user_id)
+        if user_queue and ticket in user_queue:
+            user_queue.remove(ticket)
+            if not user_queue:
+                del users[ticket.user_id]
+
+    def _forget_running(self, ticket: _Ticket):
+        self._running -= 1
+        remaining = self._running_by_user.get(ticket.user_id, 1) - 1
+        if remaining:
+            self._running_by_user[ticket.user_id] = remaining
+        else:
+            self._running_by_user.pop(ticket.user_id, None)
+
+    def _release_lease(self, ticket: _Ticket):
+        if not ticket.user_id:
+            return
+        try:
+            self.redis.zrem(_lease_key(ticket.user_id), ticket.job_id)
+        except redis.RedisError as e:
+            logger.error(f"Failed to release tenant lease for {ticket.user_id}: {e}")
@@ -0,0 +1,230 @@
+import fcntl, hashlib, json, logging, os, shutil, tempfile, time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+logger = logging.getLogger("semgrep-rules")
+
+SEMGREP_REGISTRY_URL = os.getenv("SEMGREP_REGISTRY_URL", "https://semgrep.dev/c")
+# Where bundles are installed. In air-gapped clusters this is baked into the image or mounted.
+SEMGREP_BUNDLE_DIR = os.getenv("SEMGREP_BUNDLE_DIR", os.path.join(tempfile.gettempdir(), "arxio-semgrep-rules"))
+# Internal mirror serving manifest.json and the files it lists; the public registry is used when unset
+SEMGREP_BUNDLE_URL = os.getenv("SEMGREP_BUNDLE_URL")
+# Set to 0 where there is no network: only the installed bundle is used
+SEMGREP_BUNDLE_SYNC = os.getenv("SEMGREP_BUNDLE_SYNC", "1") == "1"
+# The installed bundle is re-synced once it is older than this
+SEMGREP_BUNDLE_MAX_AGE = int(os.getenv("SEMGREP_BUNDLE_MAX_AGE", 24 * 3600))
+SEMGREP_BUNDLE_KEEP = 3
+
+# Registry rulesets a bundle is built from: "common" applies to every scan, the rest per language
+SEMGREP_BUNDLE_RULESETS = {
+    "common": "p/owasp-top-ten",
+    "python": "p/python",
+    "javascript": "p/javascript",
+    "typescript": "p/typescript",
+    "go": "p/golang",
+    "java": "p/java",
+    "php": "p/php",
+    "ruby": "p/ruby",
+    "csharp": "p/csharp",
+    "kotlin": "p/kotlin",
+    "c": "p/c",
+}
+
+
+class RuleBundleError(Exception):
+    """A bundle could not be fetched, or its files don't match the manifest hashes."""
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class RuleBundle:
+    """One installed, hash-verified version of the semgrep rules."""
+
+    def __init__(self, root: str, manifest: Dict):
+        self.root = root
+        self.version: str = manifest["version"]
+        self.rulesets: Dict[str, Dict[str, str]] = manifest["rulesets"]
+
+    def select(self, languages: Iterable[str]) -> Tuple[List[str], str]:
+        """Rule files for a scan of `languages`, and the id that identifies that selection.
+
+        The id is "<bundle version>:<ruleset names>"; results cached under it
+        are invalidated when either the bundle or the selection changes.
+        """
+        names = [name for name in ("common", *sorted(set(languages))) if name in self.rulesets]
+        paths = [os.path.join(self.root, self.rulesets[name]["file"]) for name in names]
+        return paths, f"{self.version}:{'+'.join(names)}"
+
+
+class RuleBundleStore:
+    """Versioned semgrep rule bundles kept on local disk, so scans never fetch rules.
+
+    A bundle is a directory holding one YAML file per ruleset plus a
+    manifest.json with each file's sha256:
+
+        <root>/<version>/manifest.json
+        <root>/<version>/python.yml ...
+        <root>/current                  name of the active version
+
+    `sync` downloads a new bundle (from SEMGREP_BUNDLE_URL, or built from the
+    public registry), verifies it and switches `current` to it atomically;
+    older bundles are kept briefly for scans still using them. `current`
+    verifies the active bundle's hashes once per process.
+    """
+
+    def __init__(self, root: str = SEMGREP_BUNDLE_DIR, source_url: Optional[str] = SEMGREP_BUNDLE_URL):
+        self.root = root
+        self.source_url = source_url.rstrip("/") if source_url else None
+        self._verified: Dict[str, RuleBundle] = {}
+
+    def current(self) -> Optional[RuleBundle]:
+        try:
+            with open(os.path.join(self.root, "current")) as fh:
+                version = fh.read().strip()
+        except OSError:
+            return None
+        if version not in self._verified:
+            try:
+                self._verified[version] = self._load(version)
+            except (RuleBundleError, OSError, ValueError, KeyError) as e:
+                logger.error(f"Semgrep rule bundle {version} is unusable: {e}")
+                return None
+        return self._verified[version]
+
+    def ensure(self, max_age: int = SEMGREP_BUNDLE_MAX_AGE) -> Optional[RuleBundle]:
+        """The active bundle, synced first if there is none or it is older than `max_age`."""
+        if SEMGREP_BUNDLE_SYNC and self._age() > max_age:
+            try:
+                self.sync()
+            except (RuleBundleError, requests.RequestException, OSError) as e:
+                logger.warning(f"Semgrep rule bundle sync failed, keeping the installed bundle: {e}")
+        return self.current()
+
+    def sync(self) -> RuleBundle:
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, ".lock"), "a+") as lock:
+            # One sync per host; the others wait and pick up its result
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if self._age() <= SEMGREP_BUNDLE_MAX_AGE and self.current():
+                return self.current()
+
+            staging = tempfile.mkdtemp(prefix=".staging-", dir=self.root)
+            try:
+                manifest = self._download(staging)
+                version = manifest["version"]
+                target = os.path.join(self.root, version)
+                if os.path.isdir(target):
+                    shutil.rmtree(staging)
+                    os.utime(target)
+                else:
+                    os.rename(staging, target)
+            except BaseException:
+                shutil.rmtree(staging, ignore_errors=True)
+                raise
+            self._load(version)
+            self._set_current(version)
+            self._prune(keep={version})
+            logger.info(f"Semgrep rule bundle {version} is active")
+            return self.current()
+
+    def _download(self, staging: str) -> Dict:
+        rulesets = {}
+        if self.source_url:
+            response = requests.get(f"{self.source_url}/manifest.json", timeout=(5, 30))
+            response.raise_for_status()
+            manifest = response.json()
+            for value in (manifest["version"], *(entry["file"] for entry in manifest["rulesets"].values())):
+                # Both become paths under the bundle directory
+                if not value or os.path.basename(value) != value or value.startswith("."):
+                    raise RuleBundleError(f"invalid name in bundle manifest: {value!r}")
+            for name, entry in manifest["rulesets"].items():
+                self._fetch(f"{self.source_url}/{entry['file']}", os.path.join(staging, entry["file"]))
+                rulesets[name] = entry
+            version = manifest["version"]
+        else:
+            for name, config in SEMGREP_BUNDLE_RULESETS.items():
+                path = os.path.join(staging, f"{name}.yml")
+                self._fetch(f"{SEMGREP_REGISTRY_URL}/{config}", path)
+                rulesets[name] = {"file": f"{name}.yml", "sha256": _sha256(path), "source": config}
+            # Content-addressed, so an unchanged registry maps back onto the installed bundle
+            digest = hashlib.sha256(json.dumps(
+                {name: entry["sha256"] for name, entry in rulesets.items()}, sort_keys=True).encode())
+            version = f"registry-{digest.hexdigest()[:12]}"
+
+        manifest = {
+            "version": version,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "rulesets": rulesets,
+        }
+        with open(os.path.join(staging, "manifest.json"), "w") as fh:
+            json.dump(manifest, fh, indent=2)
+        self._verify(staging, manifest)
+        return manifest
+
+    @staticmethod
+    def _fetch(url: str, path: str):
+        response = requests.get(url, timeout=(5, 60))
+        response.raise_for_status()
+        with open(path, "wb") as fh:
+            fh.write(response.content)
+
+    def _load(self, version: str) -> RuleBundle:
+        root = os.path.join(self.root, version)
+        with open(os.path.join(root, "manifest.json")) as fh:
+            manifest = json.load(fh)
+        self._verify(root, manifest)
+        return RuleBundle(root, manifest)
+
+    @staticmethod
+    def _verify(root: str, manifest: Dict):
+        for name, entry in manifest["rulesets"].items():
+            path = os.path.join(root, entry["file"])
+            if not os.path.isfile(path):
+                raise RuleBundleError(f"ruleset {name} is missing ({entry['file']})")
+            if _sha256(path) != entry["sha256"]:
+                raise RuleBundleError(f"ruleset {name} does not match its sha256")
+
+    def _age(self) -> float:
+        try:
+            return time.time() - os.path.getmtime(os.path.join(self.root, "current"))
+        except OSError:
+            return float("inf")
+
+    def _set_current(self, version: str):
+        tmp_path = os.path.join(self.root, f".current.{os.getpid()}")
+        with open(tmp_path, "w") as fh:
+            fh.write(version)
+        os.replace(tmp_path, os.path.join(self.root, "current"))
+
+    def _prune(self, keep):
+        versions = sorted(
+            (name for name in os.listdir(self.root)
+             if not name.startswith(".") and os.path.isdir(os.path.join(self.root, name))),
+            key=lambda name: os.path.getmtime(os.path.join(self.root, name)), reverse=True)
+        for name in versions[SEMGREP_BUNDLE_KEEP:]:
+            if name not in keep:
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+
+_store: Optional[RuleBundleStore] = None
+
+
+def get_rule_store() -> RuleBundleStore:
+    global _store
+    if _store is None:
+        _store = RuleBundleStore()
+    return _store
+
+
+if __name__ == "__main__":
+    # Build or refresh the bundle on a connected host, e.g. when baking an image for an air-gapped cluster
+    logging.basicConfig(level=logging.INFO)
+    print(get_rule_store().sync().version)
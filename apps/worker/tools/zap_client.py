@@ -0,0 +1,258 @@
+import asyncio, contextlib, logging, os, re, uuid
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+
+logger = logging.getLogger("zap-client")
+
+# ZAP daemons (JSON API base URLs) shared by the workers; ZAP_API_URL alone means a single daemon
+ZAP_API_URLS = [
+    url.strip().rstrip("/")
+    for url in os.getenv("ZAP_API_URLS", os.getenv("ZAP_API_URL", "http://zap:8080/JSON")).split(",") if url.strip()
+]
+ZAP_API_KEY = os.getenv("ZAP_API_KEY")
+# Scans that may run on one daemon at a time, each in its own ZAP context
+ZAP_CONTEXTS_PER_DAEMON = int(os.getenv("ZAP_CONTEXTS_PER_DAEMON", 2))
+# A lease not renewed for this long (its worker died) frees the slot
+ZAP_LEASE_TTL = int(os.getenv("ZAP_LEASE_TTL", 120))
+# How long a scan waits for a free slot before failing
+ZAP_LEASE_WAIT = int(os.getenv("ZAP_LEASE_WAIT", 600))
+ZAP_CONNECTIONS = int(os.getenv("ZAP_CONNECTIONS", 8))
+# Alerts fetched per request; a big site has tens of thousands, far too many for one response
+ZAP_ALERTS_PAGE = int(os.getenv("ZAP_ALERTS_PAGE", 500))
+
+# Slot keys are only deleted or extended by their holder; a check then a write could
+# act on a slot that expired in between and was taken by another scan
+_RELEASE_SLOT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+_RENEW_SLOT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class ZapError(RuntimeError):
+    """ZAP rejected an API call, or no daemon became free in time."""
+
+
+class ZapClient:
+    """Async client for one ZAP daemon's JSON API.
+
+    Calls share an aiohttp session, so polling and paging reuse a few
+    keep-alive connections instead of opening one per request.
+    """
+
+    def __init__(self, base_url: str, session: aiohttp.ClientSession, api_key: Optional[str] = ZAP_API_KEY):
+        self.base_url = base_url.rstrip("/")
+        self.session = session
+        self.headers = {"X-ZAP-API-Key": api_key} if api_key else {}
+
+    async def call(self, component: str, kind: str, name: str, **params: Any) -> Dict[str, Any]:
+        """GET /<component>/<kind>/<name>/, e.g. call("spider", "view", "status", scanId=3)."""
+        query = {key: str(value).lower() if isinstance(value, bool) else str(value)
+                 for key, value in params.items() if value is not None}
+        url = f"{self.base_url}/{component}/{kind}/{name}/"
+        async with self.session.get(url, params=query, headers=self.headers) as response:
+            try:
+                data = await response.json(content_type=None)
+            except ValueError:
+                data = {}
+            if response.status != 200 or (isinstance(data, dict) and "code" in data and "message" in data):
+                message = data.get("message") if isinstance(data, dict) else None
+                raise ZapError(f"{component}/{kind}/{name} failed ({response.status}): {message or response.reason}")
+            return data
+
+    async def alert_pages(self, baseurl: str, start: int = 0,
+                          page_size: int = ZAP_ALERTS_PAGE) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Alerts for URLs under `baseurl` from offset `start`, as the pages ZAP returns them.
+
+        A caller that keeps an offset advances it by each page's length.
+        """
+        while True:
+            page = (await self.call("core", "view", "alerts", baseurl=baseurl, start=start, count=page_size))["alerts"]
+            if page:
+                yield page
+            if len(page) < page_size:
+                return
+            start += len(page)
+
+    async def iter_alerts(self, baseurl: str, start: int = 0, after_id: int = -1,
+                          page_size: int = ZAP_ALERTS_PAGE) -> AsyncIterator[Dict[str, Any]]:
+        """Alerts for URLs under `baseurl`, from offset `start`, fetched a page at a time.
+
+        Alerts with an id up to `after_id` (see alert_cursor) are skipped.
+        """
+        async for page in self.alert_pages(baseurl, start, page_size):
+            for alert in page:
+                if alert_id(alert) > after_id:
+                    yield alert
+
+    async def alert_cursor(self, baseurl: str) -> Tuple[int, int]:
+        """(number of alerts, highest alert id) recorded so far for `baseurl`.
+
+        Daemons are long-lived and keep the alerts of earlier scans of a
+        target; a scan reads only the alerts past this cursor.
+        """
+        count = int((await self.call("core", "view", "numberOfAlerts", baseurl=baseurl))["numberOfAlerts"])
+        if not count:
+            return 0, -1
+        # Alerts are listed in id order, so the last one has the highest id
+        last = (await self.call("core", "view", "alerts", baseurl=baseurl, start=count - 1, count=1))["alerts"]
+        return count, max((alert_id(alert) for alert in last), default=-1)
+
+
+def alert_id(alert: Dict[str, Any]) -> int:
+    alert_id = str(alert.get("id", ""))
+    # Alerts without a numeric id are never skipped
+    return int(alert_id) if alert_id.isdigit() else 1 << 62
+
+
+class ZapLease:
+    """A daemon slot held by one scan, with the ZAP context the scan runs in.
+
+    `alert_start` and `alert_id` are the target's alert cursor when the lease
+    was taken (ZapClient.alert_cursor): alerts up to it belong to earlier scans.
+    """
+    __slots__ = ("daemon", "client", "context_name", "context_id", "alert_start", "alert_id")
+
+    def __init__(self, daemon: str, client: ZapClient, context_name: str, context_id: str,
+                 alert_start: int = 0, alert_id: int = -1):
+        self.daemon = daemon
+        self.client = client
+        self.context_name = context_name
+        self.context_id = context_id
+        self.alert_start = alert_start
+        self.alert_id = alert_id
+
+
+class ZapPool:
+    """Leases ZAP daemons to scans, so several DAST scans can share them safely.
+
+    Each daemon has `slots` slots, kept as Redis keys (SET NX with a TTL that
+    the holder renews), so the limit holds across every worker process and
+    node, and a crashed worker's slot frees itself. A lease puts the scan in
+    its own ZAP context scoped to the target instead of resetting the
+    daemon's session, which would wipe the other scans running on it.
+    `namespace` prefixes the slot keys, for daemons whose URLs are only
+    unique per node (e.g. containers on 127.0.0.1). A daemon that was
+    started with its own API key has it under `api_key_key(daemon)`; the
+    others use ZAP_API_KEY. The Redis client is
+    synchronous; `lease` runs its calls in threads so the event loop, and
+    the other scans polling on it, never wait on Redis.
+    """
+
+    def __init__(self, redis_client, daemons: Optional[List[str]] = None,
+                 slots: int = ZAP_CONTEXTS_PER_DAEMON, lease_ttl: int = ZAP_LEASE_TTL, namespace: str = "zap"):
+        self.redis = redis_client
+        self.daemons = daemons or ZAP_API_URLS
+        self.slots = slots
+        self.lease_ttl = lease_ttl
+        self.namespace = namespace
+        self._release_slot = redis_client.register_script(_RELEASE_SLOT)
+        self._renew_slot = redis_client.register_script(_RENEW_SLOT)
+
+    def _slot_keys(self, daemon: str) -> List[str]:
+        return [f"{self.namespace}:slot:{daemon}:{i}" for i in range(self.slots)]
+
+    def api_key_key(self, daemon: str) -> str:
+        return f"{self.namespace}:api-key:{daemon}"
+
+    def api_key(self, daemon: str) -> Optional[str]:
+        return self.redis.get(self.api_key_key(daemon)) or ZAP_API_KEY
+
+    def hold(self, daemon: str, owner: str) -> bool:
+        """Take every slot of an idle daemon, e.g. to restart it; False if any scan holds one."""
+        taken = []
+        for key in self._slot_keys(daemon):
+            if not self.redis.set(key, owner, nx=True, ex=self.lease_ttl):
+                for key in taken:
+                    self._release(key, owner)
+                return False
+            taken.append(key)
+        return True
+
+    def unhold(self, daemon: str, owner: str):
+        for key in self._slot_keys(daemon):
+            self._release(key, owner)
+
+    def _claim(self, owner: str, daemons: List[str]) -> Optional[str]:
+        # Least busy daemon first
+        candidates = []
+        for daemon in daemons:
+            keys = self._slot_keys(daemon)
+            holders = self.redis.mget(keys)
+            candidates.append((sum(holder is not None for holder in holders), daemon, keys, holders))
+        for _, daemon, keys, holders in sorted(candidates, key=lambda item: item[0]):
+            for key, holder in zip(keys, holders):
+                if holder is None and self.redis.set(key, owner, nx=True, ex=self.lease_ttl):
+                    return key
+        return None
+
+    def _release(self, key: str, owner: str):
+        self._release_slot(keys=[key], args=[owner])
+
+    def renew(self, key: str, owner: str) -> bool:
+        """Extend a slot held by `owner`; False if it expired and may belong to someone else."""
+        return bool(self._renew_slot(keys=[key], args=[owner, self.lease_ttl]))
+
+    async def _renew(self, key: str, owner: str):
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            try:
+                if not await asyncio.to_thread(self.renew, key, owner):
+                    logger.warning(f"ZAP lease {key} was lost")
+                    return
+            except Exception as e:
+                logger.warning(f"Failed to renew ZAP lease {key}: {e}")
+
+    @contextlib.asynccontextmanager
+    async def lease(self, scan_id: str, target_url: str, wait: float = ZAP_LEASE_WAIT,
+                    daemons: Optional[List[str]] = None) -> AsyncIterator[ZapLease]:
+        """A slot on one of `daemons` (default: all of the pool's), waiting up to `wait` seconds for one."""
+        owner = f"{scan_id}:{uuid.uuid4().hex[:8]}"
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+        while True:
+            key = await asyncio.to_thread(self._claim, owner, daemons or self.daemons)
+            if key:
+                break
+            if loop.time() >= deadline:
+                raise ZapError(f"no ZAP daemon became free within {wait} seconds")
+            await asyncio.sleep(2)
+        daemon = key[len(f"{self.namespace}:slot:"):key.rindex(":")]
+        # Should this fail, the unrenewed slot frees itself after lease_ttl
+        api_key = await asyncio.to_thread(self.api_key, daemon)
+        renewer = asyncio.create_task(self._renew(key, owner))
+
+        context_name = f"arxio-{scan_id}"
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=ZAP_CONNECTIONS),
+            timeout=aiohttp.ClientTimeout(total=120, connect=10))
+        client = ZapClient(daemon, session, api_key)
+        try:
+            with contextlib.suppress(ZapError):
+                # Left over by a crashed attempt of the same scan
+                await client.call("context", "action", "removeContext", contextName=context_name)
+            created = await client.call("context", "action", "newContext", contextName=context_name)
+            origin = "{0.scheme}://{0.netloc}".format(urlsplit(target_url))
+            await client.call("context", "action", "includeInContext",
+                              contextName=context_name, regex=f"{re.escape(origin)}.*")
+            await client.call("context", "action", "setContextInScope", contextName=context_name, booleanInScope=True)
+            alert_start, alert_id = await client.alert_cursor(target_url)
+            logger.info(f"Scan {scan_id} leased ZAP daemon {daemon}")
+            yield ZapLease(daemon, client, context_name, str(created.get("contextId", "")), alert_start, alert_id)
+        finally:
+            renewer.cancel()
+            try:
+                await client.call("context", "action", "removeContext", contextName=context_name)
+            except (ZapError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Failed to remove ZAP context {context_name}: {e}")
+            await session.close()
+            await asyncio.to_thread(self._release, key, owner)
@@ -0,0 +1,194 @@
+import asyncio, contextlib, logging, os, re, secrets, socket, subprocess, time, uuid
+from typing import AsyncIterator, Dict, List, Optional
+
+import aiohttp
+import redis
+
+from .zap_client import ZapClient, ZapError, ZapLease, ZapPool
+
+logger = logging.getLogger("zap-containers")
+
+ZAP_IMAGE = os.getenv("ZAP_IMAGE", "owasp/zap2docker-stable")
+# Long-running ZAP daemons kept on this node, on consecutive ports from ZAP_CONTAINER_PORT
+ZAP_CONTAINERS = int(os.getenv("ZAP_CONTAINERS", 2))
+ZAP_CONTAINER_PORT = int(os.getenv("ZAP_CONTAINER_PORT", 8090))
+# A daemon is restarted after this many scans, or once its memory use passes ZAP_RECYCLE_MEMORY_MB
+ZAP_RECYCLE_SCANS = int(os.getenv("ZAP_RECYCLE_SCANS", 50))
+ZAP_RECYCLE_MEMORY_MB = int(os.getenv("ZAP_RECYCLE_MEMORY_MB", 3072))
+ZAP_STARTUP_TIMEOUT = int(os.getenv("ZAP_STARTUP_TIMEOUT", 180))
+# Health checks are skipped for daemons that passed one this recently
+ZAP_HEALTH_INTERVAL = int(os.getenv("ZAP_HEALTH_INTERVAL", 30))
+
+_MEMORY_RE = re.compile(r"^\s*([\d.]+)\s*([KMGT]?i?B)", re.IGNORECASE)
+_MEMORY_UNITS = {"b": 1 / 1024 ** 2, "kb": 1 / 1024, "kib": 1 / 1024, "mb": 1, "mib": 1,
+                 "gb": 1024, "gib": 1024, "tb": 1024 ** 2, "tib": 1024 ** 2}
+
+
+def _docker(*args, timeout: int = 60) -> subprocess.CompletedProcess:
+    return subprocess.run(["docker", *args], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          text=True, timeout=timeout, check=False)
+
+
+def _memory_mb(usage: str) -> Optional[float]:
+    """MiB from `docker stats` MemUsage, e.g. "812.5MiB / 15.5GiB"."""
+    match = _MEMORY_RE.match(usage)
+    if not match:
+        return None
+    return float(match.group(1)) * _MEMORY_UNITS[match.group(2).lower()]
+
+
+class ZapContainerPool:
+    """Long-running ZAP daemon containers on this node, leased to scans through a ZapPool.
+
+    Scans share warm daemons (each in its own ZAP context) instead of paying
+    JVM and ZAP startup for a one-shot container. Before a lease, daemons are
+    health-checked and dead ones restarted; after a scan, a daemon that has
+    served `recycle_scans` scans or grown past `recycle_memory_mb` is
+    restarted once no scan holds it. Restarts take every slot of the daemon
+    (ZapPool.hold), so other workers on the node never lease one mid-restart.
+    """
+
+    def __init__(self, redis_client, size: int = ZAP_CONTAINERS, base_port: int = ZAP_CONTAINER_PORT,
+                 image: str = ZAP_IMAGE, recycle_scans: int = ZAP_RECYCLE_SCANS,
+                 recycle_memory_mb: int = ZAP_RECYCLE_MEMORY_MB):
+        self.redis = redis_client
+        self.image = image
+        self.recycle_scans = recycle_scans
+        self.recycle_memory_mb = recycle_memory_mb
+        self.names: Dict[str, str] = {
+            f"http://127.0.0.1:{base_port + i}/JSON": f"arxio-zap-{i}" for i in range(size)
+        }
+        # Container URLs are only unique per node, so are the slot keys
+        self.namespace = f"zap:{socket.gethostname()}"
+        self.pool = ZapPool(redis_client, daemons=list(self.names), namespace=self.namespace)
+        self._checked: Dict[str, float] = {}
+
+    def _scans_key(self, daemon: str) -> str:
+        return f"{self.namespace}:scans:{daemon}"
+
+    def _start(self, daemon: str):
+        name, port = self.names[daemon], daemon.rsplit(":", 1)[1].split("/", 1)[0]
+        _docker("rm", "-f", name)
+        # Host network, like the one-shot baseline container, so targets on the node stay reachable.
+        # The API only listens on loopback, but anything on the node can reach that, so every
+        # container gets a fresh random API key; the workers read it through ZapPool.api_key
+        api_key = secrets.token_urlsafe(32)
+        self.redis.set(self.pool.api_key_key(daemon), api_key)
+        result = _docker("run", "-d", "--name", name, "--network=host", "--label", "arxio.zap-pool=1",
+                         self.image, "zap.sh", "-daemon", "-host", "127.0.0.1", "-port", port,
+                         "-config", f"api.key={api_key}", timeout=600)
+        if result.returncode != 0:
+            raise ZapError(f"cannot start ZAP container {name}: {result.stderr.strip()}")
+        self.redis.delete(self._scans_key(daemon))
+        logger.info(f"Started ZAP container {name} on port {port}")
+
+    async def _healthy(self, daemon: str, timeout: float = 10) -> bool:
+        try:
+            api_key = await asyncio.to_thread(self.redis.get, self.pool.api_key_key(daemon))
+            if not api_key:
+                # Not started by this pool with a key of its own (e.g. an older container without one)
+                return False
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+                await ZapClient(daemon, session, api_key).call("core", "view", "version")
+            return True
+        except (ZapError, aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+
+    async def _wait_healthy(self, daemon: str):
+        deadline = time.monotonic() + ZAP_STARTUP_TIMEOUT
+        while not await self._healthy(daemon):
+            if time.monotonic() >= deadline:
+                raise ZapError(f"ZAP container {self.names[daemon]} did not start within {ZAP_STARTUP_TIMEOUT} seconds")
+            await asyncio.sleep(2)
+        self._checked[daemon] = time.monotonic()
+
+    async def restart(self, daemon: str) -> bool:
+        """(Re)start a daemon's container if no scan is using it; False if it is busy."""
+        owner = f"restart:{uuid.uuid4().hex[:8]}"
+        if not await asyncio.to_thread(self.pool.hold, daemon, owner):
+            return False
+        renewer = asyncio.create_task(self._renew_hold(daemon, owner))
+        try:
+            await asyncio.to_thread(self._start, daemon)
+            await self._wait_healthy(daemon)
+            return True
+        finally:
+            renewer.cancel()
+            await asyncio.to_thread(self.pool.unhold, daemon, owner)
+
+    async def _renew_hold(self, daemon: str, owner: str):
+        # Startup can outlast the slot TTL
+        while True:
+            await asyncio.sleep(self.pool.lease_ttl / 3)
+            for key in self.pool._slot_keys(daemon):
+                await asyncio.to_thread(self.pool.renew, key, owner)
+
+    async def ensure(self) -> List[str]:
+        """Healthy daemons, restarting failed ones that are idle; all daemons if none is healthy yet."""
+        healthy = []
+        for daemon in self.names:
+            if time.monotonic() - self._checked.get(daemon, float("-inf")) < ZAP_HEALTH_INTERVAL:
+                healthy.append(daemon)
+                continue
+            if await self._healthy(daemon):
+                self._checked[daemon] = time.monotonic()
+                healthy.append(daemon)
+                continue
+            logger.warning(f"ZAP container {self.names[daemon]} is down, restarting it")
+            try:
+                if await self.restart(daemon):
+                    healthy.append(daemon)
+            except ZapError as e:
+                logger.error(str(e))
+        # Otherwise wait for a slot on a daemon that another worker is starting
+        return healthy or list(self.names)
+
+    def _memory_mb(self, daemon: str) -> Optional[float]:
+        result = _docker("stats", "--no-stream", "--format", "{{.MemUsage}}", self.names[daemon])
+        return _memory_mb(result.stdout) if result.returncode == 0 else None
+
+    async def scan_finished(self, daemon: str):
+        """Count a finished scan and recycle the daemon if it is due."""
+        scans = await asyncio.to_thread(self.redis.incr, self._scans_key(daemon))
+        reason = None
+        if scans >= self.recycle_scans:
+            reason = f"{scans} scans"
+        else:
+            memory = await asyncio.to_thread(self._memory_mb, daemon)
+            if memory is not None and memory > self.recycle_memory_mb:
+                reason = f"{memory:.0f} MiB in use"
+        if reason:
+            logger.info(f"Recycling ZAP container {self.names[daemon]} after {reason}")
+            # A busy daemon is left for the last scan running on it to recycle
+            try:
+                await self.restart(daemon)
+            except ZapError as e:
+                logger.error(str(e))
+
+    @contextlib.asynccontextmanager
+    async def lease(self, scan_id: str, target_url: str) -> AsyncIterator[ZapLease]:
+        """A ZAP context on a healthy daemon of this node, as ZapPool.lease."""
+        daemons = await self.ensure()
+        daemon = None
+        try:
+            async with self.pool.lease(scan_id, target_url, daemons=daemons) as zap:
+                daemon = zap.daemon
+                yield zap
+        finally:
+            if daemon is not None:
+                await self.scan_finished(daemon)
+
+    def shutdown(self):
+        for name in self.names.values():
+            _docker("rm", "-f", name)
+
+
+_default_pool = None
+
+
+def get_zap_containers() -> ZapContainerPool:
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = ZapContainerPool(
+            redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"), decode_responses=True))
+    return _default_pool